@@ -1,17 +1,23 @@
+import hmac
 import os
 import json
-from flask import Flask, render_template, request, jsonify, session
-from flask_session import Session
-from dotenv import load_dotenv
+import time
+from flask import Flask, render_template, request, jsonify, session, Response, stream_with_context, g, send_file
 import uuid
+from docaiapp.utils import metrics, profiler
+from docaiapp.utils.config import env_str, get_settings, require_dependencies
 from docaiapp.utils.service_provider import DocumentServiceProvider
-from docaiapp.utils.openai_service import get_completion
+from docaiapp.utils.session_store import get_session_interface
+from docaiapp.utils.openai_service import get_cached_completion, stream_cached_completion
+from docaiapp.utils.document_store import get_document_store
+from docaiapp.utils.prompt_packer import make_message
+from docaiapp.utils.history_summary import apply_summary, clear_summary, schedule_summary
+from docaiapp.utils.upload_jobs import get_job_store, job_progress, submit_upload
 
-# Load environment variables
-load_dotenv()
-
-# Initialize debug status from environment
-DEBUG = os.getenv("DEBUG", "False").lower() in ["true", "1", "t", "yes", "y"]
+# Validated settings from the environment (.env); missing packages fail the worker at startup
+settings = get_settings()
+require_dependencies(settings)
+DEBUG = settings.debug
 
 # Debug logging function
 def debug_log(message):
@@ -23,33 +29,95 @@ app = Flask(__name__,
             template_folder="docaiapp/templates",
             static_folder="docaiapp/static")
 
-# Configure server-side session
-app.config["SESSION_TYPE"] = "filesystem"
-app.config["SESSION_PERMANENT"] = False
+# Configure server-side session (SQLite or Redis, see SESSION_BACKEND); the cookie only holds its ID
 app.secret_key = os.urandom(24)
-Session(app)
-DOC_INTELLIGENT = os.getenv("DOC_INTELLIGENT", True)
+app.session_interface = get_session_interface()
+DOC_INTELLIGENT = settings.doc_intelligent
+CHAT_STREAMING = settings.chat_streaming
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no'  # Disable proxy buffering so tokens arrive immediately
+}
 
 # Initialize document service provider
 document_service = DocumentServiceProvider(use_intelligent_processing=DOC_INTELLIGENT)
 
 debug_log("Flask app initialized with debug mode: " + str(DEBUG))
 
+def warm_up():
+    """
+    Import the document processors, Azure SDKs and NumPy and load the tokenizer ahead of the first request.
+
+    gunicorn.conf.py calls this in the master process when GUNICORN_PRELOAD is
+    set, so every forked worker starts with them loaded (and shares their memory).
+    """
+    import openai
+    from docaiapp.utils import retrieval
+    from docaiapp.utils.prompt_packer import count_tokens
+    document_service.warm_up()
+    count_tokens("warm up")
+
+@app.before_request
+def start_request_metrics():
+    """Count the request as in flight until it is torn down."""
+    g.metrics_endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.metrics_started = time.perf_counter()
+    metrics.REQUESTS_IN_FLIGHT.labels(g.metrics_endpoint).inc()
+
+@app.after_request
+def record_response_status(response):
+    """Remember the response status for the request metrics."""
+    g.metrics_status = response.status_code
+    return response
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    """Record the request's duration; streamed responses are torn down once the stream ends."""
+    if 'metrics_started' not in g:
+        return
+    if error is not None:
+        metrics.record_error('request', error)
+    metrics.REQUESTS_IN_FLIGHT.labels(g.metrics_endpoint).dec()
+    metrics.REQUEST_SECONDS.labels(g.metrics_endpoint, request.method, g.get('metrics_status', 500)).observe(
+        time.perf_counter() - g.metrics_started)
+    g.pop('metrics_started')
+
+# Profiling hooks are only installed when enabled, so they cost nothing otherwise
+if profiler.PROFILING_ENABLED:
+    @app.before_request
+    def start_profile():
+        """Profile the request; the profile is kept if it is sampled or slow."""
+        if request.path.startswith(('/static/', '/admin/', '/metrics')):
+            return
+        filenames = [file.filename for file in request.files.getlist('files') if file.filename]
+        g.profile = profiler.start(
+            request.url_rule.rule if request.url_rule else 'unmatched',
+            method=request.method,
+            file_types=profiler.file_types(filenames),
+            websites=len(request.form.getlist('websites'))
+        )
+    
+    @app.teardown_request
+    def finish_profile(error=None):
+        """Stop profiling once the response (including a stream) is finished."""
+        profiler.finish(g.pop('profile', None), status=g.get('metrics_status', 500),
+                        error=type(error).__name__ if error is not None else None)
+
 @app.route('/')
 def index():
     """Render the main chat interface."""
     # Get app configuration from environment variables
-    app_title = os.getenv("APP_TITLE", "RAG Chatbot")
-    app_welcome_title = os.getenv("APP_WELCOME_TITLE", "Welcome to the Virtual Assistant")
-    app_welcome_message = os.getenv("APP_WELCOME_MESSAGE", "Upload PDFs, CSV files, Word documents, PowerPoint presentations, or provide website URLs to get relevant answers powered by AI")
+    app_title = env_str("APP_TITLE", "RAG Chatbot")
+    app_welcome_title = env_str("APP_WELCOME_TITLE", "Welcome to the Virtual Assistant")
+    app_welcome_message = env_str("APP_WELCOME_MESSAGE", "Upload PDFs, CSV files, Word documents, PowerPoint presentations, or provide website URLs to get relevant answers powered by AI")
     
     # Fix logo path - remove 'static/' prefix since url_for already includes it
-    logo_path = os.getenv("APP_LOGO_PATH", "images/logo.png")
+    logo_path = env_str("APP_LOGO_PATH", "images/logo.png")
     if logo_path.startswith('static/'):
         logo_path = logo_path[7:]  # Remove 'static/' prefix
     debug_log(f"Using logo path: {logo_path}")
         
-    app_color = os.getenv("APP_PRIMARY_COLOR", "#007bff")
+    app_color = env_str("APP_PRIMARY_COLOR", "#007bff")
     
     debug_log(f"Rendering index with title: {app_title}, logo: {logo_path}")
     
@@ -60,7 +128,8 @@ def index():
         welcome_message=app_welcome_message,
         logo_path=logo_path,
         primary_color=app_color,
-        debug=DEBUG
+        debug=DEBUG,
+        streaming=CHAT_STREAMING
     )
 
 @app.route('/api/chat', methods=['POST'])
@@ -68,60 +137,95 @@ def chat():
     """Process user query and return AI response."""
     data = request.json
     query = data.get('query', '')
+    regenerate = bool(data.get('regenerate', False))
     
     debug_log(f"Received chat query: {query}")
     
     # Initialize session data for new users
-    if 'user_id' not in session:
-        session['user_id'] = str(uuid.uuid4())
-        session['chat_history'] = []
-        session['context'] = ""
-        session['resource_info'] = {'files': [], 'websites': []}
-        debug_log(f"New user session created with ID: {session['user_id']}")
+    ensure_session()
     
     # Process user query
     if query.lower() == 'clear':
-        debug_log("Clearing chat history")
-        session['chat_history'] = []
-        session['context'] = ""
-        session['resource_info'] = {'files': [], 'websites': []}
-        return jsonify({
-            'response': 'Chat history cleared. You can upload new files or provide website URLs.',
-            'history': []
-        })
+        return jsonify(clear_chat())
     
-    # Add query to chat history
-    session['chat_history'].append({'role': 'user', 'content': query})
-    
-    # Get context from session
-    context = session.get('context', "")
+    # Add query to chat history and load the retrieval index for the session's documents
+    index = start_chat_turn(query, regenerate)
     
     # Get AI response
     debug_log("Calling OpenAI service for completion")
-    response = get_completion(query, context, session.get('chat_history', []))
-    debug_log("Response received from OpenAI service")
+    response, cached = get_cached_completion(query, index, session.get('chat_history', []), regenerate=regenerate,
+                                             tables=getattr(index, 'tables', None),
+                                             summary=session.get('history_summary'))
+    debug_log(f"Response received from {'response cache' if cached else 'OpenAI service'}")
     
     # Add response to chat history
-    session['chat_history'].append({'role': 'assistant', 'content': response})
+    finish_chat_turn(response)
     
     return jsonify({
         'response': response,
+        'cached': cached,
         'history': session['chat_history']
     })
 
-@app.route('/api/upload', methods=['POST'])
-def upload():
-    """Process uploaded files and websites."""
-    debug_log("Processing upload request")
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """Process user query and stream the AI response as Server-Sent Events."""
+    data = request.json
+    query = data.get('query', '')
+    regenerate = bool(data.get('regenerate', False))
+    
+    debug_log(f"Received streaming chat query: {query}")
+    
+    # Initialize session data for new users
+    ensure_session()
+    
+    # Add query to chat history
+    index = start_chat_turn(query, regenerate)
+    history = list(session['chat_history'])
     
+    fragments, cached = stream_cached_completion(query, index, history, regenerate=regenerate,
+                                                 tables=getattr(index, 'tables', None),
+                                                 summary=session.get('history_summary'))
+    
+    def generate():
+        parts = []
+        # Closing this generator on client disconnect also closes the upstream stream
+        for fragment in fragments:
+            parts.append(fragment)
+            yield format_sse({'type': 'delta', 'content': fragment})
+        
+        response = "".join(parts)
+        debug_log(f"Streamed response complete ({len(response)} characters)")
+        
+        # The session was saved when the response headers were sent, so the
+        # final assistant message has to be persisted explicitly
+        finish_chat_turn(response)
+        app.session_interface.save_session(app, session, app.response_class())
+        
+        yield format_sse({'type': 'done', 'response': response, 'cached': cached})
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers=SSE_HEADERS
+    )
+
+def ensure_session():
+    """Start a new user session if there is none."""
     if 'user_id' not in session:
         session['user_id'] = str(uuid.uuid4())
         session['chat_history'] = []
-        session['context'] = ""
+        session['corpus_id'] = None
         session['resource_info'] = {'files': [], 'websites': []}
         debug_log(f"New user session created with ID: {session['user_id']}")
-    
-    context = ""
+
+def read_upload_form():
+    """
+    Read the files and websites of an upload request.
+
+    Returns:
+        tuple: (file names, website URLs, (filename, bytes) tuples, crawl flag)
+    """
     uploaded_files = []
     uploaded_websites = []
     
@@ -140,70 +244,155 @@ def upload():
     except Exception as e:
         debug_log(f"Error parsing filenames or website URLs: {str(e)}")
     
-    # Get the appropriate document processors using the service provider
-    pdf_processor = document_service.get_pdf_processor()
-    csv_processor = document_service.get_csv_processor()
-    word_processor = document_service.get_word_processor()
-    powerpoint_processor = document_service.get_powerpoint_processor()
-    website_processor = document_service.get_website_processor()
-    
-    # Process files
-    if 'files' in request.files:
-        files = request.files.getlist('files')
-        debug_log(f"Received {len(files)} files")
-        
-        # If filenames weren't provided in metadata, extract them
-        if not uploaded_files:
-            uploaded_files = [file.filename for file in files if file.filename]
-        
-        for file in files:
-            if file.filename.endswith('.pdf'):
-                debug_log(f"Processing PDF file: {file.filename}")
-                pdf_content = pdf_processor(file)
-                context += f"--- Content from {file.filename} ---\n{pdf_content}\n\n"
-            elif file.filename.endswith('.csv'):
-                debug_log(f"Processing CSV file: {file.filename}")
-                csv_content = csv_processor(file)
-                context += f"--- Content from {file.filename} ---\n{csv_content}\n\n"
-            elif file.filename.lower().endswith(('.docx', '.doc')):
-                debug_log(f"Processing Word file: {file.filename}")
-                word_content = word_processor(file)
-                context += f"--- Content from {file.filename} ---\n{word_content}\n\n"
-            elif file.filename.lower().endswith(('.pptx', '.ppt')):
-                debug_log(f"Processing PowerPoint file: {file.filename}")
-                ppt_content = powerpoint_processor(file)
-                context += f"--- Content from {file.filename} ---\n{ppt_content}\n\n"
-    
-    # Process websites
-    websites = request.form.getlist('websites')
+    files = request.files.getlist('files') if 'files' in request.files else []
+    debug_log(f"Received {len(files)} files")
+    
+    # If filenames weren't provided in metadata, extract them
+    if not uploaded_files:
+        uploaded_files = [file.filename for file in files if file.filename]
+    
+    websites = [url for url in request.form.getlist('websites') if url.strip()]
     debug_log(f"Received {len(websites)} websites")
     
     # If website URLs weren't provided in metadata, use the request list
     if not uploaded_websites:
-        uploaded_websites = [url for url in websites if url.strip()]
+        uploaded_websites = websites
     
-    for url in websites:
-        if url.strip():
-            debug_log(f"Processing website: {url}")
-            website_content = website_processor(url)
-            context += website_content + "\n\n"
+    # Extraction runs as a background job; the service provider decides
+    # which processor handles each file
+    file_data = [(file.filename, file.read()) for file in files if file.filename]
+    crawl = request.form.get('crawlWebsites', '').lower() in ['true', '1', 'on', 'yes']
+    return uploaded_files, websites, file_data, crawl
+
+@app.route('/api/upload', methods=['POST'])
+def upload():
+    """Process uploaded files and websites, replacing the session's resources."""
+    debug_log("Processing upload request")
+    ensure_session()
+    uploaded_files, websites, file_data, crawl = read_upload_form()
     
-    # Store context and resource info in session
-    session['context'] = context
+    # The session reads the new corpus right away; it fills up as files finish
+    get_job_store().cancel_corpus(session.get('corpus_id'))
+    get_document_store().delete_index(session.get('corpus_id'))
+    session['corpus_id'] = uuid.uuid4().hex
     session['resource_info'] = {
         'files': uploaded_files,
-        'websites': uploaded_websites
+        'websites': websites
     }
-    debug_log(f"Context size: {len(context)} characters")
+    session['upload_job_id'], _ = submit_upload(
+        session['user_id'], session['corpus_id'], file_data, websites,
+        document_service, crawl=crawl, format_resources=format_resources_message
+    )
+    debug_log(f"Queued upload job {session['upload_job_id']}")
     debug_log(f"Stored resource info: {session['resource_info']}")
     
-    # Create a nicely formatted resources message
-    resources_message = format_resources_message(uploaded_files, uploaded_websites)
+    return jsonify({
+        'status': 'queued',
+        'job_id': session['upload_job_id'],
+        'message': f'Processing {len(file_data)} files and {len(websites)} websites'
+    }), 202
+
+@app.route('/api/upload/<job_id>', methods=['GET'])
+def upload_status(job_id):
+    """Report the progress of an upload job."""
+    job = get_job_store().get(job_id)
+    if job is None or job['owner'] != session.get('user_id'):
+        return jsonify({
+            'status': 'error',
+            'message': 'Upload job not found'
+        }), 404
+    
+    return jsonify(job_progress(job))
+
+@app.route('/api/resources', methods=['GET'])
+def list_resources():
+    """List the resources of the session's corpus, including ones still being processed."""
+    corpus_id = session.get('corpus_id')
+    index = get_document_store().load_index(corpus_id)
+    resources = getattr(index, 'resources', {})
+    pending = [item for item in get_job_store().active_items(corpus_id)
+               if item['resource_id'] not in resources and item['status'] in ('queued', 'processing')]
+    
+    return jsonify({
+        'resources': [{'id': resource_id, 'kind': resource['kind'], 'source': resource['source']}
+                      for resource_id, resource in resources.items()],
+        'pending': [{'id': item['resource_id'], 'kind': item['kind'], 'source': item['source']}
+                    for item in pending],
+        'message': format_resources_message(*index.resource_names()) if index is not None else None
+    })
+
+@app.route('/api/resources', methods=['POST'])
+def add_resources():
+    """Add files and websites to the session's corpus without reprocessing the existing ones."""
+    debug_log("Processing add resources request")
+    ensure_session()
+    uploaded_files, websites, file_data, crawl = read_upload_form()
+    if not file_data and not websites:
+        return jsonify({
+            'status': 'error',
+            'message': 'No files or websites provided'
+        }), 400
+    
+    if not session.get('corpus_id'):
+        session['corpus_id'] = uuid.uuid4().hex
+    resource_info = session.get('resource_info') or {'files': [], 'websites': []}
+    session['resource_info'] = {
+        'files': resource_info['files'] + uploaded_files,
+        'websites': resource_info['websites'] + websites
+    }
+    job_id, items = submit_upload(
+        session['user_id'], session['corpus_id'], file_data, websites,
+        document_service, crawl=crawl, format_resources=format_resources_message
+    )
+    session['upload_job_id'] = job_id
+    debug_log(f"Queued job {job_id} adding {len(items)} resources to corpus {session['corpus_id']}")
+    
+    return jsonify({
+        'status': 'queued',
+        'job_id': job_id,
+        'resources': [{'id': item['resource_id'], 'kind': item['kind'], 'source': item['source']} for item in items],
+        'message': f'Adding {len(file_data)} files and {len(websites)} websites'
+    }), 202
+
+@app.route('/api/resources/<resource_id>', methods=['DELETE'])
+def remove_resource(resource_id):
+    """Remove one file or website from the session's corpus."""
+    corpus_id = session.get('corpus_id')
+    if not corpus_id:
+        return jsonify({
+            'status': 'error',
+            'message': 'Resource not found'
+        }), 404
+    
+    # Crawled websites keep receiving pages until their job ends
+    for item in get_job_store().active_items(corpus_id):
+        if item['resource_id'] == resource_id and (item['status'] in ('queued', 'processing') or item['kind'] == 'website'):
+            return jsonify({
+                'status': 'error',
+                'message': 'Resource is still being processed'
+            }), 409
+    
+    store = get_document_store()
+    with store.index_lock(corpus_id):
+        # Usually cached; the removal is appended to the index rather than rewriting it
+        index = store.load_index(corpus_id)
+        removed = index.resources.get(resource_id) if index is not None else None
+        if removed is not None:
+            store.remove_from_index(corpus_id, resource_id)
+    if removed is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Resource not found'
+        }), 404
+    
+    files, websites = index.resource_names(exclude=resource_id)
+    session['resource_info'] = {'files': files, 'websites': websites}
+    debug_log(f"Removed resource {resource_id} ({removed['source']}) from corpus {corpus_id}")
     
     return jsonify({
         'status': 'success',
-        'message': f'Processed {len(request.files.getlist("files"))} files and {len(websites)} websites',
-        'resources': resources_message
+        'message': f"Removed {removed['source']}",
+        'resources': format_resources_message(files, websites)
     })
 
 @app.route('/api/clear_messages', methods=['POST'])
@@ -212,8 +401,10 @@ def clear_messages():
     debug_log("Clearing chat messages but preserving context and resources")
     
     if 'user_id' in session:
-        # Clear chat history but keep context and resource info
+        # Clear chat history but keep the document corpus and resource info
         session['chat_history'] = []
+        session['history_summary'] = None
+        clear_summary(session['user_id'])
         
         return jsonify({
             'status': 'success',
@@ -225,6 +416,88 @@ def clear_messages():
             'message': 'No active session found'
         })
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Expose the Prometheus metrics of all worker processes."""
+    rendered = metrics.render()
+    if rendered is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Metrics are disabled'
+        }), 404
+    
+    body, content_type = rendered
+    return Response(body, content_type=content_type)
+
+def admin_authorized():
+    """Check the request's "Authorization: Bearer <token>" header against PROFILING_ADMIN_TOKEN."""
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    return hmac.compare_digest(token.encode(), profiler.PROFILING_ADMIN_TOKEN.encode())
+
+@app.route('/admin/profiles', methods=['GET'])
+def list_profiles():
+    """List the stored request and upload job profiles, newest first."""
+    if not profiler.PROFILING_ADMIN_TOKEN:
+        return jsonify({'status': 'error', 'message': 'Not found'}), 404
+    if not admin_authorized():
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    
+    return jsonify({'profiles': profiler.list_profiles()})
+
+@app.route('/admin/profiles/<profile_id>', methods=['GET'])
+def download_profile(profile_id):
+    """Download a profile as collapsed stacks (for speedscope or flamegraph.pl)."""
+    if not profiler.PROFILING_ADMIN_TOKEN:
+        return jsonify({'status': 'error', 'message': 'Not found'}), 404
+    if not admin_authorized():
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    
+    path = profiler.profile_path(profile_id)
+    if path is None:
+        return jsonify({'status': 'error', 'message': 'Profile not found'}), 404
+    return send_file(os.path.abspath(path), mimetype='text/plain', as_attachment=True,
+                     download_name=f'{profile_id}.folded')
+
+def apply_history_summary():
+    """Replace the older chat messages with the conversation summary once it is ready."""
+    session['chat_history'], session['history_summary'] = apply_summary(
+        session['user_id'], session['chat_history'], session.get('history_summary'))
+
+def clear_chat():
+    """Clear the session's chat history and documents; returns the response payload."""
+    debug_log("Clearing chat history")
+    session['chat_history'] = []
+    session['history_summary'] = None
+    clear_summary(session['user_id'])
+    get_job_store().cancel_corpus(session.get('corpus_id'))
+    get_document_store().delete_index(session.get('corpus_id'))
+    session['corpus_id'] = None
+    session['resource_info'] = {'files': [], 'websites': []}
+    return {
+        'response': 'Chat history cleared. You can upload new files or provide website URLs.',
+        'history': []
+    }
+
+def start_chat_turn(query, regenerate=False):
+    """Add a query to the chat history and return the retrieval index of the session's documents."""
+    apply_history_summary()
+    record_query(query, regenerate)
+    return get_document_store().load_index(session.get('corpus_id'))
+
+def finish_chat_turn(response):
+    """Add the answer to the chat history; older messages are summarized in the background once it gets long."""
+    session['chat_history'].append(make_message('assistant', response))
+    schedule_summary(session['user_id'], session['chat_history'], session.get('history_summary'))
+
+def record_query(query, regenerate=False):
+    """Add a query to the chat history; regenerating drops the previous answer to it instead."""
+    history = session['chat_history']
+    if (regenerate and len(history) >= 2 and history[-1]['role'] == 'assistant'
+            and history[-2]['role'] == 'user' and history[-2]['content'] == query):
+        history.pop()
+    else:
+        history.append(make_message('user', query))
+
 def format_resources_message(files, websites):
     """Format a nice message showing the uploaded resources."""
     if not files and not websites:
@@ -254,6 +527,10 @@ def format_resources_message(files, websites):
     
     return "\n".join(message_parts)
 
+def format_sse(payload):
+    """Format a payload as a Server-Sent Events data frame."""
+    return f"data: {json.dumps(payload)}\n\n"
+
 if __name__ == '__main__':
     debug_log("Starting Flask application")
     app.run(debug=DEBUG)
\ No newline at end of file
@@ -0,0 +1,247 @@
+"""
+ASGI entry point: serves the chat endpoints asynchronously.
+
+With sync gunicorn workers every chat request holds a worker for as long as
+the model takes to answer, so a few slow completions are enough to queue
+everyone else. Under an ASGI server (SERVER_MODE=async in startup.sh):
+
+    gunicorn -k uvicorn.workers.UvicornWorker asgi:application
+
+POST /api/chat and /api/chat/stream run on the event loop and await the
+async OpenAI client, so a single worker process keeps hundreds of
+completions in flight. Blocking steps of a chat turn (session storage, the
+retrieval index, SQL tool calls, the response cache) run on threads. Every
+other route is the unchanged Flask app, served through a2wsgi on a thread
+pool of ASGI_WSGI_THREADS threads.
+
+The async views go through the same Flask request context as the sync
+ones, so sessions, the request metrics and error handlers behave the same
+way. The profiler attributes stacks to threads, so it works best with the
+sync workers.
+"""
+
+import asyncio
+import contextvars
+import io
+import sys
+
+from a2wsgi import WSGIMiddleware
+from flask import jsonify, request, session
+
+from app import (SSE_HEADERS, app, clear_chat, debug_log, ensure_session, finish_chat_turn, format_sse,
+                 start_chat_turn)
+from docaiapp.utils.config import env_int
+from docaiapp.utils.openai_service import get_cached_completion_async, stream_cached_completion_async
+
+# Threads serving the WSGI routes (uploads, resources, pages) per worker process
+ASGI_WSGI_THREADS = env_int("ASGI_WSGI_THREADS", 16, minimum=1)
+
+
+async def chat():
+    """Process user query and return AI response."""
+    data = request.json
+    query = data.get('query', '')
+    regenerate = bool(data.get('regenerate', False))
+
+    debug_log(f"Received async chat query: {query}")
+
+    ensure_session()
+    if query.lower() == 'clear':
+        return jsonify(await asyncio.to_thread(clear_chat))
+
+    index = await asyncio.to_thread(start_chat_turn, query, regenerate)
+
+    response, cached = await get_cached_completion_async(query, index, session.get('chat_history', []),
+                                                         regenerate=regenerate,
+                                                         tables=getattr(index, 'tables', None),
+                                                         summary=session.get('history_summary'))
+    debug_log(f"Response received from {'response cache' if cached else 'OpenAI service'}")
+
+    await asyncio.to_thread(finish_chat_turn, response)
+
+    return jsonify({
+        'response': response,
+        'cached': cached,
+        'history': session['chat_history']
+    })
+
+async def chat_stream():
+    """Process user query and stream the AI response as Server-Sent Events."""
+    data = request.json
+    query = data.get('query', '')
+    regenerate = bool(data.get('regenerate', False))
+
+    debug_log(f"Received async streaming chat query: {query}")
+
+    ensure_session()
+    index = await asyncio.to_thread(start_chat_turn, query, regenerate)
+    history = list(session['chat_history'])
+
+    fragments, cached = await stream_cached_completion_async(query, index, history, regenerate=regenerate,
+                                                             tables=getattr(index, 'tables', None),
+                                                             summary=session.get('history_summary'))
+
+    async def generate():
+        parts = []
+        # Cancelling this generator on client disconnect also closes the upstream stream
+        async for fragment in fragments:
+            parts.append(fragment)
+            yield format_sse({'type': 'delta', 'content': fragment})
+
+        response = "".join(parts)
+        debug_log(f"Streamed response complete ({len(response)} characters)")
+
+        # The session was saved when the response headers were sent, so the
+        # final assistant message has to be persisted explicitly
+        def persist():
+            finish_chat_turn(response)
+            app.session_interface.save_session(app, session, app.response_class())
+        await asyncio.to_thread(persist)
+
+        yield format_sse({'type': 'done', 'response': response, 'cached': cached})
+
+    return app.response_class(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+ASYNC_VIEWS = {
+    '/api/chat': chat,
+    '/api/chat/stream': chat_stream,
+}
+
+
+def build_environ(scope, body):
+    """
+    Build the WSGI environ of an ASGI HTTP request, for the Flask request context.
+
+    Args:
+        scope (dict): ASGI connection scope
+        body (bytes): Complete request body
+
+    Returns:
+        dict: WSGI environ
+    """
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1] or 80),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            environ[name] = value
+            continue
+        key = f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+async def _read_body(receive):
+    body = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        body.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            return b"".join(body)
+
+async def _send_response(response, receive, send):
+    """Send a Flask response; an async iterable body is streamed until it ends or the client leaves."""
+    await send({
+        "type": "http.response.start",
+        "status": response.status_code,
+        "headers": [(name.encode("latin-1"), value.encode("latin-1"))
+                    for name, value in response.headers.to_wsgi_list()],
+    })
+    if not hasattr(response.response, "__aiter__"):
+        await send({"type": "http.response.body", "body": response.get_data()})
+        return
+
+    async def pump():
+        async for chunk in response.response:
+            await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def watch_disconnect():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    streaming = asyncio.ensure_future(pump())
+    watcher = asyncio.ensure_future(watch_disconnect())
+    try:
+        await asyncio.wait([streaming, watcher], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (streaming, watcher):
+            task.cancel()
+        await asyncio.gather(streaming, watcher, return_exceptions=True)
+    if streaming.cancelled():
+        debug_log("Client disconnected, stream cancelled")
+    elif streaming.exception() is not None:
+        raise streaming.exception()
+
+async def handle_async_view(view, scope, receive, send):
+    """Run an async view inside a Flask request context, like Flask's wsgi_app()."""
+    body = await _read_body(receive)
+    if body is None:
+        return
+    ctx = app.request_context(build_environ(scope, body))
+    ctx.push()
+    error = None
+    try:
+        try:
+            try:
+                rv = app.preprocess_request()
+                if rv is None:
+                    rv = await view()
+            except Exception as e:
+                rv = app.handle_user_exception(e)
+            # after_request hooks and saving the session
+            response = await asyncio.to_thread(app.finalize_request, rv)
+        except Exception as e:
+            error = e
+            response = app.handle_exception(e)
+        await _send_response(response, receive, send)
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        # Teardown (request metrics, profiling) runs once the stream is finished
+        ctx.pop(error)
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+wsgi_application = WSGIMiddleware(app, workers=ASGI_WSGI_THREADS)
+
+async def application(scope, receive, send):
+    """ASGI application: the chat endpoints are async, everything else is the Flask app."""
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    view = ASYNC_VIEWS.get(scope["path"]) if scope["type"] == "http" and scope["method"] == "POST" else None
+    if view is None:
+        await wsgi_application(scope, receive, send)
+        return
+    # Run in an empty context: the server may start a keep-alive connection's
+    # next request from a context that still holds the previous Flask request
+    await contextvars.Context().run(asyncio.ensure_future, handle_async_view(view, scope, receive, send))
@@ -0,0 +1,9 @@
+"""
+Benchmarks for the document processors and the upload path.
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.compare base.json results.json
+
+Inputs are generated synthetically (see corpus.py) at a size set by
+--scale, so runs on different commits process identical documents.
+"""
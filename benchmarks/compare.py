@@ -0,0 +1,99 @@
+"""
+Compare two benchmark result files, e.g. from the base branch and a change.
+
+    python -m benchmarks.compare base.json head.json
+    python -m benchmarks.compare base.json head.json --threshold 0.15 --fail-on-regression
+
+A case regresses when its median time or its peak RSS grows by more than
+the threshold. Results are only comparable when both runs used the same
+--scale on similar machines.
+"""
+
+import argparse
+import json
+import sys
+
+# Metric, whether a higher value is better
+METRICS = (
+    ("seconds", False),
+    ("mb_per_s", True),
+    ("peak_rss_mb", False),
+    ("peak_python_mb", False),
+    ("output_chars", None),
+)
+# Metrics that count as a regression when they get worse by more than the threshold
+GATED_METRICS = ("seconds", "peak_rss_mb")
+
+
+def load_results(path):
+    """
+    Read a results file written by benchmarks.run.
+
+    Returns:
+        tuple: (report metadata, results by case name)
+    """
+    with open(path) as f:
+        report = json.load(f)
+    return report, {result["name"]: result for result in report["results"]}
+
+def compare(base, head, threshold):
+    """
+    Compare the cases present in both runs.
+
+    Args:
+        base (dict): Results by case name of the baseline run
+        head (dict): Results by case name of the new run
+        threshold (float): Relative change that counts as a regression (0.1 = 10%)
+
+    Returns:
+        tuple: (rows of (case, metric, base, head, relative change), regressed case names)
+    """
+    rows = []
+    regressions = []
+    for name in [name for name in base if name in head]:
+        for metric, higher_is_better in METRICS:
+            old, new = base[name].get(metric), head[name].get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else 0.0
+            rows.append((name, metric, old, new, change))
+            if metric in GATED_METRICS:
+                worse = -change if higher_is_better else change
+                if worse > threshold and name not in regressions:
+                    regressions.append(name)
+    return rows, regressions
+
+def format_table(rows):
+    lines = [f"{'case':<16} {'metric':<16} {'base':>12} {'head':>12} {'change':>9}"]
+    for name, metric, old, new, change in rows:
+        lines.append(f"{name:<16} {metric:<16} {old:>12g} {new:>12g} {change:>+8.1%}")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("base", help="Results of the baseline commit")
+    parser.add_argument("head", help="Results of the commit under test")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Relative slowdown or memory growth reported as a regression (default: 0.1)")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 if any case regressed")
+    args = parser.parse_args(argv)
+
+    base_report, base = load_results(args.base)
+    head_report, head = load_results(args.head)
+    print(f"base: {base_report.get('commit') or 'unknown'}  head: {head_report.get('commit') or 'unknown'}")
+    if base_report.get("scale") != head_report.get("scale"):
+        print(f"warning: the runs used different scales ({base_report.get('scale')} and {head_report.get('scale')})")
+    missing = sorted(set(base) ^ set(head))
+    if missing:
+        print(f"warning: cases only in one run: {', '.join(missing)}")
+
+    rows, regressions = compare(base, head, args.threshold)
+    print(format_table(rows))
+    if regressions:
+        print(f"\nRegressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+    else:
+        print("\nNo regressions.")
+    return 1 if regressions and args.fail_on_regression else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""
+Synthetic benchmark inputs.
+
+Every generator is deterministic for a given size, so the same benchmark
+case processes byte-identical input on every commit.
+"""
+
+import csv
+import io
+import random
+
+WORDS = (
+    "policy employee benefit coverage dental vision annual leave quarter revenue forecast region "
+    "customer contract renewal invoice payment schedule project milestone risk mitigation budget "
+    "approval department manager review compliance audit training safety incident report vendor "
+    "shipment inventory warehouse order product release feature customer support ticket response"
+).split()
+
+
+def _sentence(rng, words=14):
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+def _paragraph(rng, sentences=5):
+    return " ".join(_sentence(rng) for _ in range(sentences))
+
+def make_pdf(pages, seed=1):
+    """
+    Generate a text PDF with a heading, paragraphs and a small table on every page.
+
+    Args:
+        pages (int): Number of pages
+        seed (int): Random seed
+
+    Returns:
+        bytes: PDF file
+    """
+    import fitz  # PyMuPDF
+
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 60), f"Section {number + 1}: {rng.choice(WORDS).title()} overview", fontsize=16)
+        body = "\n\n".join(_paragraph(rng, 4) for _ in range(3))
+        page.insert_textbox(fitz.Rect(72, 80, 540, 560), body, fontsize=10)
+        rows = ["Item    Quantity    Price    Region"]
+        rows += [f"{rng.choice(WORDS)}    {rng.randint(1, 500)}    {rng.uniform(1, 999):.2f}    {rng.choice(WORDS)}"
+                 for _ in range(8)]
+        page.insert_textbox(fitz.Rect(72, 580, 540, 780), "\n".join(rows), fontsize=9)
+    data = doc.tobytes(garbage=1, deflate=True)
+    doc.close()
+    return data
+
+def make_csv(rows, columns, seed=1):
+    """
+    Generate a CSV with integer, float, boolean, date and text columns.
+
+    Args:
+        rows (int): Number of data rows
+        columns (int): Number of columns
+        seed (int): Random seed
+
+    Returns:
+        bytes: UTF-8 CSV file
+    """
+    rng = random.Random(seed)
+    kinds = ["integer", "float", "boolean", "date", "text"]
+    header = [f"{kinds[i % len(kinds)]}_{i}" for i in range(columns)]
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(header)
+    for _ in range(rows):
+        row = []
+        for i in range(columns):
+            kind = kinds[i % len(kinds)]
+            if rng.random() < 0.02:
+                row.append("")
+            elif kind == "integer":
+                row.append(rng.randint(-1000, 100000))
+            elif kind == "float":
+                row.append(f"{rng.uniform(-1000, 1000):.3f}")
+            elif kind == "boolean":
+                row.append(rng.choice(("true", "false")))
+            elif kind == "date":
+                row.append(f"20{rng.randint(10, 29)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}")
+            else:
+                row.append(" ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 6))))
+        writer.writerow(row)
+    return out.getvalue().encode("utf-8")
+
+def make_docx(sections, table_rows=20, seed=1):
+    """
+    Generate a Word document of headed sections, each with paragraphs and a table.
+
+    Args:
+        sections (int): Number of sections
+        table_rows (int): Rows in each section's table
+        seed (int): Random seed
+
+    Returns:
+        bytes: DOCX file
+    """
+    import docx
+
+    rng = random.Random(seed)
+    document = docx.Document()
+    for number in range(sections):
+        document.add_heading(f"Section {number + 1}: {rng.choice(WORDS).title()}", level=1 if number % 5 == 0 else 2)
+        for _ in range(3):
+            document.add_paragraph(_paragraph(rng))
+        table = document.add_table(rows=table_rows + 1, cols=5)
+        for column, title in enumerate(("Item", "Owner", "Quantity", "Price", "Status")):
+            table.cell(0, column).text = title
+        for row in range(1, table_rows + 1):
+            cells = table.rows[row].cells
+            cells[0].text = rng.choice(WORDS)
+            cells[1].text = rng.choice(WORDS).title()
+            cells[2].text = str(rng.randint(1, 500))
+            cells[3].text = f"{rng.uniform(1, 999):.2f}"
+            cells[4].text = rng.choice(("open", "closed", "pending"))
+    out = io.BytesIO()
+    document.save(out)
+    return out.getvalue()
+
+def make_pptx(slides, table_rows=8, seed=1):
+    """
+    Generate a PowerPoint deck where every slide has a title, bullets, a table and notes.
+
+    Args:
+        slides (int): Number of slides
+        table_rows (int): Rows in each slide's table
+        seed (int): Random seed
+
+    Returns:
+        bytes: PPTX file
+    """
+    from pptx import Presentation
+    from pptx.util import Inches
+
+    rng = random.Random(seed)
+    presentation = Presentation()
+    layout = presentation.slide_layouts[1]
+    for number in range(slides):
+        slide = presentation.slides.add_slide(layout)
+        slide.shapes.title.text = f"Slide {number + 1}: {rng.choice(WORDS).title()} update"
+        body = slide.placeholders[1].text_frame
+        body.text = _sentence(rng)
+        for _ in range(4):
+            body.add_paragraph().text = _sentence(rng, 10)
+        shape = slide.shapes.add_table(table_rows + 1, 4, Inches(0.5), Inches(4.5), Inches(9), Inches(2.5))
+        for column, title in enumerate(("Metric", "Q1", "Q2", "Q3")):
+            shape.table.cell(0, column).text = title
+        for row in range(1, table_rows + 1):
+            shape.table.cell(row, 0).text = rng.choice(WORDS)
+            for column in range(1, 4):
+                shape.table.cell(row, column).text = str(rng.randint(0, 10000))
+        slide.notes_slide.notes_text_frame.text = _paragraph(rng, 2)
+    out = io.BytesIO()
+    presentation.save(out)
+    return out.getvalue()
+
+def make_html(sections, depth=40, seed=1):
+    """
+    Generate a large page with deeply nested markup, navigation, scripts,
+    headings, lists and tables.
+
+    Args:
+        sections (int): Number of content sections
+        depth (int): Nesting depth of the wrapper elements around each section
+        seed (int): Random seed
+
+    Returns:
+        bytes: UTF-8 HTML page
+    """
+    rng = random.Random(seed)
+    parts = ["<!DOCTYPE html><html><head><title>Benchmark page</title>",
+             "<style>body { font-family: sans-serif; }</style>",
+             "<script>window.analytics = {events: []};</script></head><body>",
+             "<nav><ul>" + "".join(f'<li><a href="/page/{i}">{rng.choice(WORDS)}</a></li>' for i in range(50)) + "</ul></nav>",
+             "<main>"]
+    for number in range(sections):
+        parts.append("".join(f'<div class="wrap level-{level}">' for level in range(depth)))
+        parts.append(f"<h2>Section {number + 1}: {rng.choice(WORDS).title()}</h2>")
+        parts.append("".join(f"<p>{_paragraph(rng, 3)}</p>" for _ in range(2)))
+        parts.append("<ul>" + "".join(f"<li>{_sentence(rng, 8)}</li>" for _ in range(5)) + "</ul>")
+        parts.append("<table><tr><th>Item</th><th>Quantity</th><th>Price</th></tr>"
+                     + "".join(f"<tr><td>{rng.choice(WORDS)}</td><td>{rng.randint(1, 500)}</td>"
+                               f"<td>{rng.uniform(1, 999):.2f}</td></tr>" for _ in range(6))
+                     + "</table>")
+        parts.append("</div>" * depth)
+    parts.append("</main><footer><p>Generated for benchmarking.</p></footer></body></html>")
+    return "".join(parts).encode("utf-8")
@@ -0,0 +1,295 @@
+"""
+Run the benchmark suite and write the results as JSON.
+
+Each case runs in a fresh interpreter, so its peak memory is not mixed up
+with other cases and the imports and input generation are not timed. It is
+started as a plain subprocess rather than a multiprocessing child, so the
+processors use the ingest process pool the way they do in a web worker.
+Every case is run once to warm up and then --repeat times; the reported
+time is the median. Peak RSS covers the benchmark process only, not the
+ingest pool's worker processes. Peak Python allocations are measured in
+one extra, untimed run with tracemalloc.
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --scale 0.2 --repeat 1 --only pdf,csv
+"""
+
+import argparse
+import http.server
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from benchmarks import corpus
+
+RESULTS_VERSION = 1
+UPLOAD_POLL_INTERVAL = 0.05
+UPLOAD_TIMEOUT = 600
+
+
+def _named(data, filename):
+    from docaiapp.utils.ingest import NamedBytesIO
+    return NamedBytesIO(data, filename)
+
+def _run_pdf(inputs):
+    from docaiapp.utils.pdf_processor import process_pdf
+    return process_pdf(_named(inputs["file"], "benchmark.pdf"))
+
+def _run_csv(inputs):
+    from docaiapp.utils.csv_processor import process_csv
+    return process_csv(_named(inputs["file"], "benchmark.csv"))
+
+def _run_word(inputs):
+    from docaiapp.utils.word_processor import process_word
+    return process_word(_named(inputs["file"], "benchmark.docx"))
+
+def _run_powerpoint(inputs):
+    from docaiapp.utils.powerpoint_processor import process_powerpoint
+    return process_powerpoint(_named(inputs["file"], "benchmark.pptx"))
+
+def _run_website(inputs, server):
+    from docaiapp.utils.website_processor import process_website
+    return process_website(f"http://127.0.0.1:{server.server_port}/benchmark.html")
+
+def _run_upload(inputs, client):
+    """Upload all input files through /api/upload and wait until the job is done."""
+    files = [(io.BytesIO(data), name) for name, data in inputs.items()]
+    response = client.post("/api/upload", data={"files": files}, content_type="multipart/form-data")
+    job_id = response.get_json()["job_id"]
+    deadline = time.monotonic() + UPLOAD_TIMEOUT
+    while time.monotonic() < deadline:
+        job = client.get(f"/api/upload/{job_id}").get_json()
+        if job["status"] not in ("queued", "running"):
+            break
+        time.sleep(UPLOAD_POLL_INTERVAL)
+    else:
+        raise TimeoutError(f"Upload job {job_id} did not finish")
+    if job["status"] != "done" or any(item["status"] == "error" for item in job["items"]):
+        raise RuntimeError(f"Upload job {job_id} failed: {job['items']}")
+    return job["resources"] or ""
+
+
+def _single(units, data):
+    return units, {"file": data}
+
+# name: (group, runner, unit, input generators returning (units, {filename: bytes}))
+CASES = {
+    "pdf-100p": ("pdf", _run_pdf, "pages", lambda s: _single(int(100 * s), corpus.make_pdf(int(100 * s)))),
+    "pdf-500p": ("pdf", _run_pdf, "pages", lambda s: _single(int(500 * s), corpus.make_pdf(int(500 * s)))),
+    "csv-long": ("csv", _run_csv, "rows", lambda s: _single(int(200000 * s), corpus.make_csv(int(200000 * s), 8))),
+    "csv-wide": ("csv", _run_csv, "rows", lambda s: _single(int(5000 * s), corpus.make_csv(int(5000 * s), 200))),
+    "docx-tables": ("word", _run_word, "sections", lambda s: _single(int(200 * s), corpus.make_docx(int(200 * s)))),
+    "pptx-tables": ("powerpoint", _run_powerpoint, "slides",
+                    lambda s: _single(int(150 * s), corpus.make_pptx(int(150 * s)))),
+    "website-deep": ("website", _run_website, "sections",
+                     lambda s: _single(int(500 * s), corpus.make_html(int(500 * s), depth=40))),
+    "upload-mixed": ("upload", _run_upload, "files", lambda s: (4, {
+        "report.pdf": corpus.make_pdf(int(100 * s)),
+        "data.csv": corpus.make_csv(int(20000 * s), 10),
+        "handbook.docx": corpus.make_docx(int(50 * s)),
+        "review.pptx": corpus.make_pptx(int(30 * s)),
+    })),
+}
+
+
+class _PageHandler(http.server.BaseHTTPRequestHandler):
+    page = b""
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(self.page)))
+        self.end_headers()
+        self.wfile.write(self.page)
+
+    def log_message(self, format, *args):
+        pass
+
+def _clear_store(root):
+    """Delete the files written by a previous run, so content-addressed stores do not skip work."""
+    for directory, _, files in os.walk(root):
+        for name in files:
+            os.unlink(os.path.join(directory, name))
+
+def _peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def _measure(name, input_dir, repeat, store_dir):
+    """Run one case in this (fresh) process and return its measurements."""
+    group, runner, unit, _ = CASES[name]
+    inputs = {}
+    for filename in sorted(os.listdir(input_dir)):
+        with open(os.path.join(input_dir, filename), "rb") as f:
+            inputs[filename] = f.read()
+
+    extra = ()
+    if group == "website":
+        _PageHandler.page = inputs["file"]
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _PageHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        extra = (server,)
+    elif group == "upload":
+        import app as app_module
+        from docaiapp.utils.service_provider import DocumentServiceProvider
+        # Benchmark the local processors, not a remote service
+        app_module.document_service = DocumentServiceProvider(use_intelligent_processing=False)
+        extra = (app_module.app.test_client(),)
+
+    baseline_rss = _peak_rss_mb()
+
+    # Warm-up run: imports, worker pools and connection set-up are not timed
+    _clear_store(store_dir)
+    output = runner(inputs, *extra)
+    if isinstance(output, str) and output.startswith(("Error", "CSV file is empty")):
+        raise RuntimeError(f"{name} failed: {output[:200]}")
+
+    times = []
+    for _ in range(repeat):
+        _clear_store(store_dir)
+        started = time.perf_counter()
+        runner(inputs, *extra)
+        times.append(time.perf_counter() - started)
+    peak_rss = _peak_rss_mb()
+
+    _clear_store(store_dir)
+    tracemalloc.start()
+    runner(inputs, *extra)
+    _, peak_python = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    if group == "website":
+        extra[0].shutdown()
+    return {
+        "seconds": times,
+        "output_chars": len(output),
+        "peak_rss_mb": round(peak_rss, 1),
+        "rss_growth_mb": round(max(0.0, peak_rss - baseline_rss), 1),
+        "peak_python_mb": round(peak_python / (1024 * 1024), 1),
+    }
+
+def run_case(name, scale, repeat, work_dir):
+    """
+    Generate a case's input, run it in a fresh process and summarize the result.
+
+    Returns:
+        dict: Result record for the JSON output
+    """
+    group, _, unit, generate = CASES[name]
+    units, inputs = generate(scale)
+    input_dir = os.path.join(work_dir, name)
+    os.makedirs(input_dir, exist_ok=True)
+    for filename, data in inputs.items():
+        with open(os.path.join(input_dir, filename), "wb") as f:
+            f.write(data)
+    input_bytes = sum(len(data) for data in inputs.values())
+    del inputs
+
+    process = subprocess.run(
+        [sys.executable, "-m", "benchmarks.run", "--measure", name, "--input-dir", input_dir, "--repeat", str(repeat)],
+        stdout=subprocess.PIPE, text=True
+    )
+    shutil.rmtree(input_dir, ignore_errors=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"Benchmark case {name} failed with exit code {process.returncode}")
+    measured = json.loads(process.stdout.strip().splitlines()[-1])
+
+    seconds = statistics.median(measured.pop("seconds")) if repeat else 0.0
+    return {
+        "name": name,
+        "group": group,
+        "unit": unit,
+        "units": units,
+        "input_bytes": input_bytes,
+        "seconds": round(seconds, 4),
+        "units_per_s": round(units / seconds, 2) if seconds else None,
+        "mb_per_s": round(input_bytes / (1024 * 1024) / seconds, 3) if seconds else None,
+        **measured,
+    }
+
+def _git_revision():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+        dirty = bool(subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"],
+                                             text=True, stderr=subprocess.DEVNULL).strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the document processors and the upload path.")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for the size of every input (default: 1)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case (default: 3)")
+    parser.add_argument("--only", default="", help="Comma-separated case names or groups (pdf, csv, word, powerpoint, website, upload)")
+    parser.add_argument("--output", default="", help="Write the JSON results to this file (default: stdout)")
+    # Internal: run one case with already generated input in this process
+    parser.add_argument("--measure", default="", help=argparse.SUPPRESS)
+    parser.add_argument("--input-dir", default="", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.measure:
+        print(json.dumps(_measure(args.measure, args.input_dir, args.repeat, os.environ["DOCUMENT_STORE_DIR"])))
+        return
+
+    selected = [name.strip() for name in args.only.split(",") if name.strip()]
+    names = [name for name, case in CASES.items() if not selected or name in selected or case[0] in selected]
+    if not names:
+        parser.error(f"no benchmark case matches {args.only!r}; cases: {', '.join(CASES)}")
+
+    work_dir = tempfile.mkdtemp(prefix="docbot-bench-")
+    # Measure the processors, not the caches in front of them
+    os.environ.update({
+        "DEBUG": "False",
+        "EXTRACTION_CACHE_ENABLED": "False",
+        "RESPONSE_CACHE_BACKEND": "none",
+        "HISTORY_SUMMARY_ENABLED": "False",
+        "DOCUMENT_STORE_DIR": os.path.join(work_dir, "store"),
+        "TABLE_STORE_DIR": os.path.join(work_dir, "store", "tables"),
+        "UPLOAD_JOB_DB_PATH": os.path.join(work_dir, "upload_jobs.db"),
+    })
+
+    commit, dirty = _git_revision()
+    results = []
+    try:
+        for name in names:
+            print(f"Running {name}...", file=sys.stderr, flush=True)
+            result = run_case(name, args.scale, args.repeat, work_dir)
+            print(f"  {result['seconds']:.3f}s, {result['units_per_s']} {result['unit']}/s, "
+                  f"{result['mb_per_s']} MB/s, peak RSS {result['peak_rss_mb']} MB", file=sys.stderr, flush=True)
+            results.append(result)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "version": RESULTS_VERSION,
+        "commit": commit,
+        "dirty": dirty,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "scale": args.scale,
+        "repeat": args.repeat,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Measure how long a worker takes to start, as a JSON report.
+
+Each measurement runs in a fresh interpreter with python -X importtime:
+
+    import_app  - importing the app, i.e. booting a worker (without preload)
+    warm_up     - app.warm_up() after that: importing the processors, Azure
+                  SDKs and NumPy and loading the tokenizer. With
+                  GUNICORN_PRELOAD the master pays this once before forking;
+                  otherwise each worker pays it on its first requests
+
+The report lists the median times, the peak RSS, and the modules with the
+largest cumulative import time. Its "results" can be compared with
+benchmarks.compare like the processor benchmarks:
+
+    python -m benchmarks.startup --output startup.json
+    python -m benchmarks.compare base-startup.json startup.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.run import _git_revision
+
+RESULTS_VERSION = 1
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child interpreter; prints the phase timings as JSON
+MEASURE_SCRIPT = """
+import json, resource, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+warm_up = None
+if sys.argv[1] == "warm_up" and hasattr(app, "warm_up"):
+    app.warm_up()
+    warm_up = time.perf_counter() - imported
+print(json.dumps({
+    "import_app": imported - started,
+    "warm_up": warm_up,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+"""
+
+
+def parse_importtime(text):
+    """
+    Parse the output of python -X importtime.
+
+    Returns:
+        dict: Module name -> (self microseconds, cumulative microseconds)
+    """
+    modules = {}
+    for line in text.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+def measure(phase, work_dir):
+    """
+    Start the app in a fresh interpreter.
+
+    Args:
+        phase (str): import_app or warm_up
+        work_dir (str): Working directory of the child (it creates session and store files)
+
+    Returns:
+        tuple: (timings dict from MEASURE_SCRIPT, parsed importtime output)
+    """
+    env = dict(os.environ, PYTHONPATH=REPO_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", MEASURE_SCRIPT, phase],
+                               cwd=work_dir, env=env, capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1]), parse_importtime(completed.stderr)
+
+def run_phase(phase, repeat, work_dir, top):
+    """
+    Measure one phase --repeat times.
+
+    Returns:
+        dict: Result with the median time, the peak RSS and the slowest imports of the median run,
+            or None if the revision has no such phase (app.warm_up() before it was added)
+    """
+    runs = [measure(phase, work_dir) for _ in range(repeat)]
+    if runs[0][0][phase] is None:
+        return None
+    runs.sort(key=lambda run: run[0][phase])
+    timings, modules = runs[len(runs) // 2]
+    if phase == "warm_up":
+        # Only the modules imported by warm_up() itself
+        baseline = measure("import_app", work_dir)[1]
+        modules = {name: times for name, times in modules.items() if name not in baseline}
+    slowest = sorted(modules.items(), key=lambda item: item[1][1], reverse=True)[:top]
+    return {
+        "name": f"startup_{phase}",
+        "seconds": round(statistics.median(run[0][phase] for run in runs), 4),
+        "min_seconds": round(runs[0][0][phase], 4),
+        "peak_rss_mb": round(max(run[0]["peak_rss_mb"] for run in runs), 1),
+        "modules": len(modules),
+        "top_imports": [
+            {"module": name, "self_ms": round(self_us / 1000, 1), "cumulative_ms": round(cumulative_us / 1000, 1)}
+            for name, (self_us, cumulative_us) in slowest
+        ],
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the worker startup and warm-up time.")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per phase (default: 5)")
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports listed per phase (default: 15)")
+    parser.add_argument("--output", default="", help="Write the JSON report to this file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="docbot-startup-")
+    # The same settings as the processor benchmarks, with stores in the work directory
+    os.environ.update({
+        "DEBUG": "False",
+        "EXTRACTION_CACHE_ENABLED": "False",
+        "RESPONSE_CACHE_BACKEND": "none",
+        "HISTORY_SUMMARY_ENABLED": "False",
+        "METRICS_ENABLED": "False",
+        "DOCUMENT_STORE_DIR": os.path.join(work_dir, "store"),
+        "TABLE_STORE_DIR": os.path.join(work_dir, "store", "tables"),
+        "UPLOAD_JOB_DB_PATH": os.path.join(work_dir, "upload_jobs.db"),
+    })
+
+    commit, dirty = _git_revision()
+    results = []
+    try:
+        for phase in ("import_app", "warm_up"):
+            print(f"Measuring {phase}...", file=sys.stderr, flush=True)
+            result = run_phase(phase, args.repeat, work_dir, args.top)
+            if result is None:
+                print("  Not available in this revision", file=sys.stderr)
+                continue
+            print(f"  {result['seconds'] * 1000:.0f} ms (min {result['min_seconds'] * 1000:.0f} ms), "
+                  f"{result['modules']} modules, peak RSS {result['peak_rss_mb']} MB", file=sys.stderr)
+            for module in result["top_imports"][:5]:
+                print(f"    {module['cumulative_ms']:>8.1f} ms  {module['module']}", file=sys.stderr)
+            results.append(result)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "version": RESULTS_VERSION,
+        "commit": commit,
+        "dirty": dirty,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,13 @@ document.addEventListener('DOMContentLoaded', function() {
     // Check if debug mode is enabled (passed from the server)
     const DEBUG = document.documentElement.getAttribute('data-debug') === 'True';
     
+    // Stream chat responses token by token when the server and browser support it
+    const STREAMING = document.documentElement.getAttribute('data-streaming') !== 'False' &&
+        typeof ReadableStream !== 'undefined' && typeof TextDecoder !== 'undefined';
+    
+    // Milliseconds between progress checks of a background upload job
+    const UPLOAD_POLL_INTERVAL = 1000;
+    
     // Debug logging function
     function debugLog(message) {
         if (DEBUG) {
@@ -25,11 +32,13 @@ document.addEventListener('DOMContentLoaded', function() {
     const fileList = document.getElementById('file-list');
     const resourcesBar = document.getElementById('resources-bar');
     const clearMessagesBtn = document.getElementById('clear-history-btn');
+    const crawlWebsitesCheckbox = document.getElementById('crawl-websites');
     
     // Track uploaded resources
     let selectedFiles = new Map(); // Using Map to track selected files
     let uploadedWebsites = [];
     let uploadedFiles = [];
+    let liveResources = []; // Resources of the server-side corpus, with their IDs
     
     debugLog("DOM elements initialized");
     
@@ -396,6 +405,7 @@ document.addEventListener('DOMContentLoaded', function() {
             // Store uploaded resources info
             uploadedFiles = files.map(file => file.name);
             uploadedWebsites = [...validUrls];
+            liveResources = []; // The upload replaces the corpus
             
             debugLog(`Processing upload with ${files.length} files and ${validUrls.length} URLs`);
             
@@ -416,6 +426,7 @@ document.addEventListener('DOMContentLoaded', function() {
             // Add filenames and website URLs as metadata
             formData.append('filenames', JSON.stringify(uploadedFiles));
             formData.append('websiteUrls', JSON.stringify(uploadedWebsites));
+            formData.append('crawlWebsites', crawlWebsitesCheckbox && crawlWebsitesCheckbox.checked ? 'true' : 'false');
             
             debugLog("Sending upload request to server");
             // Send to server
@@ -431,28 +442,10 @@ document.addEventListener('DOMContentLoaded', function() {
             const result = await response.json();
             debugLog(`Upload response received: ${JSON.stringify(result)}`);
             
-            if (result.status === 'success') {
-                // Switch to chat interface
+            if (result.status === 'queued' && result.job_id) {
+                // Switch to chat interface; documents can be used as soon as each one is processed
                 showChatScreen();
-                
-                // Add system message with document details
-                if (result.resources) {
-                    addSystemMessage(result.resources);
-                } else if (files.length > 0 || validUrls.length > 0) {
-                    // Fallback if server doesn't provide formatted message
-                    const filesList = uploadedFiles.length > 0 
-                        ? `Files: ${uploadedFiles.join(', ')}` 
-                        : '';
-                    
-                    const websitesList = uploadedWebsites.length > 0 
-                        ? `Websites: ${uploadedWebsites.join(', ')}` 
-                        : '';
-                    
-                    const resourceList = [filesList, websitesList].filter(item => item).join('\n');
-                    addSystemMessage(`Processed resources:\n${resourceList}\n\nYou can now ask questions about their content.`);
-                } else {
-                    addSystemMessage("No documents uploaded. You can ask general questions.");
-                }
+                await pollUploadJob(result.job_id, files.length > 0 || validUrls.length > 0);
             } else {
                 throw new Error(result.message || 'Failed to process files/websites');
             }
@@ -463,6 +456,157 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
+    /**
+     * Poll an upload job, showing per-file progress until it has finished
+     */
+    async function pollUploadJob(jobId, hasResources) {
+        const progressBubble = hasResources ? addSystemMessage('Processing uploaded resources...') : null;
+        
+        while (true) {
+            await new Promise(resolve => setTimeout(resolve, UPLOAD_POLL_INTERVAL));
+            
+            const response = await fetch(`/api/upload/${jobId}`);
+            if (!response.ok) {
+                throw new Error(`Server responded with status ${response.status}`);
+            }
+            
+            const job = await response.json();
+            debugLog(`Upload job ${jobId}: ${job.status} (${job.completed}/${job.total})`);
+            if (progressBubble) progressBubble.textContent = formatUploadProgress(job);
+            
+            if (job.status === 'queued' || job.status === 'running') continue;
+            
+            if (progressBubble) progressBubble.parentNode.remove();
+            
+            if (job.status === 'done') {
+                if (hasResources) {
+                    addSystemMessage(job.resources || `Processed resources:\n${job.items.map(item => item.source).join('\n')}\n\nYou can now ask questions about their content.`);
+                } else {
+                    addSystemMessage("No documents uploaded. You can ask general questions.");
+                }
+            } else if (job.status === 'failed') {
+                addSystemMessage('Processing the uploaded resources failed. Please try uploading them again.', true);
+            }
+            
+            // Report the items that could not be processed
+            job.items.filter(item => item.status === 'error').forEach(item => {
+                addSystemMessage(`Could not process ${item.source}.`, true);
+            });
+            await refreshResources();
+            return;
+        }
+    }
+    
+    /**
+     * Load the resources of the session's corpus and update the resources bar
+     */
+    async function refreshResources() {
+        try {
+            const response = await fetch('/api/resources');
+            if (!response.ok) {
+                throw new Error(`Server responded with status ${response.status}`);
+            }
+            
+            const result = await response.json();
+            liveResources = result.resources.concat(result.pending);
+            uploadedFiles = liveResources.filter(resource => resource.kind === 'file').map(resource => resource.source);
+            uploadedWebsites = liveResources.filter(resource => resource.kind === 'website').map(resource => resource.source);
+            updateResourcesBar();
+        } catch (error) {
+            console.error('Error loading resources:', error);
+            debugLog(`ERROR in refreshResources: ${error.message}`);
+        }
+    }
+    
+    /**
+     * Add files to the current corpus without reprocessing the existing resources
+     */
+    async function addResourceFiles(files) {
+        try {
+            if (!files.length) return;
+            
+            const formData = new FormData();
+            files.forEach(file => formData.append('files', file));
+            formData.append('filenames', JSON.stringify(files.map(file => file.name)));
+            
+            debugLog(`Adding ${files.length} files to the corpus`);
+            const response = await fetch('/api/resources', {
+                method: 'POST',
+                body: formData
+            });
+            const result = await response.json();
+            if (!response.ok || result.status !== 'queued') {
+                throw new Error(result.message || `Server responded with status ${response.status}`);
+            }
+            
+            liveResources = liveResources.concat(result.resources);
+            uploadedFiles = uploadedFiles.concat(files.map(file => file.name));
+            updateResourcesBar();
+            await pollUploadJob(result.job_id, true);
+        } catch (error) {
+            console.error('Add resources error:', error);
+            debugLog(`ERROR in addResourceFiles: ${error.message}`);
+            addSystemMessage(`Error adding files: ${error.message}`, true);
+        }
+    }
+    
+    /**
+     * Remove one file or website from the current corpus
+     */
+    async function removeResource(resource) {
+        try {
+            const response = await fetch(`/api/resources/${encodeURIComponent(resource.id)}`, {
+                method: 'DELETE'
+            });
+            const result = await response.json();
+            if (!response.ok) {
+                throw new Error(result.message || `Server responded with status ${response.status}`);
+            }
+            
+            debugLog(`Removed resource ${resource.id}`);
+            addSystemMessage(`${result.message}. It is no longer used to answer questions.`);
+            await refreshResources();
+        } catch (error) {
+            console.error('Remove resource error:', error);
+            debugLog(`ERROR in removeResource: ${error.message}`);
+            addSystemMessage(`Could not remove ${resource.source}: ${error.message}`, true);
+        }
+    }
+    
+    /**
+     * Create the button that removes a resource from the corpus
+     */
+    function createRemoveResourceButton(resource) {
+        const removeBtn = document.createElement('button');
+        removeBtn.type = 'button';
+        removeBtn.className = 'resource-remove-btn';
+        removeBtn.title = `Remove ${resource.source}`;
+        removeBtn.innerHTML = '<i class="fas fa-times"></i>';
+        removeBtn.addEventListener('click', () => removeResource(resource));
+        return removeBtn;
+    }
+    
+    /**
+     * Find the corpus resource shown as an item of the resources bar
+     */
+    function findLiveResource(kind, source, position) {
+        const matches = liveResources.filter(resource => resource.kind === kind && resource.source === source);
+        const earlier = (kind === 'file' ? uploadedFiles : uploadedWebsites).slice(0, position).filter(name => name === source).length;
+        return matches[earlier] || null;
+    }
+    
+    /**
+     * Format the progress of an upload job for display
+     */
+    function formatUploadProgress(job) {
+        const lines = [`Processing uploaded resources (${job.completed} of ${job.total} done). Finished documents can already be used in the chat.`];
+        job.items.forEach(item => {
+            const elapsed = item.elapsed !== undefined ? ` (${item.elapsed}s)` : '';
+            lines.push(`- ${item.source}: ${item.status}${elapsed}`);
+        });
+        return lines.join('\n');
+    }
+    
     /**
      * Handle chat submission
      */
@@ -481,6 +625,12 @@ document.addEventListener('DOMContentLoaded', function() {
             // Add user message
             addUserMessage(query);
             
+            // Stream the answer unless this is the clear command
+            if (STREAMING && query.toLowerCase() !== 'clear') {
+                await streamChatResponse(query);
+                return;
+            }
+            
             debugLog("Sending chat request to server");
             const response = await fetch('/api/chat', {
                 method: 'POST',
@@ -495,11 +645,14 @@ document.addEventListener('DOMContentLoaded', function() {
             }
             
             const result = await response.json();
-            debugLog("Chat response received from server");
+            debugLog(`Chat response received from server (cached: ${result.cached})`);
             
             // Add assistant's response
             if (result.response) {
-                addBotMessage(result.response);
+                const bubble = addBotMessage(result.response);
+                if (query.toLowerCase() !== 'clear') {
+                    addRegenerateButton(query, bubble);
+                }
             }
             
             // Handle clear command
@@ -514,6 +667,139 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
+    /**
+     * Send a chat query to the streaming endpoint and render the answer as it arrives.
+     * When regenerating, the new answer replaces the text of the existing bubble.
+     */
+    async function streamChatResponse(query, regenerate = false, bubble = null) {
+        debugLog("Sending streaming chat request to server");
+        const response = await fetch('/api/chat/stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream'
+            },
+            body: JSON.stringify({ query, regenerate })
+        });
+        
+        if (!response.ok || !response.body) {
+            throw new Error(`Server responded with status ${response.status}`);
+        }
+        
+        bubble = bubble || addBotMessage('');
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let text = '';
+        let renderPending = false;
+        
+        // Re-render at most once per animation frame while tokens arrive
+        const render = () => {
+            renderPending = false;
+            if (!bubble) return;
+            try {
+                bubble.innerHTML = marked.parse(text);
+            } catch (markdownError) {
+                bubble.textContent = text;
+            }
+            scrollToBottom();
+        };
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            
+            buffer += decoder.decode(value, { stream: true });
+            
+            // Server-Sent Events frames are separated by a blank line
+            const frames = buffer.split('\n\n');
+            buffer = frames.pop();
+            
+            frames.forEach(frame => {
+                const data = frame.split('\n')
+                    .filter(line => line.startsWith('data: '))
+                    .map(line => line.slice(6))
+                    .join('\n');
+                if (!data) return;
+                
+                const event = JSON.parse(data);
+                if (event.type === 'delta') {
+                    text += event.content;
+                } else if (event.type === 'done') {
+                    text = event.response;
+                    debugLog(`Streaming chat response complete (cached: ${event.cached})`);
+                }
+                
+                if (!renderPending) {
+                    renderPending = true;
+                    requestAnimationFrame(render);
+                }
+            });
+        }
+        
+        render();
+        addRegenerateButton(query, bubble);
+    }
+    
+    /**
+     * Ask the server for a new answer to the last question and show it in place of the old one
+     */
+    async function regenerateResponse(query, bubble) {
+        try {
+            debugLog(`Regenerating response for query: ${query}`);
+            bubble.textContent = '';
+            
+            if (STREAMING) {
+                await streamChatResponse(query, true, bubble);
+                return;
+            }
+            
+            const response = await fetch('/api/chat', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify({ query, regenerate: true })
+            });
+            
+            if (!response.ok) {
+                throw new Error(`Server responded with status ${response.status}`);
+            }
+            
+            const result = await response.json();
+            try {
+                bubble.innerHTML = marked.parse(result.response || '');
+            } catch (markdownError) {
+                bubble.textContent = result.response || '';
+            }
+            addRegenerateButton(query, bubble);
+            scrollToBottom();
+        } catch (error) {
+            console.error('Regenerate error:', error);
+            debugLog(`ERROR in regenerateResponse: ${error.message}`);
+            addSystemMessage(`Error: ${error.message}`, true);
+        }
+    }
+    
+    /**
+     * Show a regenerate button under the latest answer (only the latest answer can be regenerated)
+     */
+    function addRegenerateButton(query, bubble) {
+        if (!bubble || !bubble.parentNode || !chatHistory) return;
+        
+        chatHistory.querySelectorAll('.regenerate-btn').forEach(button => button.remove());
+        
+        const button = document.createElement('button');
+        button.type = 'button';
+        button.className = 'regenerate-btn';
+        button.innerHTML = '<i class="fas fa-redo"></i> Regenerate';
+        button.addEventListener('click', function() {
+            button.remove();
+            regenerateResponse(query, bubble);
+        });
+        bubble.parentNode.appendChild(button);
+    }
+    
     /**
      * Clear chat and return to welcome screen
      */
@@ -603,7 +889,7 @@ document.addEventListener('DOMContentLoaded', function() {
     }
     
     /**
-     * Add a bot message to the chat
+     * Add a bot message to the chat and return its bubble element
      */
     function addBotMessage(text) {
         try {
@@ -631,6 +917,7 @@ document.addEventListener('DOMContentLoaded', function() {
             chatHistory.appendChild(message);
             
             scrollToBottom();
+            return bubble;
         } catch (error) {
             console.error('Error adding bot message:', error);
             debugLog(`ERROR in addBotMessage: ${error.message}`);
@@ -668,6 +955,7 @@ document.addEventListener('DOMContentLoaded', function() {
             chatHistory.appendChild(message);
             
             scrollToBottom();
+            return bubble;
         } catch (error) {
             console.error('Error adding system message:', error);
             debugLog(`ERROR in addSystemMessage: ${error.message}`);
@@ -781,11 +1069,13 @@ document.addEventListener('DOMContentLoaded', function() {
                 filesList.className = 'resource-files-list';
                 
                 // Add each file as a separate tag-like item
-                uploadedFiles.forEach(file => {
+                uploadedFiles.forEach((file, position) => {
                     const fileItem = document.createElement('li');
                     fileItem.className = 'resource-file-item';
                     fileItem.title = file; // Add full filename as tooltip
                     fileItem.textContent = file;
+                    const resource = findLiveResource('file', file, position);
+                    if (resource) fileItem.appendChild(createRemoveResourceButton(resource));
                     filesList.appendChild(fileItem);
                 });
                 
@@ -812,7 +1102,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 websitesList.className = 'resource-files-list';
                 
                 // Add each website as a separate tag-like item
-                uploadedWebsites.forEach(url => {
+                uploadedWebsites.forEach((url, position) => {
                     const websiteItem = document.createElement('li');
                     websiteItem.className = 'resource-file-item';
                     websiteItem.title = url; // Add full URL as tooltip
@@ -825,6 +1115,8 @@ document.addEventListener('DOMContentLoaded', function() {
                         websiteItem.textContent = url;
                     }
                     
+                    const resource = findLiveResource('website', url, position);
+                    if (resource) websiteItem.appendChild(createRemoveResourceButton(resource));
                     websitesList.appendChild(websiteItem);
                 });
                 
@@ -832,6 +1124,22 @@ document.addEventListener('DOMContentLoaded', function() {
                 resourcesBar.appendChild(websitesContainer);
             }
             
+            // Button to add files to the current corpus
+            const addFilesInput = document.createElement('input');
+            addFilesInput.type = 'file';
+            addFilesInput.multiple = true;
+            addFilesInput.accept = fileUpload ? fileUpload.accept : '';
+            addFilesInput.style.display = 'none';
+            addFilesInput.addEventListener('change', () => addResourceFiles(Array.from(addFilesInput.files)));
+            
+            const addFilesBtn = document.createElement('button');
+            addFilesBtn.type = 'button';
+            addFilesBtn.className = 'resource-add-btn';
+            addFilesBtn.innerHTML = '<i class="fas fa-plus"></i> Add files';
+            addFilesBtn.addEventListener('click', () => addFilesInput.click());
+            resourcesBar.appendChild(addFilesInput);
+            resourcesBar.appendChild(addFilesBtn);
+            
             // If no resources, hide the bar
             if ((uploadedFiles?.length || 0) === 0 && (uploadedWebsites?.length || 0) === 0) {
                 resourcesBar.style.display = 'none';
@@ -0,0 +1,70 @@
+"""
+Background asyncio event loop shared by the synchronous Flask workers.
+
+Async clients (and their connection pools) are bound to the event loop they
+were created on, so running each batch with asyncio.run() would throw the
+pool away every time. Instead every worker process runs one long-lived loop
+on a daemon thread and submits coroutines to it.
+
+The loop's default executor, which runs the blocking calls made from it
+(asyncio.to_thread(), and every request of the Document Intelligence
+client's AsyncioRequestsTransport), has a thread for each of the
+DOC_INTELLIGENCE_MAX_IN_FLIGHT analyze jobs plus EXECUTOR_SPARE_THREADS,
+so the configured number of jobs really runs at once.
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from docaiapp.utils.config import DEBUG, get_settings
+
+# Executor threads beyond one per Document Intelligence job, for the other blocking calls
+EXECUTOR_SPARE_THREADS = 8
+
+_lock = threading.Lock()
+_loop = None
+_loop_pid = None
+
+def debug_log(message):
+    if DEBUG:
+        print(f"DEBUG [Async Runtime]: {message}")
+
+def get_loop():
+    """
+    Return the background event loop for this process, starting it if needed.
+
+    Returns:
+        asyncio.AbstractEventLoop: Running event loop
+    """
+    global _loop, _loop_pid
+
+    if _loop is None or _loop_pid != os.getpid():
+        with _lock:
+            if _loop is None or _loop_pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                threads = get_settings().document_intelligence_max_in_flight + EXECUTOR_SPARE_THREADS
+                loop.set_default_executor(ThreadPoolExecutor(max_workers=threads, thread_name_prefix="async-runtime"))
+                thread = threading.Thread(target=loop.run_forever, name="async-runtime", daemon=True)
+                thread.start()
+                _loop, _loop_pid = loop, os.getpid()
+                debug_log(f"Started background event loop for process {_loop_pid}")
+    return _loop
+
+def run(coroutine, timeout=None):
+    """
+    Run a coroutine on the background loop and wait for its result.
+
+    Args:
+        coroutine: Coroutine to run
+        timeout (float): Seconds to wait before cancelling it
+
+    Returns:
+        The coroutine's result
+    """
+    future = asyncio.run_coroutine_threadsafe(coroutine, get_loop())
+    try:
+        return future.result(timeout)
+    except BaseException:
+        future.cancel()
+        raise
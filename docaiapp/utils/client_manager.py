@@ -0,0 +1,402 @@
+"""
+Client manager that creates the Azure OpenAI and Document Intelligence clients
+once per worker process and reuses them, so every request shares a warm
+HTTP keep-alive pool instead of paying for a new TLS handshake.
+
+Calls made through the manager are retried on throttling (429), server
+errors (5xx) and connection failures with jittered exponential backoff that
+honours the Retry-After headers sent by Azure.
+"""
+
+import asyncio
+import email.utils
+import io
+import os
+import random
+import threading
+import time
+from docaiapp.utils.config import DEBUG, env_float, env_int, get_settings
+from docaiapp.utils import metrics
+
+# Connection pool settings
+POOL_MAX_CONNECTIONS = env_int("HTTP_POOL_MAX_CONNECTIONS", 20, minimum=1)
+POOL_MAX_KEEPALIVE = env_int("HTTP_POOL_MAX_KEEPALIVE", 10, minimum=1)
+# The async client serves all chat requests of an ASGI worker at once
+ASYNC_POOL_MAX_CONNECTIONS = env_int("HTTP_ASYNC_POOL_MAX_CONNECTIONS", 500, minimum=1)
+REQUEST_TIMEOUT = env_float("AZURE_REQUEST_TIMEOUT", 120)
+
+# Retry settings
+RETRY_MAX_ATTEMPTS = env_int("RETRY_MAX_ATTEMPTS", 5, minimum=1)
+RETRY_BASE_DELAY = env_float("RETRY_BASE_DELAY", 0.5)
+RETRY_MAX_DELAY = env_float("RETRY_MAX_DELAY", 30)
+
+RETRYABLE_STATUS_CODES = frozenset([408, 429, 500, 502, 503, 504])
+
+def debug_log(message):
+    if DEBUG:
+        print(f"DEBUG [Client Manager]: {message}")
+
+def _is_connection_error(error):
+    """Return True for transport failures that are safe to retry."""
+    import httpx
+    import requests
+    from openai import APIConnectionError
+    from azure.core.exceptions import ServiceRequestError, ServiceResponseError
+    return isinstance(error, (APIConnectionError, ServiceRequestError, ServiceResponseError,
+                              httpx.TransportError, requests.ConnectionError))
+
+def _pooled_session():
+    """Return a requests session with a keep-alive pool sized like the other clients."""
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_MAX_KEEPALIVE, pool_maxsize=POOL_MAX_CONNECTIONS)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def _retry_after(error):
+    """
+    Read the delay requested by the server from a failed response.
+
+    Args:
+        error (Exception): Error raised by the OpenAI or Azure SDK
+
+    Returns:
+        float: Delay in seconds, or None if the server did not ask for one
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        retry_date = email.utils.parsedate_to_datetime(retry_after)
+        return max(0.0, retry_date.timestamp() - time.time()) if retry_date else None
+
+def call_with_retry(func, *args, **kwargs):
+    """
+    Call an Azure SDK function, retrying throttled and transient failures.
+
+    The delay before attempt n is drawn uniformly from
+    [0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** n)] ("full jitter"), unless
+    the server sent Retry-After, in which case that delay is used. If the
+    server asks for a longer wait than RETRY_MAX_DELAY the error is raised
+    instead of blocking the worker.
+
+    Args:
+        func (callable): Function to call
+        *args: Positional arguments for func
+        **kwargs: Keyword arguments for func
+
+    Returns:
+        The return value of func
+    """
+    for attempt in range(1, RETRY_MAX_ATTEMPTS + 1):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            delay = _retry_delay(e, attempt)
+            if delay is None:
+                raise
+            metrics.AZURE_RETRIES.labels(metrics.error_type(e)).inc()
+            time.sleep(delay)
+
+async def async_call_with_retry(func, *args, **kwargs):
+    """
+    Await an async Azure SDK function, retrying like call_with_retry().
+
+    Args:
+        func (callable): Coroutine function to call
+        *args: Positional arguments for func
+        **kwargs: Keyword arguments for func
+
+    Returns:
+        The result of func
+    """
+    for attempt in range(1, RETRY_MAX_ATTEMPTS + 1):
+        try:
+            return await func(*args, **kwargs)
+        except Exception as e:
+            delay = _retry_delay(e, attempt)
+            if delay is None:
+                raise
+            metrics.AZURE_RETRIES.labels(metrics.error_type(e)).inc()
+            await asyncio.sleep(delay)
+
+def _retry_delay(error, attempt):
+    """
+    Decide whether a failed attempt is retried.
+
+    Args:
+        error (Exception): Error raised by the attempt
+        attempt (int): Number of the attempt that failed (1-based)
+
+    Returns:
+        float: Seconds to wait before the next attempt, or None to raise the error
+    """
+    status_code = getattr(error, "status_code", None)
+    retryable = status_code in RETRYABLE_STATUS_CODES or (status_code is None and _is_connection_error(error))
+    if not retryable or attempt == RETRY_MAX_ATTEMPTS:
+        return None
+
+    delay = _retry_after(error)
+    if delay is None:
+        delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+    elif delay > RETRY_MAX_DELAY:
+        debug_log(f"Server asked to retry after {delay:.1f}s, giving up")
+        return None
+
+    debug_log(f"Attempt {attempt} failed ({status_code or type(error).__name__}), retrying in {delay:.2f}s")
+    return delay
+
+
+class ClientManager:
+    """
+    Holds one Azure OpenAI client and one Document Intelligence client per process.
+
+    Clients are created lazily on first use. After a fork (e.g. gunicorn with
+    preload) the child process discards the inherited clients, because their
+    pooled sockets belong to the parent.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._pid = os.getpid()
+
+    def _get(self, name, factory):
+        if self._pid != os.getpid():
+            self._lock = threading.Lock()
+            self._clients = {}
+            self._pid = os.getpid()
+
+        client = self._clients.get(name)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(name)
+                if client is None:
+                    debug_log(f"Creating {name} client for process {self._pid}")
+                    client = factory()
+                    self._clients[name] = client
+        return client
+
+    def get_openai_client(self):
+        """
+        Return the process-wide Azure OpenAI client.
+
+        Returns:
+            AzureOpenAI: Client with a keep-alive connection pool
+        """
+        def create():
+            import httpx
+            from openai import AzureOpenAI, DefaultHttpxClient
+            settings = get_settings()
+            return AzureOpenAI(
+                azure_endpoint=settings.openai_endpoint,
+                api_key=settings.openai_api_key,
+                api_version=settings.openai_api_version,
+                # Retries are handled by call_with_retry
+                max_retries=0,
+                timeout=REQUEST_TIMEOUT,
+                http_client=DefaultHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=POOL_MAX_CONNECTIONS,
+                        max_keepalive_connections=POOL_MAX_KEEPALIVE
+                    )
+                )
+            )
+        return self._get("openai", create)
+
+    def get_async_openai_client(self):
+        """
+        Return the process-wide asynchronous Azure OpenAI client.
+
+        Use it on the event loop that serves the ASGI app (see asgi.py); its
+        connection pool is bound to that loop.
+
+        Returns:
+            AsyncAzureOpenAI: Client with a keep-alive connection pool
+        """
+        def create():
+            import httpx
+            from openai import AsyncAzureOpenAI, DefaultAsyncHttpxClient
+            settings = get_settings()
+            return AsyncAzureOpenAI(
+                azure_endpoint=settings.openai_endpoint,
+                api_key=settings.openai_api_key,
+                api_version=settings.openai_api_version,
+                # Retries are handled by async_call_with_retry
+                max_retries=0,
+                timeout=REQUEST_TIMEOUT,
+                http_client=DefaultAsyncHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=ASYNC_POOL_MAX_CONNECTIONS,
+                        max_keepalive_connections=POOL_MAX_KEEPALIVE
+                    )
+                )
+            )
+        return self._get("openai_async", create)
+
+    def get_document_intelligence_client(self):
+        """
+        Return the process-wide Document Intelligence client.
+
+        Returns:
+            DocumentIntelligenceClient: Client with a keep-alive connection pool
+        """
+        def create():
+            from azure.core.credentials import AzureKeyCredential
+            from azure.core.pipeline.transport import RequestsTransport
+            from azure.ai.documentintelligence import DocumentIntelligenceClient
+
+            settings = get_settings()
+            session = _pooled_session()
+
+            return DocumentIntelligenceClient(
+                endpoint=settings.document_intelligence_endpoint,
+                credential=AzureKeyCredential(settings.document_intelligence_api_key),
+                transport=RequestsTransport(session=session, session_owner=False,
+                                            read_timeout=REQUEST_TIMEOUT),
+                # Retries are handled by call_with_retry
+                retry_total=0
+            )
+        return self._get("document_intelligence", create)
+
+    def get_async_document_intelligence_client(self):
+        """
+        Return the process-wide asynchronous Document Intelligence client.
+
+        Use it on the background event loop (see async_runtime). The transport
+        is not asynchronous I/O: each request runs on the same kind of pooled
+        requests session as the synchronous client, on a thread of the loop's
+        default executor, which async_runtime sizes to
+        DOC_INTELLIGENCE_MAX_IN_FLIGHT.
+
+        Returns:
+            azure.ai.documentintelligence.aio.DocumentIntelligenceClient: Async client
+        """
+        def create():
+            from azure.core.credentials import AzureKeyCredential
+            from azure.core.pipeline.transport import AsyncioRequestsTransport
+            from azure.ai.documentintelligence.aio import DocumentIntelligenceClient
+
+            settings = get_settings()
+            session = _pooled_session()
+
+            return DocumentIntelligenceClient(
+                endpoint=settings.document_intelligence_endpoint,
+                credential=AzureKeyCredential(settings.document_intelligence_api_key),
+                transport=AsyncioRequestsTransport(session=session, session_owner=False,
+                                                   read_timeout=REQUEST_TIMEOUT),
+                # Retries are handled by async_call_with_retry
+                retry_total=0
+            )
+        return self._get("document_intelligence_async", create)
+
+    def chat_completion(self, messages, deployment_name=None, **kwargs):
+        """
+        Create a chat completion with retries.
+
+        Args:
+            messages (list): Chat completion messages
+            deployment_name (str): Model deployment (defaults to AZURE_OPENAI_DEPLOYMENT_NAME)
+            **kwargs: Extra arguments for chat.completions.create (max_tokens, temperature, stream, ...)
+
+        Returns:
+            The completion, or a stream of completion chunks when stream=True
+        """
+        deployment_name = deployment_name or get_settings().openai_deployment
+        client = self.get_openai_client()
+        return call_with_retry(client.chat.completions.create, model=deployment_name, messages=messages, **kwargs)
+
+    async def chat_completion_async(self, messages, deployment_name=None, **kwargs):
+        """
+        Create a chat completion with the async client, with retries.
+
+        Args:
+            messages (list): Chat completion messages
+            deployment_name (str): Model deployment (defaults to AZURE_OPENAI_DEPLOYMENT_NAME)
+            **kwargs: Extra arguments for chat.completions.create (max_tokens, temperature, stream, ...)
+
+        Returns:
+            The completion, or an async stream of completion chunks when stream=True
+        """
+        deployment_name = deployment_name or get_settings().openai_deployment
+        client = self.get_async_openai_client()
+        return await async_call_with_retry(client.chat.completions.create, model=deployment_name,
+                                           messages=messages, **kwargs)
+
+    def create_embeddings(self, texts, deployment_name=None):
+        """
+        Embed a batch of texts with retries.
+
+        Args:
+            texts (list): Texts to embed
+            deployment_name (str): Embedding deployment (defaults to AZURE_OPENAI_EMBEDDING_DEPLOYMENT)
+
+        Returns:
+            The embeddings response
+        """
+        deployment_name = deployment_name or get_settings().embedding_deployment
+        client = self.get_openai_client()
+        return call_with_retry(client.embeddings.create, model=deployment_name, input=texts)
+
+    def analyze_document(self, document_stream, model_id="prebuilt-layout", **kwargs):
+        """
+        Analyze a document with Document Intelligence and wait for the result.
+
+        Submitting the job is retried; the stream is rewound before every attempt.
+
+        Args:
+            document_stream (io.BytesIO): Document content
+            model_id (str): Document Intelligence model
+            **kwargs: Extra arguments for begin_analyze_document (output_content_format, pages, ...)
+
+        Returns:
+            AnalyzeResult: The analysis result
+        """
+        client = self.get_document_intelligence_client()
+
+        def begin():
+            document_stream.seek(0)
+            return client.begin_analyze_document(model_id, body=document_stream, **kwargs)
+
+        poller = call_with_retry(begin)
+        return poller.result()
+
+    async def analyze_document_async(self, data, model_id="prebuilt-layout", **kwargs):
+        """
+        Analyze a document with the async Document Intelligence client and wait for the result.
+
+        Args:
+            data (bytes): Document content
+            model_id (str): Document Intelligence model
+            **kwargs: Extra arguments for begin_analyze_document (output_content_format, polling, ...)
+
+        Returns:
+            AnalyzeResult: The analysis result
+        """
+        client = self.get_async_document_intelligence_client()
+
+        async def begin():
+            return await client.begin_analyze_document(model_id, body=io.BytesIO(data), **kwargs)
+
+        poller = await async_call_with_retry(begin)
+        return await poller.result()
+
+
+# Process-wide client manager
+client_manager = ClientManager()
@@ -0,0 +1,213 @@
+"""
+Settings read from the environment (and .env) once per process.
+
+Every module of the app reads its settings through the env_* helpers below
+(env_str() for names, paths and URLs) instead of calling os.getenv()
+itself, so .env is loaded exactly once and a malformed value ("ture",
+"20s") stops the worker at startup with a ConfigError naming the variable,
+instead of being read as False or failing mid-request. Only
+gunicorn.conf.py, which runs before the app is imported, sets
+PROMETHEUS_MULTIPROC_DIR in the environment directly.
+Settings used across modules (Azure endpoints, processing mode, serving
+mode) are collected in the cached Settings object from get_settings().
+
+check_dependencies() verifies at startup that the packages needed by the
+configured features are installed; nothing is installed at runtime.
+"""
+
+import importlib.util
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TRUE_VALUES = ("true", "1", "t", "yes", "y", "on")
+FALSE_VALUES = ("false", "0", "f", "no", "n", "off", "")
+
+
+class ConfigError(ValueError):
+    """
+    An environment variable has a value that cannot be used.
+    """
+
+
+def env_str(name, default=None):
+    """Return a string setting, or the default if it is not set."""
+    return os.getenv(name, default)
+
+def env_bool(name, default=False):
+    """
+    Return a boolean setting.
+
+    Args:
+        name (str): Environment variable
+        default (bool): Value if the variable is not set
+
+    Returns:
+        bool: The parsed value
+
+    Raises:
+        ConfigError: If the value is not one of the true/false spellings
+    """
+    value = os.getenv(name)
+    if value is None:
+        return default
+    normalized = value.strip().lower()
+    if normalized in TRUE_VALUES:
+        return True
+    if normalized in FALSE_VALUES:
+        return False
+    raise ConfigError(f"{name} must be true or false, got {value!r}")
+
+def _number(name, default, parse, minimum):
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    try:
+        number = parse(value.strip())
+    except ValueError:
+        raise ConfigError(f"{name} must be a number, got {value!r}") from None
+    if minimum is not None and number < minimum:
+        raise ConfigError(f"{name} must be at least {minimum}, got {value!r}")
+    return number
+
+def env_int(name, default, minimum=None):
+    """
+    Return an integer setting.
+
+    Args:
+        name (str): Environment variable
+        default (int): Value if the variable is not set
+        minimum (int): Smallest allowed value
+
+    Returns:
+        int: The parsed value
+
+    Raises:
+        ConfigError: If the value is not an integer or below the minimum
+    """
+    return _number(name, default, int, minimum)
+
+def env_float(name, default, minimum=None):
+    """Return a float setting; like env_int()."""
+    return _number(name, default, float, minimum)
+
+def env_choice(name, default, choices):
+    """
+    Return a setting that must be one of a few lower-case values.
+
+    Raises:
+        ConfigError: If the value is not one of the choices
+    """
+    value = os.getenv(name, default).strip().lower()
+    if value not in choices:
+        raise ConfigError(f"{name} must be one of {', '.join(choices)}, got {value!r}")
+    return value
+
+
+DEBUG = env_bool("DEBUG")
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Settings shared by several modules.
+    """
+
+    debug: bool
+    doc_intelligent: bool
+    chat_streaming: bool
+    server_mode: str
+    session_backend: str
+    openai_endpoint: str
+    openai_api_key: str
+    openai_api_version: str
+    openai_deployment: str
+    embedding_deployment: str
+    document_intelligence_endpoint: str
+    document_intelligence_api_key: str
+    document_intelligence_max_in_flight: int
+
+    @property
+    def openai_configured(self):
+        return bool(self.openai_endpoint and self.openai_api_key and self.openai_deployment)
+
+@lru_cache(maxsize=None)
+def get_settings():
+    """
+    Return the settings of this process, read from the environment on first use.
+
+    Returns:
+        Settings: The validated settings
+    """
+    return Settings(
+        debug=DEBUG,
+        doc_intelligent=env_bool("DOC_INTELLIGENT", True),
+        chat_streaming=env_bool("CHAT_STREAMING", True),
+        server_mode=env_choice("SERVER_MODE", "sync", ("sync", "async")),
+        session_backend=env_choice("SESSION_BACKEND", "sqlite", ("sqlite", "redis")),
+        openai_endpoint=env_str("AZURE_OPENAI_ENDPOINT"),
+        openai_api_key=env_str("AZURE_OPENAI_API_KEY"),
+        openai_api_version=env_str("AZURE_OPENAI_API_VERSION", "2023-05-15"),
+        openai_deployment=env_str("AZURE_OPENAI_DEPLOYMENT_NAME"),
+        embedding_deployment=env_str("AZURE_OPENAI_EMBEDDING_DEPLOYMENT"),
+        document_intelligence_endpoint=env_str("AZURE_DOCUMENT_INTELLIGENCE_ENDPOINT"),
+        document_intelligence_api_key=env_str("AZURE_DOCUMENT_INTELLIGENCE_API_KEY"),
+        document_intelligence_max_in_flight=env_int("DOC_INTELLIGENCE_MAX_IN_FLIGHT", 8, minimum=1),
+    )
+
+
+# Packages needed by each feature: (module to find, pip package)
+REQUIRED_PACKAGES = {
+    "chat": [("openai", "openai")],
+    "pdf": [("fitz", "pymupdf")],
+    "document_intelligence": [("azure.ai.documentintelligence", "azure-ai-documentintelligence")],
+    "word": [("docx", "python-docx")],
+    "powerpoint": [("pptx", "python-pptx")],
+    "websites": [("httpx", "httpx"), ("lxml", "lxml")],
+    "retrieval": [("numpy", "numpy")],
+    "async": [("uvicorn", "uvicorn"), ("a2wsgi", "a2wsgi")],
+    "redis_sessions": [("redis", "redis")],
+}
+
+def _installed(module):
+    try:
+        return importlib.util.find_spec(module) is not None
+    except ModuleNotFoundError:
+        return False
+
+def check_dependencies(settings=None):
+    """
+    Check that the packages needed by the configured features are installed,
+    without importing them.
+
+    Args:
+        settings (Settings): Settings to check (defaults to get_settings())
+
+    Returns:
+        list: pip package names that are missing
+    """
+    settings = settings or get_settings()
+    features = ["chat", "pdf", "websites", "retrieval"]
+    # Word and PowerPoint files go to Document Intelligence in intelligent mode
+    features += ["document_intelligence"] if settings.doc_intelligent else ["word", "powerpoint"]
+    if settings.server_mode == "async":
+        features.append("async")
+    if settings.session_backend == "redis":
+        features.append("redis_sessions")
+    return sorted({package for feature in features for module, package in REQUIRED_PACKAGES[feature]
+                   if not _installed(module)})
+
+def require_dependencies(settings=None):
+    """
+    Raise at startup if packages needed by the configured features are missing.
+
+    Raises:
+        RuntimeError: Naming the missing packages
+    """
+    missing = check_dependencies(settings)
+    if missing:
+        raise RuntimeError(f"Missing packages for the configured features: {', '.join(missing)}. "
+                           f"Install them with: pip install -r requirements.txt")
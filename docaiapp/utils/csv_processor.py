@@ -1,83 +1,273 @@
 import io
 import csv
 import os
-from dotenv import load_dotenv
+from collections import Counter
+import numpy as np
 from werkzeug.datastructures import FileStorage
+from docaiapp.utils.config import DEBUG, env_int
+from docaiapp.utils.table_store import get_table_store, sql_identifier, table_id
 
-# Load environment variables and set up debug functionality
-load_dotenv()
-DEBUG = os.getenv("DEBUG", "False").lower() in ["true", "1", "t", "yes", "y"]
+# CSVs with at most this many rows are included in full, larger ones as a profile and sample
+CSV_TABLE_MAX_ROWS = env_int("CSV_TABLE_MAX_ROWS", 100)
+CSV_SAMPLE_ROWS = env_int("CSV_SAMPLE_ROWS", 20)
+# Reading stops after this many rows or bytes
+CSV_MAX_ROWS = env_int("CSV_MAX_ROWS", 1000000)
+CSV_MAX_BYTES = env_int("CSV_MAX_BYTES", 200 * 1024 * 1024)
+
+# Rows profiled per vectorized batch
+BATCH_ROWS = 5000
+# Only the start of long cells is used for statistics (the stored rows keep the full value)
+PROFILE_VALUE_CHARS = 200
+TOP_VALUES = 3
+DISTINCT_LIMIT = 10000
+
+NULL_VALUES = ("", "na", "n/a", "null", "none", "nan", "-")
+BOOLEAN_VALUES = ("true", "false", "yes", "no")
+
+# Bump when the extracted output changes so cached extractions are not reused
+PROCESSOR_VERSION = f"2:{CSV_TABLE_MAX_ROWS}:{CSV_SAMPLE_ROWS}:{CSV_MAX_ROWS}:{CSV_MAX_BYTES}"
 
 def debug_log(message):
     if DEBUG:
         print(f"DEBUG [CSV Processor]: {message}")
 
+
+class ColumnProfile:
+    """
+    Running statistics for one CSV column, updated one batch of values at a time.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.nulls = 0
+        # Types the column can still be; narrowed as batches rule them out
+        self.candidates = {"integer", "float", "boolean", "date"}
+        self.minimum = None
+        self.maximum = None
+        self.total = 0.0
+        self.numeric_count = 0
+        self.values = Counter()
+        self.distinct_overflow = False
+
+    def update(self, values):
+        """
+        Add a batch of raw values.
+
+        Args:
+            values (numpy.ndarray): String array of cell values
+        """
+        self.count += len(values)
+        cleaned = np.char.strip(values)
+        null = np.isin(np.char.lower(cleaned), NULL_VALUES)
+        self.nulls += int(null.sum())
+        present = cleaned[~null]
+        if len(present) == 0:
+            return
+
+        self._update_counts(present)
+
+        if self.candidates & {"integer", "float"}:
+            try:
+                numbers = present.astype(np.float64)
+            except ValueError:
+                self.candidates -= {"integer", "float"}
+            else:
+                self.candidates -= {"boolean", "date"}
+                if "integer" in self.candidates and not np.all(np.isfinite(numbers) & (numbers == np.floor(numbers))):
+                    self.candidates.discard("integer")
+                self._update_range(numbers.min(), numbers.max())
+                self.total += float(numbers.sum())
+                self.numeric_count += len(numbers)
+                return
+
+        if "boolean" in self.candidates and not np.all(np.isin(np.char.lower(present), BOOLEAN_VALUES)):
+            self.candidates.discard("boolean")
+
+        if "date" in self.candidates:
+            try:
+                dates = present.astype("datetime64[s]")
+            except ValueError:
+                self.candidates.discard("date")
+                self.minimum = self.maximum = None
+            else:
+                self._update_range(dates.min(), dates.max())
+
+    def _update_range(self, low, high):
+        self.minimum = low if self.minimum is None else min(self.minimum, low)
+        self.maximum = high if self.maximum is None else max(self.maximum, high)
+
+    def _update_counts(self, present):
+        uniques, counts = np.unique(present, return_counts=True)
+        self.values.update(dict(zip(uniques.tolist(), counts.tolist())))
+        if len(self.values) > 2 * DISTINCT_LIMIT:
+            # Keep the most frequent values so top values stay approximately right
+            self.distinct_overflow = True
+            self.values = Counter(dict(self.values.most_common(DISTINCT_LIMIT)))
+
+    @property
+    def type(self):
+        if self.nulls == self.count:
+            return "empty"
+        for column_type in ("integer", "float", "boolean", "date"):
+            if column_type in self.candidates:
+                return column_type
+        return "text"
+
+    def summary_row(self):
+        """Render the column's statistics as cells of the schema table."""
+        column_type = self.type
+        null_rate = f"{100 * self.nulls / self.count:.1f}%" if self.count else "-"
+        distinct = f"> {DISTINCT_LIMIT}" if self.distinct_overflow or len(self.values) > DISTINCT_LIMIT else str(len(self.values))
+
+        minimum = maximum = mean = "-"
+        if column_type in ("integer", "float") and self.numeric_count:
+            minimum, maximum = _format_number(self.minimum), _format_number(self.maximum)
+            mean = _format_number(self.total / self.numeric_count)
+        elif column_type == "date" and self.minimum is not None:
+            minimum, maximum = str(self.minimum).replace("T00:00:00", ""), str(self.maximum).replace("T00:00:00", "")
+
+        top = ", ".join(f"{_cell(value)} ({count})" for value, count in self.values.most_common(TOP_VALUES))
+        return [_cell(self.name), column_type, null_rate, distinct, minimum, maximum, mean, top or "-"]
+
+
+def _format_number(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() and abs(value) < 1e15 else f"{value:.4g}"
+
+def _cell(value):
+    """Make a value safe to place in a markdown table cell."""
+    return str(value).replace("|", "\\|").replace("\n", " ")
+
+def _markdown_table(header, rows):
+    lines = ["| " + " | ".join(header) + " |", "| " + " | ".join("---" for _ in header) + " |"]
+    lines.extend("| " + " | ".join(row) + " |" for row in rows)
+    return "\n".join(lines)
+
+def _open_text(file_obj):
+    """Return (text stream, underlying byte stream or None, file bytes or None) for a CSV upload."""
+    if isinstance(file_obj, io.StringIO):
+        return file_obj, None, file_obj.getvalue().encode('utf-8')
+    if isinstance(file_obj, FileStorage):
+        data = file_obj.read()
+        file_obj.close()
+    elif isinstance(file_obj, io.BytesIO):
+        data = file_obj.getvalue()
+    else:
+        data = file_obj
+    raw = io.BytesIO(data)
+    return io.TextIOWrapper(raw, encoding='utf-8-sig', errors='replace', newline=''), raw, data
+
 def process_csv(file_obj):
     """
-    Process a CSV file and convert its content to a markdown table for better LLM understanding.
-    
+    Process a CSV file into a compact markdown description for better LLM understanding.
+
+    Rows are read in batches and profiled with vectorized per-column statistics
+    (type, null rate, distinct count, min/max/mean, top values). Small files are
+    included as a full markdown table; larger ones as the column profile and a
+    sample of rows. All rows are written to the table store for lookup.
+
     Args:
         file_obj: File object from request.files
-        
+
     Returns:
-        str: CSV content converted to markdown table format
+        str: Markdown with the column profile and the rows or a sample of them
     """
-    debug_log(f"Processing CSV file: {getattr(file_obj, 'filename', 'Unnamed CSV')}")
-    
+    filename = getattr(file_obj, 'filename', 'Unnamed CSV')
+    debug_log(f"Processing CSV file: {filename}")
+
+    writer = None
     try:
-        # Get the file content
-        if isinstance(file_obj, FileStorage):
-            csv_bytes = file_obj.read()
-            file_obj.close()
-            csv_stream = io.StringIO(csv_bytes.decode('utf-8'))
-        else:
-            # If it's already a bytes object or StringIO
-            if isinstance(file_obj, io.BytesIO):
-                csv_stream = io.StringIO(file_obj.getvalue().decode('utf-8'))
-            elif isinstance(file_obj, io.StringIO):
-                csv_stream = file_obj
-            else:
-                csv_stream = io.StringIO(file_obj.decode('utf-8'))
-        
-        # Parse CSV
-        csv_stream.seek(0)
-        reader = csv.reader(csv_stream)
-        
-        # Get header and rows
-        rows = list(reader)
-        
-        if not rows:
+        text_stream, raw_stream, data = _open_text(file_obj)
+        text_stream.seek(0)
+        reader = csv.reader(text_stream)
+
+        header = next(reader, None)
+        if not header:
             debug_log("CSV file is empty")
             return "CSV file is empty"
-        
-        header = rows[0]
-        data_rows = rows[1:]
-        
+        header = [name.strip() for name in header]
+        width = len(header)
+
+        profiles = [ColumnProfile(name) for name in header]
+        table_name = None
+        try:
+            store = get_table_store()
+            stored_id = table_id(data)
+            if store.exists(stored_id):
+                # The same file was uploaded before
+                table_name = store.describe(stored_id)["name"]
+            else:
+                writer = store.create(stored_id, sql_identifier(os.path.splitext(filename)[0], "table"), header, filename)
+                table_name = writer.table_name
+        except Exception as e:
+            debug_log(f"ERROR opening table store, rows will not be stored: {str(e)}")
+
+        sample = []
+        row_count = 0
+        truncated = False
+        batch = []
+
+        def flush():
+            if not batch:
+                return
+            columns = zip(*batch)
+            for profile, values in zip(profiles, columns):
+                profile.update(np.array([value[:PROFILE_VALUE_CHARS] for value in values], dtype=str))
+            if writer is not None:
+                writer.add_rows(batch)
+            batch.clear()
+
+        for row in reader:
+            if not row:
+                continue
+            # Pad short rows and trim long ones to match header length
+            row = row[:width] + [''] * (width - len(row))
+            batch.append(row)
+            if len(sample) < max(CSV_SAMPLE_ROWS, CSV_TABLE_MAX_ROWS + 1):
+                sample.append(row)
+            row_count += 1
+
+            if len(batch) >= BATCH_ROWS:
+                flush()
+                if raw_stream is not None and raw_stream.tell() > CSV_MAX_BYTES:
+                    truncated = True
+                    break
+            if row_count >= CSV_MAX_ROWS:
+                truncated = next(reader, None) is not None
+                break
+        flush()
+
+        if writer is not None:
+            writer.finish([profile.type for profile in profiles], NULL_VALUES)
+            writer = None
+        table_note = f" The full data is stored as table `{table_name}`." if table_name else ""
+
         # Initialize markdown content
-        content = f"# CSV Data: {getattr(file_obj, 'filename', 'Unnamed CSV')}\n\n"
-        
-        # Build markdown table header
-        table_header = "| " + " | ".join(header) + " |"
-        separator = "| " + " | ".join(["---" for _ in header]) + " |"
-        
-        # Build table rows
-        table_rows = []
-        for row in data_rows:
-            # Pad short rows to match header length
-            padded_row = row + [''] * (len(header) - len(row))
-            table_rows.append("| " + " | ".join(padded_row) + " |")
-        
-        # Combine all parts of the markdown table
-        markdown_table = "\n".join([table_header, separator] + table_rows)
-        
-        # Add table to content
-        content += markdown_table + "\n\n"
-        
+        parts = [f"# CSV Data: {filename}\n\n"]
+
+        schema_header = ["Column", "Type", "Nulls", "Distinct", "Min", "Max", "Mean", "Top values"]
+        parts.append("## Columns\n\n" + _markdown_table(schema_header, [p.summary_row() for p in profiles]) + "\n\n")
+
+        if row_count <= CSV_TABLE_MAX_ROWS:
+            parts.append("## Rows\n\n")
+            shown = sample[:row_count]
+        else:
+            parts.append(f"## Sample rows (first {CSV_SAMPLE_ROWS} of {row_count})\n\n")
+            shown = sample[:CSV_SAMPLE_ROWS]
+        parts.append(_markdown_table([_cell(name) for name in header], [[_cell(v) for v in row] for row in shown]) + "\n\n")
+
         # Add a summary
-        content += f"\nTable summary: {len(data_rows)} rows and {len(header)} columns of data.\n"
-        
-        debug_log(f"CSV processing complete: converted to markdown table with {len(data_rows)} rows")
+        parts.append(f"\nTable summary: {row_count} rows and {width} columns of data.{table_note}\n")
+        if truncated:
+            parts.append(f"Only the first {row_count} rows were read; the file is larger than the configured limits.\n")
+
+        content = "".join(parts)
+        debug_log(f"CSV processing complete: profiled {row_count} rows, {len(content)} characters")
         return content.strip()
     except Exception as e:
         debug_log(f"ERROR processing CSV: {str(e)}")
         return f"Error processing CSV: {str(e)}"
+    finally:
+        if writer is not None:
+            writer.abort()
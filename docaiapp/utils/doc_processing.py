@@ -1,23 +1,211 @@
+import asyncio
 import io
-import os
-from dotenv import load_dotenv
+import statistics
+import threading
+import time
+from collections import deque
+import fitz  # PyMuPDF
 from werkzeug.datastructures import FileStorage
 
-from azure.core.credentials import AzureKeyCredential
-from azure.ai.documentintelligence import DocumentIntelligenceClient
-from azure.ai.documentintelligence.models import AnalyzeDocumentRequest, DocumentContentFormat, AnalyzeResult
+from azure.ai.documentintelligence.models import DocumentContentFormat
+from azure.core.polling.async_base_polling import AsyncLROBasePolling
+from docaiapp.utils.config import DEBUG, env_bool, env_float, env_int, get_settings
+from docaiapp.utils import async_runtime, metrics
+from docaiapp.utils.client_manager import client_manager
 
 
-load_dotenv()
-DEBUG = os.getenv("DEBUG", "False").lower() in ["true", "1", "t", "yes", "y"]
+# Analyze documents with the async client, splitting long PDFs into page ranges
+DI_ASYNC = env_bool("DOC_INTELLIGENCE_ASYNC", True)
+# Analyze jobs running at the same time in one worker process
+DI_MAX_IN_FLIGHT = get_settings().document_intelligence_max_in_flight
+DI_PAGES_PER_JOB = env_int("DOC_INTELLIGENCE_PAGES_PER_JOB", 50, minimum=1)
+DI_POLL_MIN_INTERVAL = env_float("DOC_INTELLIGENCE_POLL_MIN_INTERVAL", 0.5)
+DI_POLL_MAX_INTERVAL = env_float("DOC_INTELLIGENCE_POLL_MAX_INTERVAL", 5)
+DI_TIMEOUT = env_float("DOC_INTELLIGENCE_TIMEOUT", 600)
+
+# Growth of the polling interval while a job keeps running
+POLL_BACKOFF = 1.5
+# The first status check is made after this share of the expected job duration
+FIRST_POLL_FRACTION = 0.75
+# Completed jobs kept for latency statistics
+JOB_HISTORY = 500
+
+# Bump when the extracted output changes so cached extractions are not reused
+PROCESSOR_VERSION = "2"
+
+_jobs = deque(maxlen=JOB_HISTORY)
+_jobs_lock = threading.Lock()
+_in_flight = 0
+_semaphores = {}
 
 def debug_log(message):
     if DEBUG:
         print(f"DEBUG [Document Processor]: {message}")
 
+
+class AdaptivePolling(AsyncLROBasePolling):
+    """
+    Polls an analyze job on a schedule fitted to its size.
+
+    The first status check waits for most of the time a job of this many
+    pages took recently; after that the interval starts at
+    DI_POLL_MIN_INTERVAL and grows up to DI_POLL_MAX_INTERVAL. Short jobs
+    are picked up quickly and long ones are not polled needlessly often.
+    """
+
+    def __init__(self, pages, **kwargs):
+        super().__init__(**kwargs)
+        expected = expected_duration(pages)
+        self._next_delay = DI_POLL_MIN_INTERVAL if expected is None else min(
+            DI_POLL_MAX_INTERVAL, max(DI_POLL_MIN_INTERVAL, expected * FIRST_POLL_FRACTION))
+        self._interval = DI_POLL_MIN_INTERVAL
+        self.polls = 0
+
+    def _extract_delay(self):
+        delay = self._next_delay
+        self._next_delay = self._interval
+        self._interval = min(DI_POLL_MAX_INTERVAL, self._interval * POLL_BACKOFF)
+        self.polls += 1
+        return delay
+
+
+def record_job(pages, queued, elapsed, polls):
+    """
+    Record the latency of a completed analyze job.
+
+    Args:
+        pages (int): Pages in the job
+        queued (float): Seconds spent waiting for an in-flight slot
+        elapsed (float): Seconds from submission to result
+        polls (int): Number of status checks
+    """
+    with _jobs_lock:
+        _jobs.append((pages, queued, elapsed, polls))
+    metrics.DOCUMENT_INTELLIGENCE_SECONDS.labels("queue").observe(queued)
+    metrics.DOCUMENT_INTELLIGENCE_SECONDS.labels("analyze").observe(elapsed)
+    debug_log(f"Analyzed {pages} pages in {elapsed:.2f}s ({polls} polls, queued {queued:.2f}s)")
+
+def expected_duration(pages):
+    """
+    Estimate how long an analyze job takes from recent jobs.
+
+    Args:
+        pages (int): Pages in the job
+
+    Returns:
+        float: Expected seconds, or None before any job has completed
+    """
+    with _jobs_lock:
+        jobs = list(_jobs)[-50:]
+    if not jobs:
+        return None
+    seconds_per_page = sum(elapsed for _, _, elapsed, _ in jobs) / max(1, sum(p for p, _, _, _ in jobs))
+    return seconds_per_page * max(1, pages)
+
+def get_job_stats():
+    """
+    Summarize the latency of recent analyze jobs in this process, for tuning
+    DOC_INTELLIGENCE_MAX_IN_FLIGHT and DOC_INTELLIGENCE_PAGES_PER_JOB against
+    the Azure quota.
+
+    Returns:
+        dict: jobs, in_flight, pages, p50/p95/max seconds, mean queue wait,
+        seconds per page and polls per job
+    """
+    with _jobs_lock:
+        jobs = list(_jobs)
+    stats = {"jobs": len(jobs), "in_flight": _in_flight}
+    if not jobs:
+        return stats
+
+    latencies = sorted(elapsed for _, _, elapsed, _ in jobs)
+    pages = sum(p for p, _, _, _ in jobs)
+    stats.update({
+        "pages": pages,
+        "p50_seconds": round(statistics.median(latencies), 3),
+        "p95_seconds": round(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 3),
+        "max_seconds": round(latencies[-1], 3),
+        "mean_queue_seconds": round(sum(queued for _, queued, _, _ in jobs) / len(jobs), 3),
+        "seconds_per_page": round(sum(latencies) / max(1, pages), 3),
+        "polls_per_job": round(sum(polls for _, _, _, polls in jobs) / len(jobs), 1),
+    })
+    return stats
+
+def split_pages(data):
+    """
+    Split a long PDF into documents of at most DI_PAGES_PER_JOB pages.
+
+    Args:
+        data (bytes): Document content
+
+    Returns:
+        list: (page count, bytes) for each part, in page order; a single part
+        for short PDFs and for other document types
+    """
+    if not data.startswith(b"%PDF"):
+        return [(1, data)]
+
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        page_count = len(doc)
+        if page_count <= DI_PAGES_PER_JOB:
+            return [(page_count, data)]
+
+        parts = []
+        for first in range(0, page_count, DI_PAGES_PER_JOB):
+            last = min(first + DI_PAGES_PER_JOB, page_count) - 1
+            with fitz.open() as part:
+                part.insert_pdf(doc, from_page=first, to_page=last)
+                parts.append((last - first + 1, part.tobytes(garbage=1)))
+    return parts
+
+def _get_semaphore():
+    """Return the in-flight limit of the background event loop."""
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        _semaphores.clear()
+        semaphore = _semaphores[loop] = asyncio.Semaphore(DI_MAX_IN_FLIGHT)
+    return semaphore
+
+async def _analyze_part(pages, data):
+    """Analyze one part of a document once an in-flight slot is free."""
+    global _in_flight
+
+    waiting = time.monotonic()
+    async with _get_semaphore():
+        started = time.monotonic()
+        _in_flight += 1
+        try:
+            polling = AdaptivePolling(pages)
+            result = await client_manager.analyze_document_async(
+                data, output_content_format=DocumentContentFormat.MARKDOWN, polling=polling)
+        except Exception as e:
+            metrics.record_error("document_intelligence", e)
+            raise
+        finally:
+            _in_flight -= 1
+    record_job(pages, started - waiting, time.monotonic() - started, polling.polls)
+    return result
+
+async def analyze_document(data):
+    """
+    Analyze a document, splitting long PDFs into page ranges that are analyzed
+    concurrently and stitched back together in page order.
+
+    Args:
+        data (bytes): Document content
+
+    Returns:
+        tuple: (markdown content, number of pages)
+    """
+    parts = split_pages(data)
+    if len(parts) > 1:
+        debug_log(f"Analyzing {sum(p for p, _ in parts)} pages in {len(parts)} parallel jobs")
+    results = await asyncio.gather(*(_analyze_part(pages, part) for pages, part in parts))
+    content = "\n\n".join(result.content for result in results if result.content)
+    return content, sum(len(result.pages or []) for result in results)
+
 def process_document(file_obj):
-        endpoint = os.getenv("AZURE_DOCUMENT_INTELLIGENCE_ENDPOINT")
-        credential = os.getenv("AZURE_DOCUMENT_INTELLIGENCE_API_KEY")
         file_name = "Undefined"
 
         try:
@@ -33,22 +221,25 @@ def process_document(file_obj):
             file_name = getattr(file_obj, 'filename', 'Unnamed Document')
             debug_log(f"Processing document: {file_name}")
 
-            # Check if the file is empty
-            # Create a Document Intelligence client
-            client = DocumentIntelligenceClient(endpoint=endpoint, credential=AzureKeyCredential(credential))
-            poller = client.begin_analyze_document("prebuilt-layout", body=pdf_stream,output_content_format=DocumentContentFormat.MARKDOWN)
-            doc_result = poller.result()
+            if DI_ASYNC:
+                # Jobs from all requests in this process share the in-flight limit
+                doc_content, page_count = async_runtime.run(analyze_document(pdf_stream.getvalue()), DI_TIMEOUT)
+            else:
+                # Analyze with the shared Document Intelligence client
+                with metrics.timed(metrics.DOCUMENT_INTELLIGENCE_SECONDS, "analyze"):
+                    doc_result = client_manager.analyze_document(pdf_stream, output_content_format=DocumentContentFormat.MARKDOWN)
+                doc_content, page_count = doc_result.content, len(doc_result.pages)
+
+            debug_log(f"Document {file_name} opened successfully with {page_count} pages")
+            debug_log(f"File processing complete: {len(doc_content)} characters extracted")
 
-            debug_log(f"Document {file_name} opened successfully with {len(doc_result.pages)} pages")
-            debug_log(f"File processing complete: {len(doc_result.content)} characters extracted")
-        
             # Initialize document content
             content = f"# Document: {getattr(file_obj, 'filename', 'Unnamed Document')}\n\n"
-        
-            
-            content += f"## Contents \n\n{doc_result.content}\n\n"
+
+
+            content += f"## Contents \n\n{doc_content}\n\n"
             return content.strip()
-            
+
         except Exception as e:
             debug_log(f"ERROR processing {file_name}: {str(e)}")
             #print(e.with_traceback())
@@ -0,0 +1,740 @@
+"""
+On-disk store for processed documents and retrieval indexes.
+
+Chat requests used to load the whole extracted corpus from the user's
+session. Instead, every processed document is written once to a
+content-addressed file of individually compressed chunks, and the retrieval
+index for a set of uploads (a "corpus") is saved next to it. The session
+only keeps the corpus ID. Answering a question loads the index (usually from
+the per-process cache) and decompresses just the chunks that were selected,
+reading them through a memory map.
+
+Adding or removing one resource does not rewrite the corpus index: the
+small index built for the new resource (or the removal) is appended to the
+corpus's change log, and loading the index applies the log to the saved
+snapshot. Once the log is larger than the snapshot, both are folded into a
+new snapshot, so the cost of a change stays proportional to the change.
+
+Chunks are compressed with zstd when the optional zstandard package is
+installed, otherwise with zlib.
+
+The store is swept in the background at most once per
+DOCUMENT_STORE_SWEEP_INTERVAL: corpora that were not used for
+DOCUMENT_STORE_CORPUS_RETENTION seconds (their sessions have expired) are
+deleted, then the least recently used ones while the store is larger than
+DOCUMENT_STORE_MAX_BYTES, and finally every document no remaining corpus
+references.
+"""
+
+import hashlib
+import mmap
+import os
+import pickle
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from docaiapp.utils.config import DEBUG, env_int, env_str
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows; updates are then only serialized within a process
+    fcntl = None
+
+STORE_DIR = env_str("DOCUMENT_STORE_DIR", "document_store")
+INDEX_CACHE_SIZE = env_int("DOCUMENT_STORE_INDEX_CACHE_SIZE", 32)
+OPEN_FILES_LIMIT = env_int("DOCUMENT_STORE_OPEN_FILES", 128)
+# Corpora not used for this long are deleted by the sweep (0 keeps them)
+CORPUS_RETENTION = env_int("DOCUMENT_STORE_CORPUS_RETENTION", 14 * 24 * 60 * 60, minimum=0)
+# Size the sweep keeps the store under by deleting the least recently used corpora (0 for no limit)
+MAX_BYTES = env_int("DOCUMENT_STORE_MAX_BYTES", 0, minimum=0)
+# Seconds between sweeps (0 disables them)
+SWEEP_INTERVAL = env_int("DOCUMENT_STORE_SWEEP_INTERVAL", 60 * 60, minimum=0)
+# Files younger than this are never swept: a new document is stored before the index referencing it
+SWEEP_GRACE = 60 * 60
+# The last use of a corpus is recorded at most this often per process
+TOUCH_INTERVAL = 10 * 60
+
+# Document file layout: header, source name, chunk offset table, chunk blobs
+MAGIC = b"DOC1"
+HEADER = struct.Struct("<4sBxxxII")  # magic, codec, chunk count, source length
+LOG_RECORD = struct.Struct("<Q")  # length of the compressed record that follows
+CODEC_ZLIB = 0
+CODEC_ZSTD = 1
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def debug_log(message):
+    if DEBUG:
+        print(f"DEBUG [Document Store]: {message}")
+
+def _compressor():
+    if zstandard is not None:
+        return CODEC_ZSTD, zstandard.ZstdCompressor(level=3).compress
+    return CODEC_ZLIB, lambda data: zlib.compress(data, 6)
+
+def _decompressor(codec):
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Document was compressed with zstd but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress
+    return zlib.decompress
+
+def document_id(source, chunks):
+    """
+    Compute the content address of a chunked document.
+
+    Args:
+        source (str): Name of the file or website the content came from
+        chunks (list): Chunk objects of the document
+
+    Returns:
+        str: Hex document ID
+    """
+    digest = hashlib.sha256(source.encode("utf-8"))
+    for chunk in chunks:
+        _update_digest(digest, chunk)
+    return digest.hexdigest()[:32]
+
+def _update_digest(digest, chunk):
+    digest.update(b"\0")
+    digest.update(chunk.heading.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(chunk.text.encode("utf-8"))
+
+
+class DocumentStore:
+    """
+    Directory of compressed chunk files and pickled retrieval indexes.
+
+    Document files are written once (atomically) and never modified, so any
+    worker process can read them without locking. A corpus's index is a
+    snapshot file, replaced atomically, plus a log of the resources added
+    and removed since, appended to while an upload job is running; cached
+    indexes are checked against the snapshot's modification time and the
+    log's size. The modification time of a corpus's lock file records when
+    it was last used.
+    """
+
+    def __init__(self, root=None, index_cache_size=None):
+        self.root = root or STORE_DIR
+        self.index_cache_size = index_cache_size or INDEX_CACHE_SIZE
+        self._lock = threading.Lock()
+        self._maps = OrderedDict()
+        self._indexes = OrderedDict()
+        self._update_locks = {}
+        self._touched = {}
+        self._last_sweep = time.time()
+        os.makedirs(os.path.join(self.root, "documents"), exist_ok=True)
+        os.makedirs(os.path.join(self.root, "corpora"), exist_ok=True)
+
+    def _document_path(self, doc_id):
+        return os.path.join(self.root, "documents", doc_id[:2], f"{doc_id}.docs")
+
+    def _corpus_path(self, corpus_id):
+        return os.path.join(self.root, "corpora", f"{corpus_id}.index")
+
+    def _log_path(self, corpus_id):
+        return os.path.join(self.root, "corpora", f"{corpus_id}.log")
+
+    def _write_atomic(self, path, data):
+        """Write bytes, or call data(file) to write them, to a temporary file that then replaces path."""
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                if callable(data):
+                    data(f)
+                else:
+                    f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def put_document(self, source, chunks):
+        """
+        Store the chunks of a processed document.
+
+        Identical documents (same source name and chunks) share one file.
+
+        Args:
+            source (str): Name of the file or website the content came from
+            chunks (list): Chunk objects of the document
+
+        Returns:
+            str: Document ID
+        """
+        doc_id = document_id(source, chunks)
+        if self._reuse(doc_id, source):
+            return doc_id
+
+        codec, compress = _compressor()
+        blobs = [compress(f"{chunk.heading}\n{chunk.text}".encode("utf-8")) for chunk in chunks]
+        offsets = [0]
+        for blob in blobs:
+            offsets.append(offsets[-1] + len(blob))
+
+        source_bytes = source.encode("utf-8")
+        data = b"".join([
+            HEADER.pack(MAGIC, codec, len(blobs), len(source_bytes)),
+            source_bytes,
+            struct.pack(f"<{len(offsets)}Q", *offsets),
+            *blobs
+        ])
+        self._write_atomic(self._document_path(doc_id), data)
+        debug_log(f"Stored {source} as {doc_id}: {len(blobs)} chunks, {len(data)} bytes")
+        return doc_id
+
+    def write_document(self, source, chunks):
+        """
+        Store the chunks of a document as they are produced (e.g. while a
+        long PDF is extracted). Compressed chunks are spooled to a temporary
+        file, so only one chunk is held in memory at a time.
+
+        Args:
+            source (str): Name of the file or website the content came from
+            chunks (iterable): Chunk objects of the document, in order
+
+        Returns:
+            str: Document ID, the same put_document() returns for these chunks
+        """
+        codec, compress = _compressor()
+        digest = hashlib.sha256(source.encode("utf-8"))
+        offsets = [0]
+        spool_dir = os.path.join(self.root, "documents", "tmp")
+        os.makedirs(spool_dir, exist_ok=True)
+        fd, spool_path = tempfile.mkstemp(dir=spool_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w+b") as spool:
+                for chunk in chunks:
+                    _update_digest(digest, chunk)
+                    blob = compress(f"{chunk.heading}\n{chunk.text}".encode("utf-8"))
+                    spool.write(blob)
+                    offsets.append(offsets[-1] + len(blob))
+
+                doc_id = digest.hexdigest()[:32]
+                if self._reuse(doc_id, source):
+                    return doc_id
+
+                source_bytes = source.encode("utf-8")
+
+                def write(f):
+                    f.write(HEADER.pack(MAGIC, codec, len(offsets) - 1, len(source_bytes)))
+                    f.write(source_bytes)
+                    f.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+                    spool.seek(0)
+                    shutil.copyfileobj(spool, f)
+
+                self._write_atomic(self._document_path(doc_id), write)
+        finally:
+            os.unlink(spool_path)
+        debug_log(f"Stored {source} as {doc_id}: {len(offsets) - 1} chunks, {offsets[-1]} bytes of chunks")
+        return doc_id
+
+    def _reuse(self, doc_id, source):
+        """Return whether a document is already stored, marking it as used."""
+        path = self._document_path(doc_id)
+        try:
+            # Keeps the sweep from deleting it before the index that references it again is saved
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        debug_log(f"Document {source} already stored as {doc_id}")
+        return True
+
+    def _open(self, doc_id):
+        """Return (memory map, codec, chunk count, offset table position) for a document."""
+        with self._lock:
+            entry = self._maps.get(doc_id)
+            if entry is not None:
+                self._maps.move_to_end(doc_id)
+                return entry
+
+            with open(self._document_path(doc_id), "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, codec, count, source_length = HEADER.unpack_from(mapped, 0)
+            if magic != MAGIC:
+                mapped.close()
+                raise ValueError(f"Not a document file: {doc_id}")
+
+            entry = (mapped, codec, count, HEADER.size + source_length)
+            self._maps[doc_id] = entry
+            while len(self._maps) > OPEN_FILES_LIMIT:
+                # Not closed here: another thread may still be reading it. The map
+                # is closed when the last reader drops its reference.
+                self._maps.popitem(last=False)
+            return entry
+
+    def read_chunks(self, doc_id, ordinals):
+        """
+        Read and decompress selected chunks of a document.
+
+        Args:
+            doc_id (str): Document ID
+            ordinals (list): Positions of the chunks within the document
+
+        Returns:
+            list: (heading, text) tuples in the order of ordinals
+        """
+        entry = self._open(doc_id)
+        decompress = _decompressor(entry[1])
+        return [_read_chunk(entry, decompress, ordinal) for ordinal in ordinals]
+
+    def iter_chunks(self, doc_id):
+        """
+        Read all chunks of a document, one at a time.
+
+        Args:
+            doc_id (str): Document ID
+
+        Yields:
+            tuple: (heading, text) in stored order
+        """
+        entry = self._open(doc_id)
+        decompress = _decompressor(entry[1])
+        for ordinal in range(entry[2]):
+            yield _read_chunk(entry, decompress, ordinal)
+
+    def save_index(self, index, corpus_id=None):
+        """
+        Persist a retrieval index as the snapshot of its corpus, replacing
+        the change log (the index must include its changes, see read_index()).
+
+        Args:
+            index (BM25Index): Index whose chunks were stored with put_document()
+            corpus_id (str): ID to save under (a new ID is generated if omitted)
+
+        Returns:
+            str: Corpus ID
+        """
+        corpus_id = corpus_id or uuid.uuid4().hex
+        data = zlib.compress(pickle.dumps(index, protocol=pickle.HIGHEST_PROTOCOL), 1)
+        path = self._corpus_path(corpus_id)
+        self._write_atomic(path, data)
+        try:
+            os.unlink(self._log_path(corpus_id))
+        except FileNotFoundError:
+            pass
+        version = (os.stat(path).st_mtime_ns, 0)
+
+        with self._lock:
+            self._indexes[corpus_id] = (version, index)
+            self._indexes.move_to_end(corpus_id)
+            while len(self._indexes) > self.index_cache_size:
+                self._indexes.popitem(last=False)
+
+        debug_log(f"Saved index {corpus_id}: {len(index)} chunks, {len(data)} bytes")
+        self._touch(corpus_id)
+        self.maybe_sweep()
+        return corpus_id
+
+    def load_index(self, corpus_id):
+        """
+        Load a retrieval index, from the per-process cache when possible.
+
+        Args:
+            corpus_id (str): Corpus ID returned by save_index()
+
+        Returns:
+            BM25Index: The index, or None if it does not exist
+        """
+        if not corpus_id:
+            return None
+
+        try:
+            version = (os.stat(self._corpus_path(corpus_id)).st_mtime_ns, self._log_size(corpus_id))
+        except FileNotFoundError:
+            debug_log(f"Index {corpus_id} not found")
+            return None
+
+        self._touch(corpus_id)
+        with self._lock:
+            cached = self._indexes.get(corpus_id)
+            if cached is not None and cached[0] == version:
+                self._indexes.move_to_end(corpus_id)
+                return cached[1]
+
+        loaded = self._read(corpus_id)
+        if loaded is None:
+            debug_log(f"Index {corpus_id} not found")
+            return None
+        version, index = loaded
+
+        with self._lock:
+            self._indexes[corpus_id] = (version, index)
+            self._indexes.move_to_end(corpus_id)
+            while len(self._indexes) > self.index_cache_size:
+                self._indexes.popitem(last=False)
+        debug_log(f"Loaded index {corpus_id}: {len(index)} chunks")
+        return index
+
+    def read_index(self, corpus_id):
+        """
+        Load a private copy of a retrieval index for modification, bypassing
+        the cache (cached indexes are shared with concurrent chat requests).
+
+        Args:
+            corpus_id (str): Corpus ID returned by save_index()
+
+        Returns:
+            BM25Index: The index, or None if it does not exist
+        """
+        loaded = self._read(corpus_id)
+        return loaded[1] if loaded is not None else None
+
+    def _log_size(self, corpus_id):
+        try:
+            return os.stat(self._log_path(corpus_id)).st_size
+        except FileNotFoundError:
+            return 0
+
+    def _read(self, corpus_id):
+        """
+        Read a corpus's snapshot and apply its change log.
+
+        Returns:
+            tuple: (version, index), or None if the corpus does not exist
+        """
+        path = self._corpus_path(corpus_id)
+        while True:
+            try:
+                with open(path, "rb") as f:
+                    snapshot = os.fstat(f.fileno()).st_mtime_ns
+                    index = pickle.loads(zlib.decompress(f.read()))
+            except FileNotFoundError:
+                return None
+            try:
+                with open(self._log_path(corpus_id), "rb") as f:
+                    log = f.read()
+            except FileNotFoundError:
+                log = b""
+
+            offset = 0
+            while offset + LOG_RECORD.size <= len(log):
+                (length,) = LOG_RECORD.unpack_from(log, offset)
+                end = offset + LOG_RECORD.size + length
+                if end > len(log):
+                    # Still being appended
+                    break
+                action, value = pickle.loads(zlib.decompress(log[offset + LOG_RECORD.size:end]))
+                if action == "merge":
+                    index.merge(value)
+                else:
+                    index.remove_resource(value)
+                offset = end
+
+            try:
+                if os.stat(path).st_mtime_ns == snapshot:
+                    return (snapshot, offset), index
+            except FileNotFoundError:
+                return None
+            # The log was folded into a new snapshot meanwhile; its records may be missing here
+
+    def add_to_index(self, corpus_id, index):
+        """
+        Add the resources of a small index (e.g. one built for a single
+        upload) to a corpus by appending it to the corpus's change log.
+        Call it inside index_lock().
+
+        Args:
+            corpus_id (str): Corpus ID
+            index (BM25Index): Index of the new resources
+        """
+        if not os.path.exists(self._corpus_path(corpus_id)):
+            self.save_index(index, corpus_id)
+            return
+        self._append(corpus_id, ("merge", index))
+
+    def remove_from_index(self, corpus_id, resource_id):
+        """
+        Remove a resource from a corpus by appending the removal to the
+        corpus's change log. Call it inside index_lock().
+
+        Args:
+            corpus_id (str): Corpus ID
+            resource_id (str): ID of the resource to remove
+        """
+        self._append(corpus_id, ("remove", resource_id))
+
+    def _append(self, corpus_id, record):
+        data = zlib.compress(pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL), 1)
+        with open(self._log_path(corpus_id), "a+b") as f:
+            # Walk the record headers; a record cut short by a crash is dropped before appending
+            size = os.fstat(f.fileno()).st_size
+            start = 0
+            while start + LOG_RECORD.size <= size:
+                f.seek(start)
+                end = start + LOG_RECORD.size + LOG_RECORD.unpack(f.read(LOG_RECORD.size))[0]
+                if end > size:
+                    break
+                start = end
+            if start < size:
+                f.truncate(start)
+            try:
+                f.write(LOG_RECORD.pack(len(data)) + data)
+                f.flush()
+            except BaseException:
+                # A partial record would make the rest of the log unreadable
+                f.truncate(start)
+                raise
+            log_size = f.tell()
+        debug_log(f"Appended {record[0]} to index {corpus_id}: {len(data)} bytes")
+        self._touch(corpus_id)
+        if log_size > os.stat(self._corpus_path(corpus_id)).st_size:
+            self.save_index(self.read_index(corpus_id), corpus_id)
+
+    @contextmanager
+    def index_lock(self, corpus_id):
+        """
+        Serialize updates of a corpus index across threads and worker
+        processes. Use add_to_index(), remove_from_index(), or read_index()
+        and save_index() inside it.
+
+        Args:
+            corpus_id (str): Corpus ID
+        """
+        with self._lock:
+            thread_lock = self._update_locks.setdefault(corpus_id, threading.Lock())
+        with thread_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self._corpus_path(corpus_id) + ".lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _touch(self, corpus_id):
+        """Record that a corpus is in use, at most once per TOUCH_INTERVAL in this process."""
+        now = time.time()
+        with self._lock:
+            if now - self._touched.get(corpus_id, 0) < TOUCH_INTERVAL:
+                return
+            if len(self._touched) > 4096:
+                self._touched.clear()
+            self._touched[corpus_id] = now
+        path = self._corpus_path(corpus_id) + ".lock"
+        try:
+            with open(path, "a"):
+                pass
+            os.utime(path)
+        except OSError as e:
+            debug_log(f"ERROR recording the use of corpus {corpus_id}: {str(e)}")
+
+    def delete_index(self, corpus_id):
+        """
+        Delete a saved retrieval index. Its documents are kept, since other
+        corpora may share them; the next sweep deletes those no other corpus references.
+
+        Args:
+            corpus_id (str): Corpus ID returned by save_index()
+        """
+        if not corpus_id:
+            return
+        with self._lock:
+            self._indexes.pop(corpus_id, None)
+            self._update_locks.pop(corpus_id, None)
+            self._touched.pop(corpus_id, None)
+        for path in (self._corpus_path(corpus_id), self._log_path(corpus_id), self._corpus_path(corpus_id) + ".lock"):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def maybe_sweep(self):
+        """
+        Start sweep() on a background thread unless this store was swept
+        within SWEEP_INTERVAL, by any process.
+        """
+        now = time.time()
+        with self._lock:
+            if not SWEEP_INTERVAL or now - self._last_sweep < SWEEP_INTERVAL:
+                return
+            self._last_sweep = now
+        stamp = os.path.join(self.root, "sweep.stamp")
+        try:
+            if now - os.stat(stamp).st_mtime < SWEEP_INTERVAL:
+                return
+        except FileNotFoundError:
+            pass
+        with open(stamp, "a"):
+            pass
+        os.utime(stamp)
+        threading.Thread(target=self._sweep_in_background, name="document-store-sweep", daemon=True).start()
+
+    def _sweep_in_background(self):
+        try:
+            self.sweep()
+        except Exception as e:
+            debug_log(f"ERROR sweeping the document store: {str(e)}")
+
+    def _last_use(self, corpus_id):
+        """Return when a corpus was last saved or used, or None if it no longer exists."""
+        path = self._corpus_path(corpus_id)
+        try:
+            used = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+        try:
+            return max(used, os.stat(path + ".lock").st_mtime)
+        except FileNotFoundError:
+            return used
+
+    def _delete_unused(self, corpus_id, cutoff):
+        """Delete a corpus unless it was used after cutoff; returns whether it was deleted."""
+        with self.index_lock(corpus_id):
+            used = self._last_use(corpus_id)
+            if used is None or used > cutoff:
+                return False
+            self.delete_index(corpus_id)
+            return True
+
+    def sweep(self, now=None):
+        """
+        Delete expired and, above MAX_BYTES, least recently used corpora,
+        and the documents no remaining corpus references. Files younger than
+        SWEEP_GRACE are kept.
+
+        Args:
+            now (float): Current time (defaults to time.time())
+
+        Returns:
+            tuple: (deleted corpora, deleted documents, bytes freed)
+        """
+        now = now or time.time()
+        recent = now - SWEEP_GRACE
+
+        corpora = {}
+        corpora_dir = os.path.join(self.root, "corpora")
+        for name in os.listdir(corpora_dir):
+            path = os.path.join(corpora_dir, name)
+            try:
+                if name.endswith(".tmp") and os.stat(path).st_mtime < recent:
+                    # Left behind by a process that died while writing
+                    os.unlink(path)
+                elif name.endswith(".index"):
+                    corpus_id = name[:-len(".index")]
+                    corpora[corpus_id] = (self._last_use(corpus_id),
+                                          os.stat(path).st_size + self._log_size(corpus_id))
+            except FileNotFoundError:
+                continue
+
+        documents = {}
+        documents_dir = os.path.join(self.root, "documents")
+        for prefix in os.listdir(documents_dir):
+            directory = os.path.join(documents_dir, prefix)
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                    if name.endswith(".tmp") and stat.st_mtime < recent:
+                        os.unlink(path)
+                    elif name.endswith(".docs"):
+                        documents[name[:-len(".docs")]] = (stat.st_mtime, stat.st_size)
+                except FileNotFoundError:
+                    continue
+
+        deleted = set()
+        if CORPUS_RETENTION:
+            for corpus_id, (used, _) in corpora.items():
+                if used is not None and used < now - CORPUS_RETENTION \
+                        and self._delete_unused(corpus_id, now - CORPUS_RETENTION):
+                    deleted.add(corpus_id)
+
+        # Documents referenced by each remaining corpus
+        references = {}
+        for corpus_id in corpora:
+            if corpus_id in deleted:
+                continue
+            try:
+                index = self.read_index(corpus_id)
+            except Exception as e:
+                # Without its references no document can safely be deleted
+                debug_log(f"ERROR reading index {corpus_id}, keeping all documents: {str(e)}")
+                return len(deleted), 0, 0
+            if index is not None:
+                references[corpus_id] = set(getattr(index, "documents", ()))
+        counts = {}
+        for doc_ids in references.values():
+            for doc_id in doc_ids:
+                counts[doc_id] = counts.get(doc_id, 0) + 1
+
+        unreferenced = {doc_id for doc_id in documents if not counts.get(doc_id)}
+        total = (sum(size for corpus_id, (_, size) in corpora.items() if corpus_id not in deleted)
+                 + sum(size for doc_id, (_, size) in documents.items() if doc_id not in unreferenced))
+        if MAX_BYTES and total > MAX_BYTES:
+            by_use = sorted((used, corpus_id) for corpus_id, (used, _) in corpora.items()
+                            if corpus_id in references and used is not None and used < recent)
+            for used, corpus_id in by_use:
+                if total <= MAX_BYTES:
+                    break
+                if not self._delete_unused(corpus_id, used):
+                    continue
+                deleted.add(corpus_id)
+                total -= corpora[corpus_id][1]
+                for doc_id in references.pop(corpus_id):
+                    counts[doc_id] -= 1
+                    if not counts[doc_id]:
+                        unreferenced.add(doc_id)
+                        total -= documents.get(doc_id, (0, 0))[1]
+
+        removed = 0
+        freed = sum(corpora[corpus_id][1] for corpus_id in deleted)
+        for doc_id in unreferenced:
+            path = self._document_path(doc_id)
+            try:
+                # Checked again right before the delete: put_document() touches a document it reuses
+                stat = os.stat(path)
+                if stat.st_mtime >= recent:
+                    continue
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+            with self._lock:
+                self._maps.pop(doc_id, None)
+            removed += 1
+            freed += stat.st_size
+
+        debug_log(f"Sweep deleted {len(deleted)} corpora and {removed} documents, {freed} bytes")
+        return len(deleted), removed, freed
+
+def _read_chunk(entry, decompress, ordinal):
+    """Decompress one chunk of an open document; entry is the tuple DocumentStore._open() returns."""
+    mapped, _, count, table_start = entry
+    data_start = table_start + (count + 1) * 8
+    start, end = struct.unpack_from("<QQ", mapped, table_start + ordinal * 8)
+    heading, _, text = decompress(mapped[data_start + start:data_start + end]).decode("utf-8").partition("\n")
+    return heading, text
+
+def get_document_store():
+    """
+    Return the document store for this process.
+
+    Returns:
+        DocumentStore: The store rooted at DOCUMENT_STORE_DIR
+    """
+    pid = os.getpid()
+    if pid not in _stores:
+        with _stores_lock:
+            if pid not in _stores:
+                _stores.clear()
+                _stores[pid] = DocumentStore()
+    return _stores[pid]
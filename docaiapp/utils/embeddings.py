@@ -0,0 +1,165 @@
+"""
+Embedding providers used for semantic retrieval.
+
+The provider is selected with the EMBEDDING_PROVIDER setting:
+    azure    - Azure OpenAI embeddings deployment (production)
+    hashing  - deterministic local feature hashing, no network access (offline/testing)
+    none     - semantic retrieval disabled, BM25 only
+"""
+
+import re
+import zlib
+import numpy as np
+from docaiapp.utils.config import DEBUG, env_choice, env_int, get_settings
+from docaiapp.utils.client_manager import client_manager
+
+EMBEDDING_PROVIDER = env_choice("EMBEDDING_PROVIDER", "none", ("azure", "hashing", "none"))
+EMBEDDING_BATCH_SIZE = env_int("EMBEDDING_BATCH_SIZE", 64, minimum=1)
+HASHING_DIMENSIONS = env_int("HASHING_EMBEDDING_DIMENSIONS", 512)
+
+# Embedding inputs are truncated to stay well inside the model input limit
+MAX_INPUT_CHARS = 8000
+
+WORD_PATTERN = re.compile(r'\w+')
+
+_embedders = {}
+
+def debug_log(message):
+    if DEBUG:
+        print(f"DEBUG [Embeddings]: {message}")
+
+
+class Embedder:
+    """
+    Base class for embedding providers. Subclasses implement _embed_batch().
+    """
+
+    name = "base"
+
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or EMBEDDING_BATCH_SIZE
+
+    def embed(self, texts):
+        """
+        Embed a list of texts in batches.
+
+        Args:
+            texts (list): Texts to embed
+
+        Returns:
+            numpy.ndarray: Contiguous float32 matrix of L2-normalized rows, one per text
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        batches = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = [text[:MAX_INPUT_CHARS] for text in texts[start:start + self.batch_size]]
+            batches.append(self._embed_batch(batch))
+        debug_log(f"{self.name}: embedded {len(texts)} texts in {len(batches)} batches")
+
+        return normalize(np.vstack(batches))
+
+    def embed_query(self, text):
+        """
+        Embed a single query.
+
+        Args:
+            text (str): Query text
+
+        Returns:
+            numpy.ndarray: L2-normalized float32 vector
+        """
+        return self.embed([text])[0]
+
+    def _embed_batch(self, texts):
+        raise NotImplementedError
+
+
+class HashingEmbedder(Embedder):
+    """
+    Deterministic embedder that hashes words and word bigrams into a fixed
+    number of signed buckets. Needs no model or network access.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dimensions=None, batch_size=None):
+        super().__init__(batch_size)
+        self.dimensions = dimensions or HASHING_DIMENSIONS
+
+    def _embed_batch(self, texts):
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = WORD_PATTERN.findall(text.lower())
+            features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+            if not features:
+                continue
+            hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in features),
+                                 dtype=np.uint32, count=len(features))
+            buckets = (hashes % self.dimensions).astype(np.intp)
+            signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+            np.add.at(matrix[row], buckets, signs)
+
+        # Dampen very frequent features
+        return np.sign(matrix) * np.log1p(np.abs(matrix))
+
+
+class AzureOpenAIEmbedder(Embedder):
+    """
+    Embedder backed by an Azure OpenAI embeddings deployment.
+    """
+
+    name = "azure"
+
+    def __init__(self, deployment_name=None, batch_size=None):
+        super().__init__(batch_size)
+        self.deployment_name = deployment_name or get_settings().embedding_deployment
+
+    def _embed_batch(self, texts):
+        response = client_manager.create_embeddings(texts, self.deployment_name)
+        data = sorted(response.data, key=lambda item: item.index)
+        return np.asarray([item.embedding for item in data], dtype=np.float32)
+
+
+def normalize(matrix):
+    """
+    L2-normalize the rows of a matrix so that dot products are cosine similarities.
+
+    Args:
+        matrix (numpy.ndarray): 2-D array
+
+    Returns:
+        numpy.ndarray: Contiguous float32 array with unit-length rows
+    """
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def get_embedder(provider=None):
+    """
+    Return the process-wide embedder for a provider.
+
+    Args:
+        provider (str): "azure", "hashing" or "none" (defaults to EMBEDDING_PROVIDER)
+
+    Returns:
+        Embedder: The embedder, or None if semantic retrieval is disabled
+    """
+    provider = (provider or EMBEDDING_PROVIDER).lower()
+    if provider in ("", "none"):
+        return None
+
+    if provider not in _embedders:
+        if provider == "azure":
+            _embedders[provider] = AzureOpenAIEmbedder()
+        elif provider == "hashing":
+            _embedders[provider] = HashingEmbedder()
+        else:
+            debug_log(f"Unknown embedding provider '{provider}', semantic retrieval disabled")
+            return None
+        debug_log(f"Created {provider} embedder")
+
+    return _embedders[provider]
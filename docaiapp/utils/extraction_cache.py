@@ -0,0 +1,272 @@
+"""
+Content-addressed cache of extracted document content.
+
+Extraction results are keyed by the SHA-256 of the file bytes together with
+the name and version of the processor that produced them, so the same file
+uploaded by different users (or to different workers) is only extracted,
+and only sent to Document Intelligence, once. Entries are kept in a SQLite
+database shared by all worker processes, compressed with zlib, and evicted
+least recently used first once the cache grows past its size limit.
+"""
+
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from docaiapp.utils.config import DEBUG, env_bool, env_int, env_str
+
+CACHE_ENABLED = env_bool("EXTRACTION_CACHE_ENABLED", True)
+CACHE_PATH = env_str("EXTRACTION_CACHE_PATH", os.path.join("cache", "extraction_cache.db"))
+CACHE_MAX_BYTES = env_int("EXTRACTION_CACHE_MAX_BYTES", 512 * 1024 * 1024)
+
+# Results starting with these are failures and are never cached
+ERROR_PREFIXES = ("Error processing",)
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def debug_log(message):
+    if DEBUG:
+        print(f"DEBUG [Extraction Cache]: {message}")
+
+
+class ExtractionCache:
+    """
+    SQLite-backed LRU cache of extracted content, bounded by total compressed size.
+
+    One connection is shared by the threads of a process; SQLite's WAL mode
+    lets several worker processes read and write the same database file.
+    """
+
+    def __init__(self, path=None, max_bytes=None):
+        self.path = path or CACHE_PATH
+        self.max_bytes = max_bytes or CACHE_MAX_BYTES
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS extractions (
+                key TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                content BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS extractions_last_access ON extractions (last_access);
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO counters (name, value) VALUES ('hits', 0), ('misses', 0);
+        """)
+        debug_log(f"Opened extraction cache at {self.path}")
+
+    @staticmethod
+    def make_key(data, processor_name, processor_version):
+        """
+        Build the cache key for a file and the processor that extracts it.
+
+        Args:
+            data (bytes): File content
+            processor_name (str): Qualified name of the processing function
+            processor_version (str): Version of the processing function's output format
+
+        Returns:
+            str: Cache key
+        """
+        return f"{hashlib.sha256(data).hexdigest()}:{processor_name}:{processor_version}"
+
+    def get(self, key):
+        """
+        Look up extracted content and count the hit or miss.
+
+        Args:
+            key (str): Cache key from make_key()
+
+        Returns:
+            tuple: (content, filename it was extracted from), or None on a miss
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT filename, content FROM extractions WHERE key = ?", (key,)).fetchone()
+            counter = "hits" if row else "misses"
+            self._conn.execute("BEGIN")
+            self._conn.execute("UPDATE counters SET value = value + 1 WHERE name = ?", (counter,))
+            if row:
+                self._conn.execute("UPDATE extractions SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.execute("COMMIT")
+
+        if row is None:
+            return None
+        return zlib.decompress(row[1]).decode("utf-8"), row[0]
+
+    def put(self, key, content, filename):
+        """
+        Store extracted content, evicting the least recently used entries if
+        the cache is over its size limit.
+
+        Args:
+            key (str): Cache key from make_key()
+            content (str): Extracted content
+            filename (str): Name of the file the content was extracted from
+        """
+        self.put_compressed(key, zlib.compress(content.encode("utf-8")), filename)
+
+    def put_compressed(self, key, blob, filename):
+        """
+        Store content that was compressed with zlib, e.g. piece by piece while
+        a streaming processor produced it (see put()).
+
+        Args:
+            key (str): Cache key from make_key()
+            blob (bytes): zlib-compressed UTF-8 content
+            filename (str): Name of the file the content was extracted from
+        """
+        if len(blob) > self.max_bytes:
+            return
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute(
+                "INSERT OR REPLACE INTO extractions (key, filename, content, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, filename, blob, len(blob), time.time())
+            )
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM extractions").fetchone()[0]
+            evicted = 0
+            if total > self.max_bytes:
+                rows = self._conn.execute(
+                    "SELECT key, size FROM extractions WHERE key != ? ORDER BY last_access", (key,)
+                ).fetchall()
+                for old_key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    self._conn.execute("DELETE FROM extractions WHERE key = ?", (old_key,))
+                    total -= size
+                    evicted += 1
+            self._conn.execute("COMMIT")
+
+        debug_log(f"Stored {len(blob)} bytes for {filename}, evicted {evicted} entries")
+
+    def stats(self):
+        """
+        Return cache counters, shared by all worker processes.
+
+        Returns:
+            dict: hits, misses, entries and total compressed bytes
+        """
+        with self._lock:
+            counters = dict(self._conn.execute("SELECT name, value FROM counters").fetchall())
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM extractions").fetchone()
+        return {"hits": counters.get("hits", 0), "misses": counters.get("misses", 0),
+                "entries": entries, "bytes": size}
+
+
+def get_cache():
+    """
+    Return the extraction cache for this process, opening it on first use.
+
+    Returns:
+        ExtractionCache: The cache, or None if caching is disabled or the
+        database cannot be opened
+    """
+    if not CACHE_ENABLED:
+        return None
+
+    pid = os.getpid()
+    if pid not in _caches:
+        with _caches_lock:
+            if pid not in _caches:
+                try:
+                    cache = ExtractionCache()
+                except sqlite3.Error as e:
+                    debug_log(f"ERROR opening extraction cache: {str(e)}")
+                    cache = None
+                _caches.clear()
+                _caches[pid] = cache
+    return _caches[pid]
+
+
+class CachedProcessor:
+    """
+    Wraps a document processing function so that its results are looked up
+    in, and stored to, the extraction cache.
+
+    Instances are picklable (the wrapped function is pickled by reference),
+    so they can run in the ingest worker processes.
+    """
+
+    def __init__(self, processor):
+        self.processor = processor
+        module = sys.modules.get(processor.__module__)
+        self.name = f"{processor.__module__}.{processor.__name__}"
+        self.version = getattr(module, "PROCESSOR_VERSION", "0")
+
+    def __call__(self, file_obj):
+        cache = get_cache()
+        if cache is None:
+            return self.processor(file_obj)
+
+        filename = getattr(file_obj, 'filename', None) or 'Unnamed Document'
+        if hasattr(file_obj, 'getvalue'):
+            data = file_obj.getvalue()
+        else:
+            # Read a FileStorage once and hand the processor an in-memory copy
+            from docaiapp.utils.ingest import NamedBytesIO
+            data = file_obj.read()
+            file_obj.close()
+            file_obj = NamedBytesIO(data, filename)
+
+        key = ExtractionCache.make_key(data, self.name, self.version)
+        try:
+            cached = cache.get(key)
+        except sqlite3.Error as e:
+            debug_log(f"ERROR reading extraction cache: {str(e)}")
+            cached = None
+
+        if cached is not None:
+            content, cached_filename = cached
+            debug_log(f"Cache hit for {filename} ({self.name})")
+            return _rename(content, cached_filename, filename)
+
+        debug_log(f"Cache miss for {filename} ({self.name})")
+        content = self.processor(file_obj)
+        if not isinstance(content, str):
+            # A streaming processor's pieces are cached once all of them arrived
+            return _cache_pieces(cache, key, filename, content)
+        if not content.startswith(ERROR_PREFIXES):
+            try:
+                cache.put(key, content, filename)
+            except sqlite3.Error as e:
+                debug_log(f"ERROR writing extraction cache: {str(e)}")
+        return content
+
+
+def _cache_pieces(cache, key, filename, pieces):
+    """Pass on the pieces of a streaming processor, compressing them for the cache as they go."""
+    compressor = zlib.compressobj()
+    blobs = []
+    for piece in pieces:
+        blobs.append(compressor.compress(piece.encode("utf-8")))
+        yield piece
+    # Not reached if the processor failed
+    blobs.append(compressor.flush())
+    try:
+        cache.put_compressed(key, b"".join(blobs), filename)
+    except sqlite3.Error as e:
+        debug_log(f"ERROR writing extraction cache: {str(e)}")
+
+
+def _rename(content, old_filename, new_filename):
+    """Replace the filename in the title line written by the processors."""
+    if old_filename == new_filename:
+        return content
+    title, newline, rest = content.partition("\n")
+    return title.replace(old_filename, new_filename, 1) + newline + rest
@@ -0,0 +1,322 @@
+"""
+Rolling summary of long chat histories.
+
+Only the most recent chat messages are sent with a question. Once the
+history kept in the session grows past HISTORY_SUMMARY_THRESHOLD tokens,
+the older messages are folded into a running summary of the conversation
+by a background thread, after the answer has been returned. The summary is
+written to a small SQLite store shared by all workers (or, with the redis
+session backend, to that Redis server, shared by all hosts) and moved into
+the session on the user's next request, whichever instance serves it,
+where it replaces the messages it covers. The prompt then carries the summary plus the recent messages, so
+its size stays flat however long the conversation gets.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from docaiapp.utils.config import DEBUG, env_bool, env_int, env_str
+from docaiapp.utils import metrics
+from docaiapp.utils.client_manager import client_manager
+from docaiapp.utils.prompt_packer import HISTORY_MAX_MESSAGES, make_message, message_tokens, truncate_tokens
+from docaiapp.utils.session_store import SESSION_BACKEND, SESSION_REDIS_URL
+
+SUMMARY_ENABLED = env_bool("HISTORY_SUMMARY_ENABLED", True)
+# Tokens of verbatim history in the session before older messages are summarized
+SUMMARY_THRESHOLD = env_int("HISTORY_SUMMARY_THRESHOLD", 2000)
+# Most recent messages that are always kept verbatim
+SUMMARY_KEEP_MESSAGES = env_int("HISTORY_SUMMARY_KEEP_MESSAGES", HISTORY_MAX_MESSAGES)
+SUMMARY_MAX_TOKENS = env_int("HISTORY_SUMMARY_MAX_TOKENS", 300)
+SUMMARY_DEPLOYMENT = env_str("HISTORY_SUMMARY_DEPLOYMENT_NAME")
+SUMMARY_DB_PATH = env_str("HISTORY_SUMMARY_DB_PATH", os.path.join("cache", "history_summaries.db"))
+
+# Messages folded into the summary in one call are limited to this many tokens
+SUMMARY_INPUT_TOKENS = 6000
+# Longest single message passed to the summarizer
+SUMMARY_MESSAGE_TOKENS = 1500
+SUMMARY_WORKERS = 2
+# Pending summaries that were never picked up are dropped after this many seconds
+SUMMARY_RETENTION = 24 * 60 * 60
+
+SUMMARY_KEY_PREFIX = "docbot:summary:"
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an assistant that answers "
+    "questions about uploaded documents. Update the summary with the new messages. Keep the facts, "
+    "figures, names, decisions and open questions that later questions may refer to, and drop "
+    "pleasantries. Write at most {words} words of plain text."
+)
+
+_stores = {}
+_executors = {}
+_in_flight = set()
+_lock = threading.Lock()
+
+def debug_log(message):
+    if DEBUG:
+        print(f"DEBUG [History Summary]: {message}")
+
+
+class SummaryStore:
+    """
+    SQLite table of summaries waiting to be moved into their session.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or SUMMARY_DB_PATH
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS summaries (
+                owner TEXT PRIMARY KEY,
+                covered INTEGER NOT NULL,
+                digest TEXT NOT NULL,
+                content TEXT NOT NULL,
+                updated REAL NOT NULL
+            )
+        """)
+
+    def put(self, owner, covered, digest, content):
+        """
+        Store the summary of a session's first messages.
+
+        Args:
+            owner (str): Session user ID
+            covered (int): Number of history messages the summary replaces
+            digest (str): history_digest() of those messages
+            content (str): Summary text
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM summaries WHERE updated < ?", (now - SUMMARY_RETENTION,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (owner, covered, digest, content, updated) VALUES (?, ?, ?, ?, ?)",
+                (owner, covered, digest, content, now)
+            )
+
+    def pop(self, owner):
+        """
+        Take a session's pending summary out of the store.
+
+        Args:
+            owner (str): Session user ID
+
+        Returns:
+            tuple: (covered, digest, content), or None if there is none
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute(
+                "SELECT covered, digest, content FROM summaries WHERE owner = ?", (owner,)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute("DELETE FROM summaries WHERE owner = ?", (owner,))
+            self._conn.execute("COMMIT")
+        return row
+
+    def delete(self, owner):
+        """Drop a session's pending summary (e.g. because the chat was cleared)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM summaries WHERE owner = ?", (owner,))
+
+
+class RedisSummaryStore:
+    """
+    Pending summaries in the Redis server of the redis session backend,
+    shared by all hosts. Each expires after SUMMARY_RETENTION.
+    """
+
+    def __init__(self, url=None):
+        import redis
+        self._client = redis.Redis.from_url(url or SESSION_REDIS_URL, socket_timeout=2.0,
+                                            socket_connect_timeout=2.0)
+
+    def put(self, owner, covered, digest, content):
+        """Store the summary of a session's first messages (see SummaryStore.put())."""
+        self._client.set(SUMMARY_KEY_PREFIX + owner, json.dumps([covered, digest, content]), ex=SUMMARY_RETENTION)
+
+    def pop(self, owner):
+        """Take a session's pending summary out of the store (see SummaryStore.pop())."""
+        key = SUMMARY_KEY_PREFIX + owner
+        data, _ = self._client.pipeline(transaction=True).get(key).delete(key).execute()
+        return tuple(json.loads(data)) if data is not None else None
+
+    def delete(self, owner):
+        """Drop a session's pending summary."""
+        self._client.delete(SUMMARY_KEY_PREFIX + owner)
+
+
+def get_summary_store():
+    """
+    Return the summary store for this process.
+
+    Returns:
+        SummaryStore or RedisSummaryStore: The store at HISTORY_SUMMARY_DB_PATH,
+        or in the Redis server of the session store when SESSION_BACKEND is redis
+    """
+    pid = os.getpid()
+    if pid not in _stores:
+        with _lock:
+            if pid not in _stores:
+                _stores.clear()
+                _stores[pid] = RedisSummaryStore() if SESSION_BACKEND == "redis" else SummaryStore()
+    return _stores[pid]
+
+def _get_executor():
+    pid = os.getpid()
+    if pid not in _executors:
+        with _lock:
+            if pid not in _executors:
+                _executors.clear()
+                _in_flight.clear()
+                _executors[pid] = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix="history-summary")
+    return _executors[pid]
+
+def history_digest(messages):
+    """Identify a run of chat messages, to check that a summary still matches the session's history."""
+    digest = hashlib.sha256()
+    for message in messages:
+        digest.update(message["role"].encode("utf-8") + b"\0" + message["content"].encode("utf-8") + b"\0")
+    return digest.hexdigest()
+
+def messages_to_fold(history):
+    """
+    Return how many of the oldest history messages should be summarized.
+
+    Args:
+        history (list): Chat messages kept verbatim in the session, oldest first
+
+    Returns:
+        int: Number of messages to fold into the summary, 0 while the history is short
+    """
+    if not SUMMARY_ENABLED or len(history) <= SUMMARY_KEEP_MESSAGES:
+        return 0
+    if sum(message_tokens(message) for message in history) <= SUMMARY_THRESHOLD:
+        return 0
+
+    count = 0
+    folded_tokens = 0
+    for message in history[:len(history) - SUMMARY_KEEP_MESSAGES]:
+        tokens = min(message_tokens(message), SUMMARY_MESSAGE_TOKENS)
+        if count and folded_tokens + tokens > SUMMARY_INPUT_TOKENS:
+            # The rest is folded in the next round
+            break
+        count += 1
+        folded_tokens += tokens
+    return count
+
+def summarize(summary, messages):
+    """
+    Fold chat messages into the running summary.
+
+    Args:
+        summary (dict): Current summary message, or None
+        messages (list): Chat messages to add, oldest first
+
+    Returns:
+        str: The updated summary
+    """
+    lines = []
+    if summary:
+        lines.append(f"Current summary:\n{summary['content']}\n")
+    lines.append("New messages:")
+    for message in messages:
+        lines.append(f"{message['role']}: {truncate_tokens(message['content'], SUMMARY_MESSAGE_TOKENS)}")
+
+    with metrics.timed(metrics.LLM_SECONDS, "summary", "complete"):
+        response = client_manager.chat_completion(
+            [
+                {"role": "system", "content": SUMMARY_PROMPT.format(words=int(SUMMARY_MAX_TOKENS * 0.75))},
+                {"role": "user", "content": "\n".join(lines)},
+            ],
+            deployment_name=SUMMARY_DEPLOYMENT,
+            max_tokens=SUMMARY_MAX_TOKENS,
+            temperature=0,
+        )
+    metrics.record_usage("summary", getattr(response, "usage", None))
+    return (response.choices[0].message.content or "").strip()
+
+def _run_summary(owner, history, summary, count):
+    try:
+        started = time.perf_counter()
+        content = summarize(summary, history[:count])
+        if content:
+            get_summary_store().put(owner, count, history_digest(history[:count]), content)
+            debug_log(f"Summarized {count} messages in {time.perf_counter() - started:.2f}s")
+    except Exception as e:
+        debug_log(f"ERROR summarizing history: {str(e)}")
+    finally:
+        with _lock:
+            _in_flight.discard(owner)
+
+def schedule_summary(owner, history, summary=None):
+    """
+    Start summarizing the older messages of a long history in the background.
+
+    Call it once the answer has been produced; the summary is picked up by
+    apply_summary() on a later request. At most one summary per session is
+    computed at a time in each worker.
+
+    Args:
+        owner (str): Session user ID
+        history (list): Chat messages kept verbatim in the session, oldest first
+        summary (dict): The session's current summary message, or None
+
+    Returns:
+        bool: True if a summary was started
+    """
+    count = messages_to_fold(history)
+    if not count:
+        return False
+    executor = _get_executor()
+    with _lock:
+        if owner in _in_flight:
+            return False
+        _in_flight.add(owner)
+    executor.submit(_run_summary, owner, list(history), summary, count)
+    debug_log(f"Summarizing {count} of {len(history)} messages in the background")
+    return True
+
+def apply_summary(owner, history, summary=None):
+    """
+    Replace the summarized messages of a session's history with the new summary.
+
+    A summary that no longer matches the history (e.g. the chat was cleared
+    in the meantime) is discarded.
+
+    Args:
+        owner (str): Session user ID
+        history (list): Chat messages kept verbatim in the session, oldest first
+        summary (dict): The session's current summary message, or None
+
+    Returns:
+        tuple: (remaining history, summary message)
+    """
+    if not SUMMARY_ENABLED:
+        return history, summary
+    pending = get_summary_store().pop(owner)
+    if pending is None:
+        return history, summary
+
+    covered, digest, content = pending
+    if covered > len(history) or history_digest(history[:covered]) != digest:
+        debug_log("Discarding a summary that no longer matches the history")
+        return history, summary
+    debug_log(f"Replaced {covered} messages with the conversation summary")
+    return history[covered:], make_message("system", content)
+
+def clear_summary(owner):
+    """Forget a session's summary, including one still waiting to be applied."""
+    if SUMMARY_ENABLED:
+        get_summary_store().delete(owner)
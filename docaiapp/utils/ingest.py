@@ -0,0 +1,315 @@
+"""
+Concurrent ingest pipeline for uploaded files and websites.
+
+Work that mostly waits on the network (Document Intelligence analysis,
+website fetches) runs on a bounded thread pool. Local parsing with PyMuPDF,
+python-docx and python-pptx is CPU bound and runs on a process pool so it is
+not serialized by the GIL; long PDFs are split into page ranges on that pool
+(see get_cpu_pool()). Each item has its own timeout, which is enforced in
+the worker as well: a process pool task is interrupted when its time is up,
+and a thread can read the time left with remaining_time(). Results are
+reported to an optional callback and returned in the order the items were
+submitted; each is reported as soon as it and the items before it finished.
+
+A processor running on a thread may yield its markdown in pieces instead
+of returning it (see pdf_processor.stream_pdf()). The pieces are then
+chunked and written to the document store on that thread as they arrive,
+and the result carries the ID of the stored document instead of the text.
+"""
+
+import io
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from docaiapp.utils.config import DEBUG, env_float, env_int
+from docaiapp.utils import metrics
+
+IO_WORKERS = env_int("INGEST_IO_WORKERS", 8, minimum=1)
+CPU_WORKERS = env_int("INGEST_CPU_WORKERS", min(4, os.cpu_count() or 1), minimum=0)
+ITEM_TIMEOUT = env_float("INGEST_ITEM_TIMEOUT", 300)
+
+_pool_lock = threading.RLock()
+_pools = {}
+# Deadline of the item the current ingest thread is processing
+_item = threading.local()
+
+def debug_log(message):
+    if DEBUG:
+        print(f"DEBUG [Ingest]: {message}")
+
+
+class NamedBytesIO(io.BytesIO):
+    """
+    In-memory file that keeps its upload filename.
+
+    Unlike a werkzeug FileStorage it can be pickled, so it can be sent to a
+    worker process. The processors read the name through getattr(file_obj, 'filename').
+    """
+
+    def __init__(self, data, filename):
+        super().__init__(data)
+        self.filename = filename
+
+
+class IngestResult:
+    """
+    Extracted content for one uploaded file or website. For a document that
+    was stored while it was extracted, content is empty and doc_id is the
+    ID of the stored document.
+    """
+
+    def __init__(self, source, kind, content, elapsed, doc_id=None):
+        self.source = source
+        self.kind = kind
+        self.content = content
+        self.elapsed = elapsed
+        self.doc_id = doc_id
+
+
+class StoredDocument:
+    """
+    Result of a streaming processor: the ID its pieces were stored under.
+    """
+
+    def __init__(self, doc_id):
+        self.doc_id = doc_id
+
+
+def _get_pool(kind):
+    """
+    Return the process-wide executor for "io" or "cpu" work.
+
+    Pools are created on first use and recreated after a fork or after a
+    worker process crashed.
+    """
+    key = (kind, os.getpid())
+    pool = _pools.get(key)
+    if pool is None:
+        with _pool_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                if kind == "cpu" and CPU_WORKERS > 0:
+                    # spawn avoids forking a process that is running request threads
+                    pool = ProcessPoolExecutor(max_workers=CPU_WORKERS,
+                                               mp_context=multiprocessing.get_context("spawn"))
+                elif kind == "cpu":
+                    pool = _get_pool("io")
+                else:
+                    pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="ingest")
+                _pools[key] = pool
+                debug_log(f"Created {kind} pool for process {os.getpid()}")
+    return pool
+
+def get_cpu_pool():
+    """
+    Return the process pool used for CPU-bound parsing, so a processor can
+    split one large document across worker processes.
+
+    Returns:
+        ProcessPoolExecutor: The pool, or None if parsing runs on threads (INGEST_CPU_WORKERS=0)
+    """
+    if CPU_WORKERS <= 0:
+        return None
+    pool = _get_pool("cpu")
+    if getattr(pool, "_broken", False):
+        _discard_pool("cpu")
+        pool = _get_pool("cpu")
+    return pool
+
+def run_with_time_limit(function, seconds, *args):
+    """
+    Call a function, interrupting it with TimeoutError after a number of
+    seconds. Meant to be submitted to the process pool, whose tasks run on
+    the main thread of a worker process; elsewhere (threads, or platforms
+    without SIGALRM) the function runs without a limit.
+
+    Args:
+        function (callable): Function to call; must be picklable
+        seconds (float): Time limit
+        *args: Arguments of the function
+
+    Returns:
+        The function's return value
+    """
+    if not hasattr(signal, "setitimer") or threading.current_thread() is not threading.main_thread():
+        return function(*args)
+
+    def on_alarm(signum, frame):
+        raise TimeoutError(f"timed out after {seconds:.0f} seconds")
+
+    previous = signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, max(seconds, 0.001))
+    try:
+        return function(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+def _run_on_thread(processor, deadline, file_obj):
+    """
+    Process a file on an ingest thread, making its deadline available to
+    remaining_time(). The pieces of a streaming processor are stored here.
+    """
+    _item.deadline = deadline
+    try:
+        content = processor(file_obj)
+        if isinstance(content, str):
+            return content
+        # Imported here: retrieval pulls in NumPy, which the worker processes do not need
+        from docaiapp.utils.retrieval import store_document
+        return StoredDocument(store_document(file_obj.filename, content))
+    finally:
+        _item.deadline = None
+
+def remaining_time():
+    """
+    Return the time left for the item the current thread is ingesting, so a
+    processor that fans work out (e.g. PDF page ranges) can limit it.
+
+    Returns:
+        float: Seconds left (at least 0), or None outside an ingest thread
+    """
+    deadline = getattr(_item, "deadline", None)
+    return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+def _discard_pool(kind):
+    with _pool_lock:
+        pool = _pools.pop((kind, os.getpid()), None)
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def _processor_label(filename, service_provider):
+    """Return the processor type of a file for the metrics."""
+    name = filename.lower()
+    if name.endswith('.csv'):
+        return "csv"
+    if service_provider.use_intelligent_processing:
+        return "document_intelligence"
+    if name.endswith('.pdf'):
+        return "pdf"
+    return "word" if name.endswith(('.docx', '.doc')) else "powerpoint"
+
+def _file_content(source, pool_kind, future):
+    """Return the content extracted for a file, or the error message if processing failed."""
+    try:
+        return future.result(timeout=0)
+    except BrokenProcessPool as e:
+        _discard_pool(pool_kind)
+        debug_log(f"ERROR: worker process failed while processing {source}")
+        return f"Error processing {source}: {str(e)}"
+    except Exception as e:
+        debug_log(f"ERROR processing {source}: {str(e)}")
+        return f"Error processing {source}: {str(e)}"
+
+def ingest(files, websites, service_provider, timeout=None, crawl=False, on_result=None):
+    """
+    Extract content from uploaded files and websites concurrently.
+
+    Args:
+        files (list): (filename, bytes) tuples for uploaded files
+        websites (list): Website URLs
+        service_provider (DocumentServiceProvider): Selects the processor for each item
+        timeout (float): Seconds allowed per item (defaults to INGEST_ITEM_TIMEOUT)
+        crawl (bool): Also ingest same-site pages linked from each website
+        on_result (callable): Called with each IngestResult on the calling thread,
+            in submission order, as soon as it and the items before it are done
+
+    Returns:
+        list: IngestResult objects, files first then website pages, in submission order.
+        Unsupported file types are skipped.
+    """
+    timeout = timeout or ITEM_TIMEOUT
+    # future -> (position, source, pool kind, start time)
+    pending = {}
+    # future -> processor type, for the metrics
+    processors = {}
+    position = 0
+
+    for filename, data in files:
+        processor, io_bound = service_provider.get_file_processor(filename)
+        if processor is None:
+            debug_log(f"Skipping unsupported file: {filename}")
+            continue
+        kind = "io" if io_bound else "cpu"
+        started = time.monotonic()
+        if kind == "io":
+            future = _get_pool(kind).submit(_run_on_thread, processor, started + timeout,
+                                            NamedBytesIO(data, filename))
+        else:
+            future = _get_pool(kind).submit(run_with_time_limit, processor, timeout, NamedBytesIO(data, filename))
+        pending[future] = (position, filename, kind, started)
+        processors[future] = _processor_label(filename, service_provider)
+        position += 1
+
+    # Websites are fetched together so they share one async connection pool
+    websites_future = None
+    if websites:
+        website_processor = service_provider.get_website_batch_processor()
+        websites_future = _get_pool("io").submit(website_processor, websites, crawl)
+        pending[websites_future] = (position, None, "io", time.monotonic())
+        processors[websites_future] = "website"
+
+    debug_log(f"Submitted {position} files and {len(websites)} websites for ingestion")
+
+    results = {}
+    # Position of the next result to report
+    reported = 0
+    while pending:
+        deadline = min(started for _, _, _, started in pending.values()) + timeout
+        done, _ = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        now = time.monotonic()
+        expired = [future for future, (_, _, _, started) in pending.items()
+                   if future not in done and now >= started + timeout]
+
+        for future in list(done) + expired:
+            item_position, source, pool_kind, started = pending.pop(future)
+            timed_out = future not in done
+            if timed_out:
+                # Only stops a queued item; a running one is interrupted by its own time limit
+                future.cancel()
+            elapsed = now - started
+
+            if future is websites_future:
+                if timed_out:
+                    debug_log(f"ERROR processing websites: timed out after {timeout:.0f} seconds")
+                    pages = [(url, f"Error processing website {url}: timed out after {timeout:.0f} seconds")
+                             for url in websites]
+                else:
+                    try:
+                        pages = future.result(timeout=0)
+                    except Exception as e:
+                        debug_log(f"ERROR processing websites: {str(e)}")
+                        pages = [(url, f"Error processing website {url}: {str(e)}") for url in websites]
+                debug_log(f"Processed {len(pages)} website pages in {elapsed:.2f}s")
+                item_results = [IngestResult(url, "website", content, elapsed) for url, content in pages]
+            else:
+                if timed_out:
+                    debug_log(f"ERROR: {source} timed out after {timeout:.0f}s")
+                    content = f"Error processing {source}: timed out after {timeout:.0f} seconds"
+                else:
+                    content = _file_content(source, pool_kind, future)
+                debug_log(f"Processed {source} in {elapsed:.2f}s")
+                if isinstance(content, StoredDocument):
+                    item_results = [IngestResult(source, "file", "", elapsed, doc_id=content.doc_id)]
+                else:
+                    item_results = [IngestResult(source, "file", content, elapsed)]
+
+            failed = timed_out or any(result.content.startswith("Error processing") for result in item_results)
+            metrics.PROCESSING_SECONDS.labels(processors.pop(future), "error" if failed else "ok").observe(elapsed)
+            if timed_out:
+                metrics.record_error("upload", "timeout")
+            elif future is not websites_future and failed:
+                metrics.record_error("upload", "processing")
+
+            results[item_position] = item_results
+            while reported in results:
+                if on_result is not None:
+                    for result in results[reported]:
+                        on_result(result)
+                reported += 1
+
+    return [result for item_position in sorted(results) for result in results[item_position]]
@@ -0,0 +1,171 @@
+"""
+Prometheus metrics for the upload pipeline, retrieval and the LLM calls.
+
+Metrics are recorded with prometheus_client and served by the /metrics
+endpoint. Under gunicorn every worker is a separate process, so
+prometheus_client's multiprocess mode is used when PROMETHEUS_MULTIPROC_DIR
+is set (gunicorn.conf.py sets it): each process writes its values to files
+in that directory and /metrics aggregates them across all workers.
+
+If prometheus_client is not installed or METRICS_ENABLED is false, every
+metric is a no-op and /metrics is not available.
+"""
+
+import multiprocessing
+import time
+from contextlib import contextmanager
+from docaiapp.utils.config import DEBUG, env_bool, env_str
+
+METRICS_ENABLED = env_bool("METRICS_ENABLED", True)
+MULTIPROCESS_DIR = env_str("PROMETHEUS_MULTIPROC_DIR")
+
+try:
+    import prometheus_client
+    from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram
+except ImportError:
+    prometheus_client = None
+
+# Ingest pool worker processes record nothing; their parent records the results
+AVAILABLE = METRICS_ENABLED and prometheus_client is not None and multiprocessing.parent_process() is None
+
+# Latency buckets in seconds: fast local steps up to long uploads
+FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072)
+CHUNK_BUCKETS = (0, 1, 2, 4, 6, 8, 12, 16, 24, 32, 48, 64)
+
+def debug_log(message):
+    if DEBUG:
+        print(f"DEBUG [Metrics]: {message}")
+
+
+class _NullMetric:
+    """
+    Stands in for a metric when metrics are disabled.
+    """
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def observe(self, amount):
+        pass
+
+
+def _histogram(name, documentation, labelnames=(), buckets=SLOW_BUCKETS):
+    if not AVAILABLE:
+        return _NullMetric()
+    return Histogram(name, documentation, labelnames, buckets=buckets)
+
+def _counter(name, documentation, labelnames=()):
+    if not AVAILABLE:
+        return _NullMetric()
+    return Counter(name, documentation, labelnames)
+
+def _gauge(name, documentation, labelnames=()):
+    if not AVAILABLE:
+        return _NullMetric()
+    # livesum: the sum over the worker processes that are still running
+    return Gauge(name, documentation, labelnames, multiprocess_mode="livesum")
+
+
+REQUEST_SECONDS = _histogram(
+    "docbot_request_duration_seconds", "Time to handle an HTTP request, including streamed responses",
+    ("endpoint", "method", "status"))
+REQUESTS_IN_FLIGHT = _gauge(
+    "docbot_requests_in_flight", "HTTP requests being handled", ("endpoint",))
+UPLOAD_JOBS_RUNNING = _gauge(
+    "docbot_upload_jobs_running", "Upload jobs being processed")
+
+PROCESSING_SECONDS = _histogram(
+    "docbot_processing_duration_seconds", "Time to extract the content of an uploaded item, by processor",
+    ("processor", "status"))
+DOCUMENT_INTELLIGENCE_SECONDS = _histogram(
+    "docbot_document_intelligence_duration_seconds",
+    "Time an analyze job waited for an in-flight slot (queue) and for its result (analyze)", ("phase",))
+WEBSITE_FETCH_SECONDS = _histogram(
+    "docbot_website_fetch_duration_seconds", "Time to fetch one web page", ("status",))
+
+RETRIEVAL_SECONDS = _histogram(
+    "docbot_retrieval_duration_seconds", "Time to retrieve the context chunks for a question", buckets=FAST_BUCKETS)
+PROMPT_ASSEMBLY_SECONDS = _histogram(
+    "docbot_prompt_assembly_duration_seconds", "Time to pack the prompt into the token budget", buckets=FAST_BUCKETS)
+PROMPT_TOKENS = _histogram(
+    "docbot_prompt_tokens", "Tokens of the packed prompt, in total and by part", ("part",), buckets=TOKEN_BUCKETS)
+CONTEXT_CHUNKS = _histogram(
+    "docbot_context_chunks", "Retrieved chunks that fit into the prompt", buckets=CHUNK_BUCKETS)
+
+LLM_SECONDS = _histogram(
+    "docbot_llm_duration_seconds", "Time of a chat completion call until the whole answer arrived",
+    ("operation", "mode"))
+LLM_FIRST_TOKEN_SECONDS = _histogram(
+    "docbot_llm_first_token_seconds", "Time from sending a streamed completion request to its first token")
+LLM_TOKENS = _counter(
+    "docbot_llm_tokens_total",
+    "Prompt and completion tokens, from the usage reported by the API (estimated for streams without usage)",
+    ("operation", "kind"))
+
+AZURE_RETRIES = _counter(
+    "docbot_azure_retries_total", "Azure calls retried after throttling or a transient failure", ("type",))
+ERRORS = _counter(
+    "docbot_errors_total", "Errors by stage and type", ("stage", "type"))
+
+
+def error_type(error):
+    """Return the label used for an exception: its class name."""
+    return type(error).__name__
+
+def record_error(stage, error):
+    """
+    Count an error.
+
+    Args:
+        stage (str): Where the error happened (upload, document_intelligence, website_fetch, llm, request)
+        error (Exception or str): The exception, or a type label for errors reported as text
+    """
+    ERRORS.labels(stage, error if isinstance(error, str) else error_type(error)).inc()
+
+def record_usage(operation, usage):
+    """
+    Count the tokens of a completion from the usage field of the response.
+
+    Args:
+        operation (str): chat or summary
+        usage: The response's usage object (may be None)
+    """
+    if usage is None:
+        return
+    LLM_TOKENS.labels(operation, "prompt").inc(getattr(usage, "prompt_tokens", 0) or 0)
+    LLM_TOKENS.labels(operation, "completion").inc(getattr(usage, "completion_tokens", 0) or 0)
+
+@contextmanager
+def timed(histogram, *labels):
+    """Observe the duration of the with block in a histogram."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        (histogram.labels(*labels) if labels else histogram).observe(time.perf_counter() - started)
+
+def render():
+    """
+    Render all metrics in the Prometheus text format, aggregated over the
+    worker processes in multiprocess mode.
+
+    Returns:
+        tuple: (body, content type), or None if metrics are disabled
+    """
+    if not AVAILABLE:
+        return None
+    if MULTIPROCESS_DIR:
+        from prometheus_client import CollectorRegistry, multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), CONTENT_TYPE_LATEST
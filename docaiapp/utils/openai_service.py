@@ -1,161 +1,643 @@
-import os
-import requests
+import asyncio
+import json
 import sys
+import time
 import traceback
-from openai import AzureOpenAI
-from dotenv import load_dotenv
+from docaiapp.utils.config import DEBUG, env_float, env_int, env_str, get_settings
+from docaiapp.utils import metrics, profiler
+from docaiapp.utils.client_manager import client_manager
+from docaiapp.utils.prompt_packer import HISTORY_MAX_MESSAGES, PROMPT_TOKEN_BUDGET, count_tokens, pack_prompt
+from docaiapp.utils.response_cache import get_response_cache, make_key
+from docaiapp.utils.sql_engine import SQL_ENABLED, SQL_MAX_TOOL_ROUNDS, TOOL_NAME, open_sql_session
 
-# Load environment variables and set up debug functionality
-load_dotenv()
-DEBUG = os.getenv("DEBUG", "False").lower() in ["true", "1", "t", "yes", "y"]
+COMPLETION_MAX_TOKENS = env_int("COMPLETION_MAX_TOKENS", 1000)
+CHAT_TEMPERATURE = env_float("CHAT_TEMPERATURE", 0.7)
 
 def debug_log(message):
     if DEBUG:
         print(f"DEBUG [OpenAI Service]: {message}")
 
-def call_azure_openai_api(endpoint, api_key, deployment_name, messages):
+def get_system_prompt():
+    """Return the system prompt configured in the environment."""
+    return env_str("SYSTEM_PROMPT", "You are a helpful assistant answering questions based on provided documents.")
+
+def build_messages(query, chunks, history, tools=None, summary=None):
     """
-    Calls the Azure OpenAI REST API to get a response from a deployed model.
+    Build the chat messages sent to Azure OpenAI within the prompt token budget.
 
     Args:
-        endpoint (str): The Azure OpenAI endpoint.
-        api_key (str): The API key for authentication.
-        deployment_name (str): The name of the deployed model.
-        messages (list): A list of messages for the chat completion.
+        query (str): User's question
+        chunks (list): Retrieved context chunks from PDF/websites, best first
+        history (list): Previous chat history
+        tools (list): Tool definitions sent with the messages; they count against the budget
+        summary (dict): Summary message of the older conversation
 
     Returns:
-        dict: The response from the Azure OpenAI API.
+        tuple: (chat completion messages, token counts for logging)
     """
-    debug_log(f"Making REST API call to Azure OpenAI deployment: {deployment_name}")
-    url = f"{endpoint}/openai/deployments/{deployment_name}/chat/completions?api-version=2023-05-15"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}"
-    }
-    payload = {
-        "messages": messages,
-        "max_tokens": 100,
-        "temperature": 0.7
+    with metrics.timed(metrics.PROMPT_ASSEMBLY_SECONDS):
+        budget = PROMPT_TOKEN_BUDGET - (count_tokens(json.dumps(tools)) if tools else 0)
+        messages, stats = pack_prompt(get_system_prompt(), query, chunks, history, budget, summary)
+    for part in ("total", "context", "history"):
+        metrics.PROMPT_TOKENS.labels(part).observe(stats[part])
+    metrics.CONTEXT_CHUNKS.observe(stats["context_chunks"])
+    profiler.annotate(prompt_tokens=stats["total"], context_chunks=stats["context_chunks"],
+                      history_messages=stats["history_messages"])
+    debug_log(
+        f"Prompt tokens: {stats['total']}/{stats['budget']} ({stats['tokenizer']}) - "
+        f"system {stats['system']}, query {stats['query']}, summary {stats['summary']}, "
+        f"context {stats['context']} ({stats['context_chunks']} chunks, {stats['dropped_chunks']} dropped), "
+        f"history {stats['history']} ({stats['history_messages']} messages)"
+    )
+    return messages, stats
+
+def _retrieve_chunks(index, query, top_k):
+    """Retrieve the context chunks for a question from the index (none without an index)."""
+    if not index:
+        return []
+    with metrics.timed(metrics.RETRIEVAL_SECONDS):
+        return index.retrieve(query, top_k)
+
+def _tool_args(sql, rounds):
+    """Return the tool arguments of a completion request; after SQL_MAX_TOOL_ROUNDS the model has to answer."""
+    if sql is None or rounds >= SQL_MAX_TOOL_ROUNDS:
+        return {}
+    return {"tools": [sql.tool()], "tool_choice": "auto"}
+
+def _run_tool_calls(sql, tool_calls, content=None):
+    """
+    Execute the model's tool calls.
+
+    Args:
+        sql (SQLSession): SQL session of the chat request
+        tool_calls (list): Calls as dicts with id, name and arguments
+        content (str): Text the model sent along with the calls
+
+    Returns:
+        list: The assistant message with the calls, followed by one tool message per call
+    """
+    messages = [{
+        "role": "assistant",
+        "content": content,
+        "tool_calls": [
+            {"id": call["id"], "type": "function", "function": {"name": call["name"], "arguments": call["arguments"]}}
+            for call in tool_calls
+        ],
+    }]
+    for call in tool_calls:
+        if call["name"] == TOOL_NAME:
+            result = sql.run_tool_call(call["arguments"])
+        else:
+            result = f"Error: unknown tool {call['name']}"
+        messages.append({"role": "tool", "tool_call_id": call["id"], "content": result})
+    return messages
+
+def _message_tool_calls(message):
+    """Return the tool calls of a completion message as dicts with id, name and arguments."""
+    return [
+        {"id": call.id, "name": call.function.name, "arguments": call.function.arguments}
+        for call in getattr(message, "tool_calls", None) or []
+    ]
+
+
+class ChatRequest:
+    """
+    One chat completion: the prompt, the SQL tool session and the request
+    arguments shared by the sync and async code paths, which only differ in
+    how they call the client and iterate the stream.
+
+    failed is set when the completion ends with an error message instead of
+    an answer (also after a stream broke off midway), so callers can tell a
+    complete answer from a partial one without looking at its text.
+    """
+
+    def __init__(self, query, index=None, history=None, top_k=None, temperature=None, tables=None, summary=None):
+        self.query = query
+        self.index = index
+        self.history = history or []
+        self.top_k = top_k
+        self.temperature = CHAT_TEMPERATURE if temperature is None else temperature
+        self.tables = tables
+        self.summary = summary
+        self.deployment_name = None
+        self.sql = None
+        self.messages = []
+        self.prompt_tokens = 0
+        self.failed = False
+
+    def prepare(self):
+        """
+        Retrieve the context, open the SQL session and build the messages.
+
+        Returns:
+            str: Error message if Azure OpenAI is not configured, otherwise None
+        """
+        # Only the chunks most relevant to this query are sent to the model
+        chunks = _retrieve_chunks(self.index, self.query, self.top_k)
+
+        settings = get_settings()
+        self.deployment_name = settings.openai_deployment
+        debug_log(f"Using endpoint: {settings.openai_endpoint}, deployment: {self.deployment_name}, "
+                  f"API version: {settings.openai_api_version}")
+        if not settings.openai_configured:
+            debug_log("Missing OpenAI configuration")
+            self.failed = True
+            return "Error: Azure OpenAI settings are not configured properly. Please check your .env file."
+
+        self.sql = open_sql_session(self.tables)
+        self.messages, stats = build_messages(self.query, chunks, self.history, _tool_args(self.sql, 0).get("tools"),
+                                              self.summary)
+        self.prompt_tokens = stats["total"]
+        return None
+
+    def completion_args(self, rounds, stream=False):
+        """Return the keyword arguments of the completion request for a tool round."""
+        args = {
+            "deployment_name": self.deployment_name,
+            "max_tokens": COMPLETION_MAX_TOKENS,
+            "temperature": self.temperature,
+            **_tool_args(self.sql, rounds),
+        }
+        if stream:
+            args["stream"] = True
+        return args
+
+    def add_tool_messages(self, tool_messages):
+        """Append the messages of a tool round; they count against the next prompt."""
+        self.messages.extend(tool_messages)
+        self.prompt_tokens += count_tokens(json.dumps(tool_messages))
+
+    def fail(self, error, where):
+        """
+        Log and count a failed completion.
+
+        Returns:
+            str: Error message shown to the user in place of the answer
+        """
+        self.failed = True
+        debug_log(f"ERROR: Exception in {where}: {str(error)}")
+        metrics.record_error("llm", error)
+        if DEBUG:
+            debug_log("Full traceback:")
+            traceback.print_exc(file=sys.stdout)
+        return f"Sorry, I encountered an error when generating a response. Error details: {str(error)}"
+
+    def close(self):
+        if self.sql is not None:
+            self.sql.close()
+            self.sql = None
+
+
+class StreamRound:
+    """
+    Collects one streamed completion round: the content, the tool calls
+    assembled from their fragments, the usage and the timing metrics.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token = True
+        self.usage = None
+        self.content = []
+        self.tool_calls = {}
+
+    def add(self, chunk):
+        """
+        Process one stream chunk.
+
+        Returns:
+            str: Content fragment to pass on, or None
+        """
+        self.usage = getattr(chunk, "usage", None) or self.usage
+        # Azure sends content filter results in chunks without choices
+        if not chunk.choices:
+            return None
+        delta = chunk.choices[0].delta
+        # Tool calls arrive as fragments, keyed by their index
+        for fragment in getattr(delta, "tool_calls", None) or []:
+            call = self.tool_calls.setdefault(fragment.index, {"id": None, "name": "", "arguments": ""})
+            call["id"] = fragment.id or call["id"]
+            if fragment.function is not None:
+                call["name"] += fragment.function.name or ""
+                call["arguments"] += fragment.function.arguments or ""
+        if not delta.content:
+            return None
+        if self.first_token:
+            metrics.LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - self.started)
+            self.first_token = False
+        self.content.append(delta.content)
+        return delta.content
+
+    def finish(self, prompt_tokens):
+        """
+        Record the metrics of the finished round.
+
+        Returns:
+            list: The tool calls requested by the model, in order
+        """
+        metrics.LLM_SECONDS.labels("chat", "stream").observe(time.perf_counter() - self.started)
+        if self.usage is not None:
+            metrics.record_usage("chat", self.usage)
+        else:
+            # Streams only report usage when the API version supports stream_options
+            metrics.LLM_TOKENS.labels("chat", "prompt").inc(prompt_tokens)
+            completion = "".join(self.content) + "".join(call["arguments"] for call in self.tool_calls.values())
+            metrics.LLM_TOKENS.labels("chat", "completion").inc(count_tokens(completion))
+        return [self.tool_calls[i] for i in sorted(self.tool_calls)]
+
+    @property
+    def text(self):
+        return "".join(self.content) or None
+
+def get_completion(query, index=None, history=None, top_k=None, temperature=None, tables=None, summary=None):
+    """
+    Get completion from Azure OpenAI based on query, retrieved context, and chat history.
+
+    Args:
+        query (str): User's question
+        index (BM25Index): Retrieval index built from the uploaded PDF/websites
+        history (list): Previous chat history
+        top_k (int): Number of context chunks to send (defaults to RETRIEVAL_TOP_K)
+        temperature (float): Sampling temperature (defaults to CHAT_TEMPERATURE)
+        tables (list): Table store IDs of the uploaded CSV files, queried with the run_sql tool
+        summary (dict): Summary message of the conversation before the history
+
+    Returns:
+        str: AI-generated response
+    """
+    return _get_completion(ChatRequest(query, index, history, top_k, temperature, tables, summary))
+
+def _get_completion(chat):
+    """Run the completion of a ChatRequest for get_completion(); chat.failed tells whether it failed."""
+    debug_log(f"Getting completion for query: {chat.query[:50]}...")
+    try:
+        error = chat.prepare()
+        if error is not None:
+            return error
+
+        # Tabular questions can take a few rounds of SQL queries before the answer
+        for rounds in range(SQL_MAX_TOOL_ROUNDS + 1):
+            # The shared client keeps its connection pool warm across requests
+            debug_log(f"Sending request to OpenAI API with {len(chat.messages)} messages")
+            with metrics.timed(metrics.LLM_SECONDS, "chat", "complete"):
+                response = client_manager.chat_completion(chat.messages, **chat.completion_args(rounds))
+            metrics.record_usage("chat", getattr(response, "usage", None))
+            message = response.choices[0].message
+            tool_calls = _message_tool_calls(message)
+            if not tool_calls:
+                break
+            chat.add_tool_messages(_run_tool_calls(chat.sql, tool_calls, message.content))
+
+        debug_log("Response received successfully")
+        return message.content
+
+    except Exception as e:
+        return chat.fail(e, "get_completion")
+    finally:
+        chat.close()
+
+def stream_completion(query, index=None, history=None, top_k=None, temperature=None, tables=None, summary=None):
+    """
+    Stream a completion from Azure OpenAI token by token.
+
+    Errors are reported the same way as get_completion(), as text in the
+    response. Closing the generator (e.g. because the browser disconnected)
+    closes the upstream HTTP response, which cancels generation. Tool calls
+    are collected from the stream and answered before streaming resumes.
+
+    Args:
+        query (str): User's question
+        index (BM25Index): Retrieval index built from the uploaded PDF/websites
+        history (list): Previous chat history
+        top_k (int): Number of context chunks to send (defaults to RETRIEVAL_TOP_K)
+        temperature (float): Sampling temperature (defaults to CHAT_TEMPERATURE)
+        tables (list): Table store IDs of the uploaded CSV files, queried with the run_sql tool
+        summary (dict): Summary message of the conversation before the history
+
+    Yields:
+        str: Fragments of the AI-generated response
+    """
+    yield from _stream_completion(ChatRequest(query, index, history, top_k, temperature, tables, summary))
+
+def _stream_completion(chat):
+    """Stream the completion of a ChatRequest for stream_completion(); chat.failed tells whether it failed."""
+    debug_log(f"Streaming completion for query: {chat.query[:50]}...")
+    stream = None
+    try:
+        error = chat.prepare()
+        if error is not None:
+            yield error
+            return
+
+        for rounds in range(SQL_MAX_TOOL_ROUNDS + 1):
+            debug_log(f"Sending streaming request to OpenAI API with {len(chat.messages)} messages")
+            turn = StreamRound()
+            stream = client_manager.chat_completion(chat.messages, **chat.completion_args(rounds, stream=True))
+            for chunk in stream:
+                fragment = turn.add(chunk)
+                if fragment:
+                    yield fragment
+            stream.close()
+            stream = None
+
+            tool_calls = turn.finish(chat.prompt_tokens)
+            if not tool_calls:
+                break
+            chat.add_tool_messages(_run_tool_calls(chat.sql, tool_calls, turn.text))
+
+        debug_log("Stream completed successfully")
+
+    except GeneratorExit:
+        debug_log("Stream closed by client, cancelling upstream request")
+        raise
+    except Exception as e:
+        yield chat.fail(e, "stream_completion")
+    finally:
+        if stream is not None:
+            stream.close()
+        chat.close()
+
+
+def response_cache_key(query, index=None, history=None, top_k=None, tables=None, summary=None):
+    """
+    Build the response cache key for a question.
+
+    The key covers the document set, the normalized question, the history
+    window that is sent with it, the conversation summary and the settings that shape the answer.
+
+    Args:
+        query (str): User's question
+        index (BM25Index): Retrieval index built from the uploaded PDF/websites
+        history (list): Previous chat history
+        top_k (int): Number of context chunks to send (defaults to RETRIEVAL_TOP_K)
+        tables (list): Table store IDs of the uploaded CSV files
+        summary (dict): Summary message of the conversation before the history
+
+    Returns:
+        str: Cache key
+    """
+    window = [message for message in history or [] if message["role"] != "system"]
+    if window and window[-1]["role"] == "user" and window[-1]["content"] == query:
+        window = window[:-1]
+    window = window[-HISTORY_MAX_MESSAGES:] if HISTORY_MAX_MESSAGES else []
+
+    settings = {
+        "deployment": get_settings().openai_deployment,
+        "system_prompt": get_system_prompt(),
+        "top_k": top_k,
+        "budget": PROMPT_TOKEN_BUDGET,
+        "max_tokens": COMPLETION_MAX_TOKENS,
+        "sql": sorted(tables) if SQL_ENABLED and tables else None,
+        "summary": summary["content"] if summary else None,
     }
+    return make_key(index.fingerprint() if index else "", query, window, settings)
 
-    response = requests.post(url, headers=headers, json=payload)
-    response.raise_for_status()
-    debug_log("REST API call completed successfully")
-    return response.json()
+def _use_cache(regenerate, temperature):
+    """Regenerate requests that sample a new answer bypass the cache."""
+    temperature = CHAT_TEMPERATURE if temperature is None else temperature
+    return not (regenerate and temperature > 0)
 
-def call_azure_openai_api_v2(endpoint, api_key, deployment_name, messages):
+def get_cached_completion(query, index=None, history=None, top_k=None, temperature=None, regenerate=False, tables=None,
+                          summary=None):
     """
-    Calls the Azure OpenAI API using the AzureOpenAI client for GPT-4.0.
+    Answer a question from the response cache, or with get_completion() on a miss.
 
     Args:
-        endpoint (str): The Azure OpenAI endpoint.
-        api_key (str): The API key for authentication.
-        deployment_name (str): The name of the deployed model.
-        messages (list): A list of messages for the chat completion.
+        query (str): User's question
+        index (BM25Index): Retrieval index built from the uploaded PDF/websites
+        history (list): Previous chat history
+        top_k (int): Number of context chunks to send (defaults to RETRIEVAL_TOP_K)
+        temperature (float): Sampling temperature (defaults to CHAT_TEMPERATURE)
+        regenerate (bool): The user asked for a new answer to the same question
+        tables (list): Table store IDs of the uploaded CSV files
+        summary (dict): Summary message of the conversation before the history
 
     Returns:
-        dict: The response from the Azure OpenAI API.
-    """
-    debug_log(f"Making SDK API call to Azure OpenAI deployment: {deployment_name}")
-    # Updated parameters for AzureOpenAI client
-    client = AzureOpenAI(
-        api_key=api_key,
-        api_version="2023-05-15",
-        azure_endpoint=endpoint,
-        azure_deployment=deployment_name
-    )
-    response = client.chat.completions.create(
-        deployment_id=deployment_name,
-        messages=messages,
-        max_tokens=1000,
-        temperature=0.7
-    )
-    debug_log("SDK API call completed successfully")
-    return response
+        tuple: (AI-generated response, whether it came from the cache)
+    """
+    cache = get_response_cache()
+    if cache is None or not _use_cache(regenerate, temperature):
+        return get_completion(query, index, history, top_k, temperature, tables, summary), False
+
+    key = response_cache_key(query, index, history, top_k, tables, summary)
+    response = cache.get(key)
+    if response is not None:
+        debug_log("Answer served from the response cache")
+        return response, True
 
-def get_completion(query, context, history=None):
+    chat = ChatRequest(query, index, history, top_k, temperature, tables, summary)
+    response = _get_completion(chat)
+    if not chat.failed and response:
+        cache.set(key, response)
+    return response, False
+
+def stream_cached_completion(query, index=None, history=None, top_k=None, temperature=None, regenerate=False, tables=None,
+                             summary=None):
     """
-    Get completion from Azure OpenAI based on query, context, and chat history.
-    
+    Stream an answer, replaying it from the response cache when possible.
+
+    A streamed answer is cached once it has been received completely; an
+    answer cut short by an error is not.
+
     Args:
         query (str): User's question
-        context (str): Context from PDF/websites
+        index (BM25Index): Retrieval index built from the uploaded PDF/websites
         history (list): Previous chat history
-    
+        top_k (int): Number of context chunks to send (defaults to RETRIEVAL_TOP_K)
+        temperature (float): Sampling temperature (defaults to CHAT_TEMPERATURE)
+        regenerate (bool): The user asked for a new answer to the same question
+        tables (list): Table store IDs of the uploaded CSV files
+        summary (dict): Summary message of the conversation before the history
+
+    Returns:
+        tuple: (iterator of response fragments, whether the answer came from the cache)
+    """
+    cache = get_response_cache()
+    if cache is None or not _use_cache(regenerate, temperature):
+        return stream_completion(query, index, history, top_k, temperature, tables, summary), False
+
+    key = response_cache_key(query, index, history, top_k, tables, summary)
+    response = cache.get(key)
+    if response is not None:
+        debug_log("Answer served from the response cache")
+        return iter([response]), True
+
+    def generate():
+        chat = ChatRequest(query, index, history, top_k, temperature, tables, summary)
+        parts = []
+        for fragment in _stream_completion(chat):
+            parts.append(fragment)
+            yield fragment
+        # Neither an error nor an answer cut short by a failure is cached
+        if not chat.failed and parts:
+            cache.set(key, "".join(parts))
+
+    return generate(), False
+
+async def get_completion_async(query, index=None, history=None, top_k=None, temperature=None, tables=None,
+                               summary=None):
+    """
+    Async variant of get_completion() for the ASGI app (asgi.py). Waiting for
+    the model does not hold a thread, so one worker process can keep
+    hundreds of completions in flight; SQL tool calls run on a thread.
+
+    Args:
+        query (str): User's question
+        index (BM25Index): Retrieval index built from the uploaded PDF/websites
+        history (list): Previous chat history
+        top_k (int): Number of context chunks to send (defaults to RETRIEVAL_TOP_K)
+        temperature (float): Sampling temperature (defaults to CHAT_TEMPERATURE)
+        tables (list): Table store IDs of the uploaded CSV files, queried with the run_sql tool
+        summary (dict): Summary message of the conversation before the history
+
     Returns:
         str: AI-generated response
     """
-    debug_log(f"Getting completion for query: {query[:50]}...")
-    
-    if history is None:
-        history = []
-    
-    # Get Azure OpenAI settings from environment variables
-    endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
-    api_key = os.getenv("AZURE_OPENAI_API_KEY")
-    deployment_name = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME")
-    api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2023-05-15")
-    
-    debug_log(f"Using endpoint: {endpoint}, deployment: {deployment_name}, API version: {api_version}")
-    
-    # Get system prompt from environment variable
-    system_prompt = os.getenv("SYSTEM_PROMPT", "You are a helpful assistant answering questions based on provided documents.")
-    
-    if not endpoint or not api_key or not deployment_name:
-        debug_log("Missing OpenAI configuration")
-        return "Error: Azure OpenAI settings are not configured properly. Please check your .env file."
-    
+    return await _get_completion_async(ChatRequest(query, index, history, top_k, temperature, tables, summary))
+
+async def _get_completion_async(chat):
+    """Run the completion of a ChatRequest for get_completion_async(); chat.failed tells whether it failed."""
+    debug_log(f"Getting async completion for query: {chat.query[:50]}...")
     try:
-        debug_log("Creating AzureOpenAI client")
-        
-        # Use the correct parameter names as per your working code
-        client = AzureOpenAI(
-            azure_endpoint=endpoint,
-            api_key=api_key,
-            api_version=api_version
-        )
-        debug_log("Client created successfully")
-        
-        messages = [
-            {"role": "system", "content": system_prompt}
-        ]
-        
-        # Add relevant context if available
-        if context:
-            debug_log(f"Adding context to messages (length: {len(context)} characters)")
-            messages.append({
-                "role": "system", 
-                "content": f"Use the following information to answer the user's question. If the information doesn't contain the answer, say that you don't know based on the provided documents:\n\n{context}"
-            })
-        
-        # Add chat history
-        debug_log(f"Adding chat history (entries: {len(history)})")
-        recent_history = history[-6:] if len(history) > 6 else history
-        for message in recent_history:
-            if message["role"] != "system":  # Skip system messages in history
-                messages.append({"role": message["role"], "content": message["content"]})
-        
-        # Add current query if not already in messages
-        if not any(m["content"] == query and m["role"] == "user" for m in messages):
-            messages.append({"role": "user", "content": query})
-        
-        # Get completion - Use deployment_id here as per API requirements
-        debug_log(f"Sending request to OpenAI API with {len(messages)} messages")
-        
-        response = client.chat.completions.create(
-            model=deployment_name,
-            messages=messages,
-            max_tokens=1000,
-            temperature=0.7
-        )
-        
+        # Retrieval (query embedding, document store reads) and opening the SQL session block
+        error = await asyncio.to_thread(chat.prepare)
+        if error is not None:
+            return error
+
+        for rounds in range(SQL_MAX_TOOL_ROUNDS + 1):
+            debug_log(f"Sending async request to OpenAI API with {len(chat.messages)} messages")
+            with metrics.timed(metrics.LLM_SECONDS, "chat", "complete"):
+                response = await client_manager.chat_completion_async(chat.messages, **chat.completion_args(rounds))
+            metrics.record_usage("chat", getattr(response, "usage", None))
+            message = response.choices[0].message
+            tool_calls = _message_tool_calls(message)
+            if not tool_calls:
+                break
+            chat.add_tool_messages(await asyncio.to_thread(_run_tool_calls, chat.sql, tool_calls, message.content))
+
         debug_log("Response received successfully")
-        return response.choices[0].message.content
-    
+        return message.content
+
     except Exception as e:
-        debug_log(f"ERROR: Exception in get_completion: {str(e)}")
-        if DEBUG:
-            debug_log("Full traceback:")
-            traceback.print_exc(file=sys.stdout)
-        
-        return f"Sorry, I encountered an error when generating a response. Error details: {str(e)}"
+        return chat.fail(e, "get_completion_async")
+    finally:
+        await asyncio.to_thread(chat.close)
+
+def stream_completion_async(query, index=None, history=None, top_k=None, temperature=None, tables=None,
+                            summary=None):
+    """
+    Async variant of stream_completion() for the ASGI app (asgi.py).
+
+    Cancelling the consuming task (e.g. because the browser disconnected)
+    closes the upstream HTTP response, which cancels generation.
+
+    Args:
+        query (str): User's question
+        index (BM25Index): Retrieval index built from the uploaded PDF/websites
+        history (list): Previous chat history
+        top_k (int): Number of context chunks to send (defaults to RETRIEVAL_TOP_K)
+        temperature (float): Sampling temperature (defaults to CHAT_TEMPERATURE)
+        tables (list): Table store IDs of the uploaded CSV files, queried with the run_sql tool
+        summary (dict): Summary message of the conversation before the history
+
+    Returns:
+        async iterator: Fragments of the AI-generated response
+    """
+    # Returned rather than re-yielded, so closing the stream closes the upstream response right away
+    return _stream_completion_async(ChatRequest(query, index, history, top_k, temperature, tables, summary))
+
+async def _stream_completion_async(chat):
+    """Stream the completion of a ChatRequest for stream_completion_async(); chat.failed tells whether it failed."""
+    debug_log(f"Streaming async completion for query: {chat.query[:50]}...")
+    stream = None
+    try:
+        error = await asyncio.to_thread(chat.prepare)
+        if error is not None:
+            yield error
+            return
+
+        for rounds in range(SQL_MAX_TOOL_ROUNDS + 1):
+            debug_log(f"Sending async streaming request to OpenAI API with {len(chat.messages)} messages")
+            turn = StreamRound()
+            stream = await client_manager.chat_completion_async(chat.messages,
+                                                                **chat.completion_args(rounds, stream=True))
+            async for chunk in stream:
+                fragment = turn.add(chunk)
+                if fragment:
+                    yield fragment
+            await stream.close()
+            stream = None
+
+            tool_calls = turn.finish(chat.prompt_tokens)
+            if not tool_calls:
+                break
+            chat.add_tool_messages(await asyncio.to_thread(_run_tool_calls, chat.sql, tool_calls, turn.text))
+
+        debug_log("Stream completed successfully")
+
+    except (GeneratorExit, asyncio.CancelledError):
+        debug_log("Stream closed by client, cancelling upstream request")
+        raise
+    except Exception as e:
+        yield chat.fail(e, "stream_completion_async")
+    finally:
+        if stream is not None:
+            await stream.close()
+        await asyncio.to_thread(chat.close)
+
+async def get_cached_completion_async(query, index=None, history=None, top_k=None, temperature=None, regenerate=False,
+                                      tables=None, summary=None):
+    """
+    Async variant of get_cached_completion(); cache lookups run on a thread.
+
+    Returns:
+        tuple: (AI-generated response, whether it came from the cache)
+    """
+    cache = get_response_cache()
+    if cache is None or not _use_cache(regenerate, temperature):
+        return await get_completion_async(query, index, history, top_k, temperature, tables, summary), False
+
+    key = response_cache_key(query, index, history, top_k, tables, summary)
+    response = await asyncio.to_thread(cache.get, key)
+    if response is not None:
+        debug_log("Answer served from the response cache")
+        return response, True
+
+    chat = ChatRequest(query, index, history, top_k, temperature, tables, summary)
+    response = await _get_completion_async(chat)
+    if not chat.failed and response:
+        await asyncio.to_thread(cache.set, key, response)
+    return response, False
+
+async def stream_cached_completion_async(query, index=None, history=None, top_k=None, temperature=None,
+                                         regenerate=False, tables=None, summary=None):
+    """
+    Async variant of stream_cached_completion(); cache lookups run on a thread.
+
+    Returns:
+        tuple: (async iterator of response fragments, whether the answer came from the cache)
+    """
+    cache = get_response_cache()
+    if cache is None or not _use_cache(regenerate, temperature):
+        return stream_completion_async(query, index, history, top_k, temperature, tables, summary), False
+
+    key = response_cache_key(query, index, history, top_k, tables, summary)
+    response = await asyncio.to_thread(cache.get, key)
+    if response is not None:
+        debug_log("Answer served from the response cache")
+
+        async def replay():
+            yield response
+        return replay(), True
+
+    async def generate():
+        chat = ChatRequest(query, index, history, top_k, temperature, tables, summary)
+        parts = []
+        async for fragment in _stream_completion_async(chat):
+            parts.append(fragment)
+            yield fragment
+        # Neither an error nor an answer cut short by a failure is cached
+        if not chat.failed and parts:
+            await asyncio.to_thread(cache.set, key, "".join(parts))
+
+    return generate(), False
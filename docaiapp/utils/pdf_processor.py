@@ -1,62 +1,201 @@
 import io
 import fitz  # PyMuPDF
+import multiprocessing
 import re
 import os
-from dotenv import load_dotenv
+import tempfile
 from werkzeug.datastructures import FileStorage
+from docaiapp.utils.config import DEBUG, env_int
 
-# Load environment variables and set up debug functionality
-load_dotenv()
-DEBUG = os.getenv("DEBUG", "False").lower() in ["true", "1", "t", "yes", "y"]
+# Maximum number of pages extracted from one PDF (0 for no limit)
+PDF_MAX_PAGES = env_int("PDF_MAX_PAGES", 0, minimum=0)
+# Pages extracted per worker process task; longer PDFs are split across processes
+PDF_PAGES_PER_TASK = env_int("PDF_PAGES_PER_TASK", 50, minimum=1)
+
+# Bump when the extracted output changes so cached extractions are not reused
+PROCESSOR_VERSION = f"1:{PDF_MAX_PAGES}"
+
+WHITESPACE_PATTERN = re.compile(r'\s+')
 
 def debug_log(message):
     if DEBUG:
         print(f"DEBUG [PDF Processor]: {message}")
 
-def process_pdf(file_obj):
+def iter_pdf_pages(doc, start, stop):
+    """
+    Extract the text of a range of pages, one page at a time.
+
+    Args:
+        doc (fitz.Document): Open PDF document
+        start (int): Index of the first page (0-based)
+        stop (int): Index after the last page
+
+    Yields:
+        tuple: (page number, cleaned page text)
+    """
+    for page_num in range(start, stop):
+        page = doc.load_page(page_num)
+        # Replace multiple spaces with single space
+        page_text = WHITESPACE_PATTERN.sub(' ', page.get_text()).strip()
+        yield page_num + 1, page_text
+
+def extract_page_range(pdf, start, stop):
+    """
+    Extract a range of pages as markdown sections. Runs in a worker process.
+
+    Args:
+        pdf (bytes or str): PDF content, or the path of a PDF file
+        start (int): Index of the first page (0-based)
+        stop (int): Index after the last page
+
+    Returns:
+        str: One "## Page N" section per page with text
+    """
+    doc = fitz.open(stream=pdf, filetype="pdf") if isinstance(pdf, bytes) else fitz.open(pdf)
+    try:
+        return "".join(f"## Page {page_number}\n\n{page_text}\n\n"
+                       for page_number, page_text in iter_pdf_pages(doc, start, stop) if page_text)
+    finally:
+        doc.close()
+
+def _time_left(start):
+    """Return the time left for this PDF (None without a limit), raising TimeoutError once it is up."""
+    from docaiapp.utils.ingest import remaining_time
+    seconds = remaining_time()
+    if seconds is not None and seconds <= 0:
+        raise TimeoutError(f"timed out at page {start + 1}")
+    return seconds
+
+def _get_worker_pool():
+    """Return the ingest process pool, or None when pages should be extracted in this process."""
+    if multiprocessing.parent_process() is not None:
+        # Already running in a worker process; don't start a nested pool
+        return None
+    from docaiapp.utils.ingest import get_cpu_pool
+    return get_cpu_pool()
+
+def iter_pdf_sections(pdf_bytes, start, stop):
+    """
+    Extract pages as markdown sections, in page order, as they become available.
+
+    Page ranges of PDF_PAGES_PER_TASK pages are extracted in parallel on the
+    ingest process pool. Workers read a long PDF from a temporary file instead
+    of receiving a copy of it, and only the text of the ranges in flight is
+    held in memory. When the PDF is ingested with a timeout (see
+    ingest.remaining_time()), each task is interrupted once the time is up.
+
+    Args:
+        pdf_bytes (bytes): PDF content
+        start (int): Index of the first page (0-based)
+        stop (int): Index after the last page
+
+    Yields:
+        str: Markdown for a range of pages
+    """
+    ranges = [(first, min(first + PDF_PAGES_PER_TASK, stop)) for first in range(start, stop, PDF_PAGES_PER_TASK)]
+    pool = _get_worker_pool()
+
+    if pool is None:
+        for first, last in ranges:
+            _time_left(first)
+            yield extract_page_range(pdf_bytes, first, last)
+        return
+
+    from docaiapp.utils.ingest import run_with_time_limit
+
+    def submit(pdf, first, last):
+        seconds = _time_left(first)
+        if seconds is None:
+            return pool.submit(extract_page_range, pdf, first, last)
+        return pool.submit(run_with_time_limit, extract_page_range, seconds, pdf, first, last)
+
+    if len(ranges) == 1:
+        yield submit(pdf_bytes, start, stop).result(timeout=_time_left(start))
+        return
+
+    debug_log(f"Extracting pages {start + 1}-{stop} in {len(ranges)} parallel tasks")
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    futures = []
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf_bytes)
+        futures = [submit(path, first, last) for first, last in ranges]
+        for (first, _), future in zip(ranges, futures):
+            yield future.result(timeout=_time_left(first))
+    finally:
+        for future in futures:
+            future.cancel()
+        # Wait for running tasks before removing the file they read
+        for future in futures:
+            if not future.cancelled():
+                try:
+                    future.result()
+                except Exception:
+                    pass
+        os.unlink(path)
+
+def stream_pdf(file_obj, first_page=None, last_page=None):
+    """
+    Extract a PDF file as markdown, yielding it in pieces as the page
+    ranges are extracted, so a long PDF can be chunked and stored without
+    holding its whole text (see retrieval.store_document()).
+
+    Args:
+        file_obj: File object from request.files
+        first_page (int): First page to extract (1-based, defaults to the first page)
+        last_page (int): Last page to extract (1-based, inclusive, defaults to the last
+            page, limited to PDF_MAX_PAGES pages)
+
+    Yields:
+        str: The title, then the markdown of each range of pages
+
+    Raises:
+        Exception: If the PDF cannot be read; pieces yielded before are incomplete
+    """
+    filename = getattr(file_obj, 'filename', 'Unnamed Document')
+    debug_log(f"Processing PDF file: {filename}")
+
+    # Get the file content
+    if isinstance(file_obj, FileStorage):
+        pdf_bytes = file_obj.read()
+        file_obj.close()
+    elif isinstance(file_obj, io.BytesIO):
+        pdf_bytes = file_obj.getvalue()
+    else:
+        # If it's already a bytes object
+        pdf_bytes = file_obj
+
+    # Read the page count
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        page_count = len(doc)
+    debug_log(f"PDF opened successfully with {page_count} pages")
+
+    start = max(0, (first_page or 1) - 1)
+    stop = min(page_count, last_page or page_count)
+    if PDF_MAX_PAGES and stop - start > PDF_MAX_PAGES:
+        stop = start + PDF_MAX_PAGES
+
+    yield f"# Document: {filename}\n\n"
+    yield from iter_pdf_sections(pdf_bytes, start, stop)
+
+    if start < stop and stop - start < page_count:
+        yield f"_Pages {start + 1}-{stop} of {page_count} were processed._\n"
+
+def process_pdf(file_obj, first_page=None, last_page=None):
     """
     Process a PDF file and extract text content in markdown format.
-    
+
     Args:
         file_obj: File object from request.files
-        
+        first_page (int): First page to extract (1-based, defaults to the first page)
+        last_page (int): Last page to extract (1-based, inclusive, defaults to the last
+            page, limited to PDF_MAX_PAGES pages)
+
     Returns:
         str: Extracted text content in markdown format
     """
-    debug_log(f"Processing PDF file: {getattr(file_obj, 'filename', 'Unnamed Document')}")
-    
     try:
-        # Get the file content
-        if isinstance(file_obj, FileStorage):
-            pdf_bytes = file_obj.read()
-            file_obj.close()
-            pdf_stream = io.BytesIO(pdf_bytes)
-        else:
-            # If it's already a bytes object or BytesIO
-            pdf_stream = file_obj if isinstance(file_obj, io.BytesIO) else io.BytesIO(file_obj)
-        
-        # Open the PDF
-        doc = fitz.open(stream=pdf_stream, filetype="pdf")
-        debug_log(f"PDF opened successfully with {len(doc)} pages")
-        
-        # Initialize document content
-        content = f"# Document: {getattr(file_obj, 'filename', 'Unnamed Document')}\n\n"
-        
-        # Extract text from each page
-        for page_num, page in enumerate(doc):
-            debug_log(f"Extracting text from page {page_num + 1}/{len(doc)}")
-            page_text = page.get_text()
-            
-            # Clean up text
-            page_text = re.sub(r'\s+', ' ', page_text)  # Replace multiple spaces with single space
-            page_text = page_text.strip()
-            
-            if page_text:
-                content += f"## Page {page_num + 1}\n\n{page_text}\n\n"
-        
-        # Close the document
-        doc.close()
-        
+        content = "".join(stream_pdf(file_obj, first_page, last_page))
         debug_log(f"PDF processing complete: {len(content)} characters extracted")
         return content.strip()
     except Exception as e:
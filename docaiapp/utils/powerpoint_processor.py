@@ -1,11 +1,10 @@
 import io
-import os
-from dotenv import load_dotenv
+import pptx
 from werkzeug.datastructures import FileStorage
+from docaiapp.utils.config import DEBUG
 
-# Load environment variables and set up debug functionality
-load_dotenv()
-DEBUG = os.getenv("DEBUG", "False").lower() in ["true", "1", "t", "yes", "y"]
+# Bump when the extracted output changes so cached extractions are not reused
+PROCESSOR_VERSION = "1"
 
 def debug_log(message):
     if DEBUG:
@@ -24,16 +23,6 @@ def process_powerpoint(file_obj):
     debug_log(f"Processing PowerPoint file: {getattr(file_obj, 'filename', 'Unnamed Presentation')}")
     
     try:
-        # Import pptx package here to avoid dependency issues if not installed
-        try:
-            import pptx
-        except ImportError:
-            debug_log("python-pptx package not installed. Installing...")
-            import subprocess
-            subprocess.check_call(["pip", "install", "python-pptx"])
-            import pptx
-            debug_log("python-pptx package installed successfully")
-        
         # Get the file content
         if isinstance(file_obj, FileStorage):
             pptx_bytes = file_obj.read()
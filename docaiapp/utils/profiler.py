@@ -0,0 +1,285 @@
+"""
+Sampling profiler for slow chat requests and upload jobs.
+
+When PROFILING_ENABLED is set, a background thread in each worker process
+samples the Python stacks of all threads every PROFILING_INTERVAL seconds
+while a request or upload job is being profiled. Sampling costs the same
+for every request, so each one can be recorded and the profile kept only
+afterwards: for a random PROFILING_SAMPLE_RATE share of requests and for
+every request that took at least PROFILING_SLOW_SECONDS.
+
+A kept profile is written to PROFILING_DIR as collapsed stacks
+("<id>.folded", one "frame;frame;... count" line per stack, readable by
+speedscope and flamegraph.pl) next to its metadata ("<id>.json": endpoint,
+status, duration, file types, prompt size). The profiled thread is always
+included; other threads only while they are busy, so the work of the
+ingest threads (Document Intelligence, website fetches, PDF extraction)
+shows up in upload job profiles. Parsing in the ingest process pool runs
+in other processes and appears as waiting for its futures; set
+INGEST_CPU_WORKERS=0 to profile it in-process.
+
+When profiling is disabled nothing is installed and start() returns None.
+"""
+
+import json
+import os
+import random
+import sys
+import sysconfig
+import threading
+import time
+import uuid
+from collections import Counter
+from docaiapp.utils.config import DEBUG, env_bool, env_float, env_int, env_str
+
+PROFILING_ENABLED = env_bool("PROFILING_ENABLED", False)
+PROFILING_SAMPLE_RATE = env_float("PROFILING_SAMPLE_RATE", 0.01)
+PROFILING_SLOW_SECONDS = env_float("PROFILING_SLOW_SECONDS", 10)
+PROFILING_INTERVAL = env_float("PROFILING_INTERVAL", 0.01)
+PROFILING_DIR = env_str("PROFILING_DIR", os.path.join("cache", "profiles"))
+PROFILING_MAX_FILES = env_int("PROFILING_MAX_FILES", 200)
+# Token for the /admin/profiles endpoints; they are disabled without one
+PROFILING_ADMIN_TOKEN = env_str("PROFILING_ADMIN_TOKEN", "")
+
+# Leaf frames of threads that are waiting for work; they are left out of
+# the profile unless it is the profiled thread itself
+IDLE_FRAMES = frozenset([
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+])
+MAX_STACK_DEPTH = 128
+STDLIB_DIR = sysconfig.get_paths()["stdlib"] + os.sep
+
+_samplers = {}
+_lock = threading.Lock()
+_current = threading.local()
+
+def debug_log(message):
+    if DEBUG:
+        print(f"DEBUG [Profiler]: {message}")
+
+
+class Recording:
+    """
+    Stack samples and metadata of one profiled request or job.
+    """
+
+    def __init__(self, name, metadata):
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.name = name
+        self.thread_id = threading.get_ident()
+        self.metadata = dict(metadata)
+        self.started = time.time()
+        self.started_monotonic = time.perf_counter()
+        self.sampled = random.random() < PROFILING_SAMPLE_RATE
+        self.stacks = Counter()
+        self.samples = 0
+
+
+class Sampler:
+    """
+    Background thread that samples the stacks of all threads while any
+    recording is active.
+    """
+
+    def __init__(self, interval=None):
+        self.interval = interval or PROFILING_INTERVAL
+        self._recordings = {}
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def add(self, recording):
+        with self._lock:
+            self._recordings[recording.id] = recording
+            self._active.set()
+
+    def remove(self, recording):
+        with self._lock:
+            self._recordings.pop(recording.id, None)
+            if not self._recordings:
+                self._active.clear()
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            self._active.wait()
+            time.sleep(self.interval)
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            # Held while sampling, so a removed recording is no longer written to
+            with self._lock:
+                recordings = list(self._recordings.values())
+                if not recordings:
+                    continue
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own:
+                        continue
+                    stack, idle = _collapse(frame)
+                    stack = f"{names.get(thread_id, thread_id)};{stack}"
+                    for recording in recordings:
+                        if thread_id == recording.thread_id or not idle:
+                            recording.stacks[stack] += 1
+                for recording in recordings:
+                    recording.samples += 1
+
+def _frame_label(code):
+    path = code.co_filename
+    marker = "site-packages" + os.sep
+    if marker in path:
+        path = path.split(marker, 1)[1]
+    elif path.startswith(STDLIB_DIR):
+        path = path[len(STDLIB_DIR):]
+    elif path.startswith(os.getcwd()):
+        path = os.path.relpath(path)
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({path}:{code.co_firstlineno})"
+
+def _collapse(frame):
+    """
+    Collapse a thread's stack into one line, outermost frame first.
+
+    Returns:
+        tuple: (frames joined by ";", whether the thread is waiting for work)
+    """
+    leaf = frame.f_code
+    frames = []
+    while frame is not None and len(frames) < MAX_STACK_DEPTH:
+        frames.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    idle = (os.path.basename(leaf.co_filename), leaf.co_name) in IDLE_FRAMES
+    return ";".join(reversed(frames)), idle
+
+def _get_sampler():
+    # Threads do not survive a fork, so each worker process starts its own sampler
+    pid = os.getpid()
+    if pid not in _samplers:
+        with _lock:
+            if pid not in _samplers:
+                _samplers.clear()
+                _samplers[pid] = Sampler()
+    return _samplers[pid]
+
+def start(name, **metadata):
+    """
+    Start profiling the calling thread.
+
+    Args:
+        name (str): What is profiled, e.g. the endpoint or "upload_job"
+        **metadata: Details stored with the profile
+
+    Returns:
+        Recording: The recording to pass to finish(), or None if profiling is disabled
+    """
+    if not PROFILING_ENABLED:
+        return None
+    recording = Recording(name, metadata)
+    _current.recording = recording
+    _get_sampler().add(recording)
+    return recording
+
+def annotate(**metadata):
+    """Add details to the profile of the calling thread, if it is being profiled."""
+    recording = getattr(_current, "recording", None)
+    if recording is not None:
+        recording.metadata.update(metadata)
+
+def finish(recording, **metadata):
+    """
+    Stop profiling and write the profile if the recording was sampled or slow.
+
+    Args:
+        recording (Recording): Recording from start() (None is ignored)
+        **metadata: Details known only at the end, e.g. the response status
+
+    Returns:
+        str: ID of the written profile, or None
+    """
+    if recording is None:
+        return None
+    _get_sampler().remove(recording)
+    if getattr(_current, "recording", None) is recording:
+        _current.recording = None
+
+    duration = time.perf_counter() - recording.started_monotonic
+    slow = duration >= PROFILING_SLOW_SECONDS
+    if not (recording.sampled or slow) or not recording.stacks:
+        return None
+
+    recording.metadata.update(metadata)
+    info = {
+        "id": recording.id,
+        "name": recording.name,
+        "started": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(recording.started)),
+        "duration": round(duration, 3),
+        "reason": "slow" if slow else "sampled",
+        "pid": os.getpid(),
+        "samples": recording.samples,
+        "interval": _get_sampler().interval,
+        **recording.metadata,
+    }
+    try:
+        os.makedirs(PROFILING_DIR, exist_ok=True)
+        with open(os.path.join(PROFILING_DIR, f"{recording.id}.folded"), "w") as f:
+            for stack, count in recording.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(os.path.join(PROFILING_DIR, f"{recording.id}.json"), "w") as f:
+            json.dump(info, f)
+        _prune()
+    except OSError as e:
+        debug_log(f"ERROR writing profile {recording.id}: {str(e)}")
+        return None
+    debug_log(f"Wrote {info['reason']} profile {recording.id} of {recording.name} ({duration:.2f}s)")
+    return recording.id
+
+def file_types(filenames):
+    """Count files by extension, for the profile metadata."""
+    return dict(Counter(os.path.splitext(name)[1].lower() or "none" for name in filenames))
+
+def _prune():
+    """Delete the oldest profiles beyond PROFILING_MAX_FILES."""
+    profiles = sorted(name[:-len(".json")] for name in os.listdir(PROFILING_DIR) if name.endswith(".json"))
+    for profile_id in profiles[:max(0, len(profiles) - PROFILING_MAX_FILES)]:
+        for extension in (".json", ".folded"):
+            try:
+                os.unlink(os.path.join(PROFILING_DIR, profile_id + extension))
+            except FileNotFoundError:
+                pass
+
+def list_profiles():
+    """
+    Return the metadata of the stored profiles, newest first.
+
+    Returns:
+        list: Metadata dicts as written by finish()
+    """
+    if not os.path.isdir(PROFILING_DIR):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(PROFILING_DIR), reverse=True):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(PROFILING_DIR, name)) as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+def profile_path(profile_id):
+    """
+    Return the collapsed stacks file of a profile.
+
+    Args:
+        profile_id (str): ID from list_profiles()
+
+    Returns:
+        str: Path of the file, or None if there is no such profile
+    """
+    if not profile_id.replace("-", "").isalnum():
+        return None
+    path = os.path.join(PROFILING_DIR, f"{profile_id}.folded")
+    return path if os.path.isfile(path) else None
@@ -0,0 +1,219 @@
+"""
+Token-budgeted prompt assembly.
+
+Messages are added to the prompt in priority order until the token budget
+is spent: the system prompt, the user's question, the running summary of
+older chat messages, the best matching document chunks, and finally as
+much recent chat history as still fits.
+Token counts come from the model's tokenizer (tiktoken) when it is
+available, and from a character-based estimate otherwise. Chunks and chat
+messages carry their token counts from when they were created, so packing
+a prompt does not re-tokenize them.
+"""
+
+import threading
+from docaiapp.utils.config import DEBUG, env_int, env_str
+
+TOKENIZER_ENCODING = env_str("TOKENIZER_ENCODING", "cl100k_base")
+PROMPT_TOKEN_BUDGET = env_int("PROMPT_TOKEN_BUDGET", 6000)
+HISTORY_MAX_MESSAGES = env_int("CHAT_HISTORY_MAX_MESSAGES", 6)
+
+# Fixed cost of every chat message (role and separators) and of priming the reply
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_OVERHEAD_TOKENS = 3
+
+# Used when tiktoken or its encoding files are not available
+CHARS_PER_TOKEN = 4
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n\n"
+CONTEXT_PREFIX = "Use the following information to answer the user's question. If the information doesn't contain the answer, say that you don't know based on the provided documents:\n\n"
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+def debug_log(message):
+    if DEBUG:
+        print(f"DEBUG [Prompt Packer]: {message}")
+
+def _get_encoding():
+    """Return the tiktoken encoding, or None if it cannot be loaded."""
+    global _encoding, _encoding_loaded
+
+    if not _encoding_loaded:
+        with _encoding_lock:
+            if not _encoding_loaded:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+                    debug_log(f"Using tiktoken encoding {TOKENIZER_ENCODING}")
+                except Exception as e:
+                    # Also covers encoding files that cannot be downloaded
+                    debug_log(f"tiktoken unavailable, estimating token counts: {str(e)}")
+                    _encoding = None
+                _encoding_loaded = True
+    return _encoding
+
+def count_tokens(text):
+    """
+    Count the tokens in a text.
+
+    Args:
+        text (str): Text to count
+
+    Returns:
+        int: Number of tokens
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+def truncate_tokens(text, max_tokens):
+    """
+    Shorten a text to at most max_tokens tokens.
+
+    Args:
+        text (str): Text to shorten
+        max_tokens (int): Token limit
+
+    Returns:
+        str: The text, cut at the token limit
+    """
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+
+def message_tokens(message):
+    """
+    Return the token count of a chat history message, using the count stored
+    on the message when it was created.
+
+    Args:
+        message (dict): Message with role, content and optionally tokens
+
+    Returns:
+        int: Number of tokens in the message content
+    """
+    tokens = message.get("tokens")
+    return count_tokens(message["content"]) if tokens is None else tokens
+
+def make_message(role, content):
+    """
+    Create a chat history message with its token count.
+
+    Args:
+        role (str): "user" or "assistant"
+        content (str): Message text
+
+    Returns:
+        dict: Message with role, content and tokens
+    """
+    return {"role": role, "content": content, "tokens": count_tokens(content)}
+
+def pack_prompt(system_prompt, query, chunks=None, history=None, budget=None, summary=None):
+    """
+    Build chat completion messages that fit within a token budget.
+
+    The system prompt and the query are always included (the query is
+    shortened if even it does not fit), followed by the conversation summary
+    if it fits. Chunks are added in the order given,
+    skipping any that no longer fit, then the most recent history messages
+    are added until the budget or HISTORY_MAX_MESSAGES is reached.
+
+    Args:
+        system_prompt (str): System prompt
+        query (str): User's question
+        chunks (list): Chunk objects, best first, with a tokens attribute
+        history (list): Previous chat messages, oldest first
+        budget (int): Maximum prompt tokens (defaults to PROMPT_TOKEN_BUDGET)
+        summary (dict): Summary message of the older conversation, or None
+
+    Returns:
+        tuple: (messages, stats) where stats is a dict of token counts for logging
+    """
+    budget = budget or PROMPT_TOKEN_BUDGET
+    chunks = chunks or []
+    history = list(history or [])
+
+    # The current question is usually already the last history entry
+    if history and history[-1]["role"] == "user" and history[-1]["content"] == query:
+        history.pop()
+
+    system_tokens = count_tokens(system_prompt) + MESSAGE_OVERHEAD_TOKENS
+    used = REPLY_OVERHEAD_TOKENS + system_tokens
+
+    query_tokens = count_tokens(query)
+    if used + query_tokens + MESSAGE_OVERHEAD_TOKENS > budget:
+        query = truncate_tokens(query, budget - used - MESSAGE_OVERHEAD_TOKENS)
+        debug_log(f"Query shortened from {query_tokens} tokens to fit the budget")
+        query_tokens = count_tokens(query)
+    used += query_tokens + MESSAGE_OVERHEAD_TOKENS
+
+    # Summary of the messages that are no longer kept verbatim
+    summary_tokens = 0
+    if summary:
+        cost = count_tokens(SUMMARY_PREFIX) + message_tokens(summary) + MESSAGE_OVERHEAD_TOKENS
+        if used + cost <= budget:
+            summary_tokens = cost
+            used += cost
+
+    # Context chunks, best first
+    selected = []
+    context_tokens = 0
+    separator_tokens = count_tokens("\n\n")
+    prefix_tokens = count_tokens(CONTEXT_PREFIX) + MESSAGE_OVERHEAD_TOKENS
+    for chunk in chunks:
+        tokens = chunk.tokens if getattr(chunk, "tokens", None) is not None else count_tokens(chunk.format())
+        cost = tokens + (separator_tokens if selected else prefix_tokens)
+        if used + cost > budget:
+            continue
+        selected.append(chunk)
+        context_tokens += cost
+        used += cost
+
+    # Recent history, newest first, then restored to chronological order
+    kept = []
+    history_tokens = 0
+    for message in reversed(history):
+        if len(kept) >= HISTORY_MAX_MESSAGES:
+            break
+        if message["role"] == "system":
+            continue
+        cost = message_tokens(message) + MESSAGE_OVERHEAD_TOKENS
+        if used + cost > budget:
+            break
+        kept.append(message)
+        history_tokens += cost
+        used += cost
+    kept.reverse()
+
+    messages = [{"role": "system", "content": system_prompt}]
+    if summary_tokens:
+        messages.append({"role": "system", "content": f"{SUMMARY_PREFIX}{summary['content']}"})
+    if selected:
+        context = "\n\n".join(chunk.format() for chunk in selected)
+        messages.append({"role": "system", "content": f"{CONTEXT_PREFIX}{context}"})
+    messages.extend({"role": message["role"], "content": message["content"]} for message in kept)
+    messages.append({"role": "user", "content": query})
+
+    stats = {
+        "budget": budget,
+        "total": used,
+        "system": system_tokens,
+        "query": query_tokens + MESSAGE_OVERHEAD_TOKENS,
+        "context": context_tokens,
+        "context_chunks": len(selected),
+        "dropped_chunks": len(chunks) - len(selected),
+        "summary": summary_tokens,
+        "history": history_tokens,
+        "history_messages": len(kept),
+        "tokenizer": TOKENIZER_ENCODING if _get_encoding() is not None else "estimate",
+    }
+    return messages, stats
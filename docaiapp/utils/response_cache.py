@@ -0,0 +1,273 @@
+"""
+Cache of chat answers shared across users.
+
+Many users upload the same documents and ask the same questions. An answer
+is cached under a key that combines a fingerprint of the document set, the
+normalized question, the chat history that is sent with it and the prompt
+settings, so a repeated question is answered without calling Azure OpenAI.
+
+The backend is selected with the RESPONSE_CACHE_BACKEND setting:
+    memory  - per-process LRU dictionary (default)
+    sqlite  - SQLite database shared by all workers on one host
+    redis   - Redis or any Redis-compatible server, shared by all hosts
+              (requires the redis package; configure the server with an
+              LRU maxmemory-policy to bound its size)
+    none    - caching disabled
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from docaiapp.utils.config import DEBUG, env_choice, env_int, env_str
+
+CACHE_BACKEND = env_choice("RESPONSE_CACHE_BACKEND", "memory", ("memory", "sqlite", "redis", "none"))
+CACHE_TTL = env_int("RESPONSE_CACHE_TTL", 24 * 60 * 60)
+CACHE_MAX_ENTRIES = env_int("RESPONSE_CACHE_MAX_ENTRIES", 10000)
+CACHE_PATH = env_str("RESPONSE_CACHE_PATH", os.path.join("cache", "response_cache.db"))
+CACHE_REDIS_URL = env_str("RESPONSE_CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+KEY_PREFIX = "docbot:response:"
+
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def debug_log(message):
+    if DEBUG:
+        print(f"DEBUG [Response Cache]: {message}")
+
+def normalize_query(query):
+    """
+    Normalize a question so trivially different phrasings share a cache entry.
+
+    Args:
+        query (str): User's question
+
+    Returns:
+        str: Lowercased question with collapsed whitespace and no trailing punctuation
+    """
+    return WHITESPACE_PATTERN.sub(" ", query.lower()).strip().rstrip("?!. ")
+
+def make_key(fingerprint, query, history, settings=None):
+    """
+    Build the cache key for a question.
+
+    Args:
+        fingerprint (str): Fingerprint of the document set ("" without documents)
+        query (str): User's question
+        history (list): Chat messages sent along with the question
+        settings (dict): Prompt settings that change the answer (model, system prompt, ...)
+
+    Returns:
+        str: Cache key
+    """
+    payload = json.dumps({
+        "documents": fingerprint,
+        "query": normalize_query(query),
+        "history": [[message["role"], message["content"]] for message in history],
+        "settings": settings or {},
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryBackend:
+    """
+    In-process LRU dictionary with per-entry expiry.
+    """
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or CACHE_MAX_ENTRIES
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SQLiteBackend:
+    """
+    SQLite table shared by the worker processes of one host, with expiry and
+    least recently used eviction.
+    """
+
+    def __init__(self, path=None, max_entries=None):
+        self.path = path or CACHE_PATH
+        self.max_entries = max_entries or CACHE_MAX_ENTRIES
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+        """)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl, now)
+            )
+            self._conn.execute("DELETE FROM responses WHERE expires_at < ?", (now,))
+            excess = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+                    (excess,)
+                )
+            self._conn.execute("COMMIT")
+
+
+class RedisBackend:
+    """
+    Redis (or Redis-compatible) server shared by all hosts. Entries expire
+    with the server-side TTL; size is bounded by the server's maxmemory-policy.
+    """
+
+    def __init__(self, url=None):
+        import redis
+        self._client = redis.Redis.from_url(url or CACHE_REDIS_URL, socket_timeout=1.0,
+                                            socket_connect_timeout=1.0)
+
+    def get(self, key):
+        value = self._client.get(KEY_PREFIX + key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key, value, ttl):
+        self._client.set(KEY_PREFIX + key, value.encode("utf-8"), ex=ttl)
+
+
+class ResponseCache:
+    """
+    Answer cache with hit and miss counters. Backend errors are logged and
+    treated as misses, so the cache can never fail a chat request.
+    """
+
+    def __init__(self, backend, ttl=None):
+        self.backend = backend
+        self.ttl = ttl or CACHE_TTL
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Look up a cached answer.
+
+        Args:
+            key (str): Key from make_key()
+
+        Returns:
+            str: The cached answer, or None
+        """
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            debug_log(f"ERROR reading response cache: {str(e)}")
+            value = None
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        debug_log(f"{'Hit' if value is not None else 'Miss'} ({self.hits} hits, {self.misses} misses)")
+        return value
+
+    def set(self, key, value):
+        """
+        Store an answer.
+
+        Args:
+            key (str): Key from make_key()
+            value (str): Answer text
+        """
+        try:
+            self.backend.set(key, value, self.ttl)
+        except Exception as e:
+            debug_log(f"ERROR writing response cache: {str(e)}")
+
+    def stats(self):
+        """
+        Return this process's hit and miss counts.
+
+        Returns:
+            dict: hits and misses
+        """
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def get_response_cache(backend=None):
+    """
+    Return the response cache for this process.
+
+    Args:
+        backend (str): "memory", "sqlite", "redis" or "none" (defaults to RESPONSE_CACHE_BACKEND)
+
+    Returns:
+        ResponseCache: The cache, or None if caching is disabled or the backend is unavailable
+    """
+    backend = (backend or CACHE_BACKEND).lower()
+    key = (backend, os.getpid())
+    if key not in _caches:
+        with _caches_lock:
+            if key not in _caches:
+                try:
+                    if backend == "memory":
+                        cache = ResponseCache(MemoryBackend())
+                    elif backend == "sqlite":
+                        cache = ResponseCache(SQLiteBackend())
+                    elif backend == "redis":
+                        cache = ResponseCache(RedisBackend())
+                    else:
+                        cache = None
+                except Exception as e:
+                    debug_log(f"ERROR creating {backend} response cache, caching disabled: {str(e)}")
+                    cache = None
+                _caches[key] = cache
+                debug_log(f"Using {backend} response cache" if cache else "Response cache disabled")
+    return _caches[key]
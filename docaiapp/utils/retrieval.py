@@ -0,0 +1,707 @@
+"""
+Retrieval module that splits processed documents into chunks and ranks them
+against a user query with BM25 (optionally fused with embedding similarity),
+so only the most relevant passages are sent to the language model instead of
+the whole corpus.
+
+Chunk text lives in the document store; an index only holds the search
+structures and a (document, position) reference for every chunk, and reads
+the text of the chunks it selects.
+"""
+
+import hashlib
+import heapq
+import math
+import re
+from docaiapp.utils.config import DEBUG, env_int
+from docaiapp.utils.document_store import get_document_store
+from docaiapp.utils.embeddings import get_embedder
+from docaiapp.utils.prompt_packer import count_tokens
+from docaiapp.utils.vector_store import VectorStore
+
+# Retrieval settings
+CHUNK_SIZE = env_int("RETRIEVAL_CHUNK_SIZE", 1500, minimum=1)
+CHUNK_OVERLAP = env_int("RETRIEVAL_CHUNK_OVERLAP", 200, minimum=0)
+TOP_K = env_int("RETRIEVAL_TOP_K", 5, minimum=1)
+
+# Reciprocal rank fusion constant used to merge lexical and semantic rankings
+RRF_K = 60
+
+HEADING_PATTERN = re.compile(r'^(#{1,6})\s+(.*)$')
+SENTENCE_PATTERN = re.compile(r'(?<=[.!?])\s+')
+TOKEN_PATTERN = re.compile(r'\w+')
+
+STOP_WORDS = frozenset([
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have",
+    "in", "is", "it", "its", "of", "on", "or", "that", "the", "this", "to", "was",
+    "were", "what", "when", "where", "which", "who", "will", "with", "how", "do",
+    "does", "can", "i", "you", "me", "my", "your", "about", "please", "tell",
+])
+
+def debug_log(message):
+    if DEBUG:
+        print(f"DEBUG [Retrieval]: {message}")
+
+def tokenize(text):
+    """
+    Split text into lowercase search terms, dropping common stop words.
+
+    Args:
+        text (str): Text to tokenize
+
+    Returns:
+        list: Search terms
+    """
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+
+class Chunk:
+    """
+    A passage of a processed document together with where it came from.
+    """
+
+    def __init__(self, source, heading, text, tokens=None):
+        self.source = source
+        self.heading = heading
+        self.text = text
+        self.tokens = tokens
+
+    def format(self):
+        """Render the chunk with its source label for inclusion in a prompt."""
+        label = f"{self.source} / {self.heading}" if self.heading else self.source
+        return f"--- {label} ---\n{self.text}"
+
+
+def _iter_lines(pieces):
+    """
+    Yield the lines of markdown that arrives in pieces (e.g. one per range of
+    PDF pages), the same lines as splitting the joined text would.
+    """
+    rest = ""
+    for piece in pieces:
+        lines = (rest + piece).splitlines(keepends=True)
+        rest = ""
+        # An unterminated line, or a "\r" that may be followed by "\n", continues in the next piece
+        if lines and (lines[-1].endswith("\r") or lines[-1].splitlines()[0] == lines[-1]):
+            rest = lines.pop()
+        for line in lines:
+            yield line.splitlines()[0]
+    if rest:
+        yield rest.splitlines()[0]
+
+def _split_sections(lines):
+    """
+    Split processor markdown into (heading, body) sections.
+
+    Sections with no body of their own (e.g. "## Slide 3" immediately followed by
+    "### Slide title") are folded into the next section's heading. Lines in
+    fenced code blocks are never headings.
+
+    Args:
+        lines (iterable): Lines of the markdown
+
+    Yields:
+        tuple: (heading, body)
+    """
+    heading_parts = []
+    body_lines = []
+    in_code = False
+
+    for line in lines:
+        if line.strip().startswith("```"):
+            in_code = not in_code
+        match = None if in_code else HEADING_PATTERN.match(line.strip())
+        if match:
+            body = "\n".join(body_lines).strip()
+            if body:
+                yield " > ".join(heading_parts), body
+                heading_parts.clear()
+            body_lines.clear()
+            heading_parts.append(match.group(2).strip())
+        else:
+            body_lines.append(line)
+
+    body = "\n".join(body_lines).strip()
+    if body:
+        yield " > ".join(heading_parts), body
+        heading_parts.clear()
+    if heading_parts:
+        # Trailing headings without a body still carry information
+        yield " > ".join(heading_parts[:-1]), heading_parts[-1]
+
+
+def _split_long_text(text, chunk_size):
+    """Break a single oversized paragraph into pieces no longer than chunk_size."""
+    lines = text.split("\n")
+    if len(lines) > 1:
+        # Keep markdown table headers on every piece so each chunk stays readable
+        if lines[0].startswith("|") and len(lines) > 2 and lines[1].startswith("| ---"):
+            header = "\n".join(lines[:2])
+            if len(header) < chunk_size // 2:
+                row_size = chunk_size - len(header) - 1
+                return [f"{header}\n{piece}" for piece in _pack(lines[2:], row_size, "\n")]
+        return _pack(lines, chunk_size, "\n")
+
+    sentences = SENTENCE_PATTERN.split(text)
+    if len(sentences) > 1:
+        return _pack(sentences, chunk_size, " ")
+
+    words = text.split(" ")
+    return _pack(words, chunk_size, " ")
+
+
+def _pack(parts, chunk_size, separator):
+    """Greedily join parts into pieces no longer than chunk_size."""
+    pieces = []
+    current = []
+    current_len = 0
+
+    for part in parts:
+        if len(part) > chunk_size:
+            if current:
+                pieces.append(separator.join(current))
+                current, current_len = [], 0
+            if separator == " " and " " not in part:
+                pieces.extend(part[i:i + chunk_size] for i in range(0, len(part), chunk_size))
+            else:
+                pieces.extend(_split_long_text(part, chunk_size))
+            continue
+
+        added_len = len(part) + (len(separator) if current else 0)
+        if current and current_len + added_len > chunk_size:
+            pieces.append(separator.join(current))
+            current, current_len = [], 0
+            added_len = len(part)
+        current.append(part)
+        current_len += added_len
+
+    if current:
+        pieces.append(separator.join(current))
+    return pieces
+
+
+def iter_chunks(source, content, chunk_size=None, overlap=None):
+    """
+    Split processed document markdown into retrieval chunks as it arrives.
+
+    Sections are taken from the headings the processors already emit
+    (## Page N, ## Slide N, document headings). Sections longer than the
+    chunk size are split on paragraph, line, sentence or word boundaries,
+    with the tail of the previous chunk repeated as overlap. Only the
+    section being split is held in memory.
+
+    Args:
+        source (str): Name of the file or website the content came from
+        content (str or iterable): Markdown produced by a document processor,
+            or the pieces of it a streaming processor yields
+        chunk_size (int): Maximum characters per chunk
+        overlap (int): Characters carried over between consecutive chunks
+
+    Yields:
+        Chunk: Chunks in document order
+    """
+    chunk_size = chunk_size or CHUNK_SIZE
+    overlap = CHUNK_OVERLAP if overlap is None else overlap
+    overlap = min(overlap, chunk_size // 2)
+
+    for heading, body in _split_sections(_iter_lines([content] if isinstance(content, str) else content)):
+        if len(body) <= chunk_size:
+            yield Chunk(source, heading, body)
+            continue
+
+        paragraphs = [p.strip() for p in re.split(r'\n\s*\n', body) if p.strip()]
+        pieces = _pack(paragraphs, chunk_size - overlap, "\n\n")
+        previous = ""
+        for piece in pieces:
+            text = piece
+            if previous and overlap:
+                tail = previous[-overlap:]
+                # Start the overlap on a word boundary
+                space = tail.find(" ")
+                tail = tail[space + 1:] if space != -1 else tail
+                text = f"{tail} {piece}" if tail else piece
+            yield Chunk(source, heading, text)
+            previous = piece
+
+def chunk_document(source, content, chunk_size=None, overlap=None):
+    """
+    Split processed document markdown into retrieval chunks.
+
+    Args:
+        source (str): Name of the file or website the content came from
+        content (str): Markdown produced by a document processor
+        chunk_size (int): Maximum characters per chunk
+        overlap (int): Characters carried over between consecutive chunks
+
+    Returns:
+        list: List of Chunk objects (see iter_chunks())
+    """
+    chunks = list(iter_chunks(source, content, chunk_size, overlap))
+    debug_log(f"Split {source} into {len(chunks)} chunks")
+    return chunks
+
+def store_document(source, content, chunk_size=None, overlap=None):
+    """
+    Chunk a processed document and write it to the document store.
+
+    Content from a streaming processor is chunked and written piece by
+    piece, so the whole document is never held in memory.
+
+    Args:
+        source (str): Name of the file or website the content came from
+        content (str or iterable): Markdown, or the pieces a streaming processor yields
+        chunk_size (int): Maximum characters per chunk
+        overlap (int): Characters carried over between consecutive chunks
+
+    Returns:
+        str: ID of the stored document
+    """
+    store = get_document_store()
+    if isinstance(content, str):
+        return store.put_document(source, chunk_document(source, content, chunk_size, overlap))
+    doc_id = store.write_document(source, iter_chunks(source, content, chunk_size, overlap))
+    debug_log(f"Stored {source} as {doc_id} while it was extracted")
+    return doc_id
+
+
+class BM25Index:
+    """
+    In-memory inverted index over document chunks with Okapi BM25 scoring.
+
+    The index is small enough to be cached and pickled cheaply: chunk text is
+    not kept in it, only the ID of the stored document each chunk belongs to.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        """
+        Initialize an empty index.
+
+        Args:
+            k1 (float): Term frequency saturation parameter
+            b (float): Document length normalization parameter
+        """
+        self.k1 = k1
+        self.b = b
+        self.refs = []
+        self.token_counts = []
+        self.documents = {}
+        # Table store IDs of the CSV files in the corpus, queried with SQL
+        self.tables = []
+        # Uploaded files and websites by resource ID, with their documents and tables
+        self.resources = {}
+        self.postings = {}
+        self.chunk_lengths = []
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.refs)
+
+    def fingerprint(self):
+        """
+        Identify the indexed document set, independent of upload order.
+
+        Returns:
+            str: Hex digest of the stored document IDs and the retrieval method
+        """
+        digest = hashlib.sha256(type(self).__name__.encode("utf-8"))
+        digest.update(str(getattr(self, "embedder_name", "")).encode("utf-8"))
+        for doc_id in sorted(self.documents):
+            digest.update(doc_id.encode("utf-8"))
+        return digest.hexdigest()
+
+    def add_chunks(self, doc_id, source, chunks):
+        """
+        Add the chunks of a stored document to the index.
+
+        Args:
+            doc_id (str): ID the document was stored under
+            source (str): Name of the file or website the content came from
+            chunks (iterable): Chunk objects, in stored order
+        """
+        self.documents[doc_id] = source
+        for ordinal, chunk in enumerate(chunks):
+            chunk_id = len(self.refs)
+            terms = tokenize(f"{chunk.heading} {chunk.text}")
+            self.refs.append((doc_id, ordinal))
+            # Counted once here so that prompts can be packed without re-tokenizing
+            self.token_counts.append(count_tokens(chunk.format()))
+            self.chunk_lengths.append(len(terms))
+            self.total_length += len(terms)
+
+            frequencies = {}
+            for term in terms:
+                frequencies[term] = frequencies.get(term, 0) + 1
+            for term, frequency in frequencies.items():
+                self.postings.setdefault(term, {})[chunk_id] = frequency
+
+    def add_document(self, source, content, chunk_size=None, overlap=None, resource_id=None):
+        """
+        Chunk a processed document, write it to the document store and add
+        it to the index. A document that is already indexed is not added twice.
+
+        Args:
+            source (str): Name of the file or website the content came from
+            content (str or iterable): Markdown produced by a document processor, or the
+                pieces a streaming processor yields; these are chunked and stored as they
+                arrive and then indexed from the store
+            chunk_size (int): Maximum characters per chunk
+            overlap (int): Characters carried over between consecutive chunks
+            resource_id (str): Registered resource the document belongs to
+
+        Returns:
+            str: ID of the stored document
+        """
+        if not isinstance(content, str):
+            return self.add_stored_document(store_document(source, content, chunk_size, overlap), source,
+                                            resource_id)
+        chunks = chunk_document(source, content, chunk_size, overlap)
+        doc_id = get_document_store().put_document(source, chunks)
+        if doc_id not in self.documents:
+            self.add_chunks(doc_id, source, chunks)
+        return self.add_stored_document(doc_id, source, resource_id)
+
+    def add_stored_document(self, doc_id, source, resource_id=None):
+        """
+        Add a document from the document store (see store_document()) to the
+        index, reading its chunks one at a time.
+
+        Args:
+            doc_id (str): ID the document was stored under
+            source (str): Name of the file or website the content came from
+            resource_id (str): Registered resource the document belongs to
+
+        Returns:
+            str: doc_id
+        """
+        if doc_id not in self.documents:
+            self.add_chunks(doc_id, source, (Chunk(source, heading, text)
+                                             for heading, text in get_document_store().iter_chunks(doc_id)))
+        if resource_id is not None and doc_id not in self.resources[resource_id]["documents"]:
+            self.resources[resource_id]["documents"].append(doc_id)
+        return doc_id
+
+    def add_resource(self, resource_id, kind, source):
+        """
+        Register an uploaded file or website; its documents are added with add_document().
+
+        Args:
+            resource_id (str): Stable ID of the resource
+            kind (str): "file" or "website"
+            source (str): File name or URL
+        """
+        self.resources.setdefault(resource_id, {"kind": kind, "source": source, "documents": [], "tables": []})
+
+    def add_table(self, resource_id, table_id):
+        """Attach a stored CSV table to a resource so it can be queried with SQL."""
+        if table_id not in self.tables:
+            self.tables.append(table_id)
+        if table_id not in self.resources[resource_id]["tables"]:
+            self.resources[resource_id]["tables"].append(table_id)
+
+    def merge(self, other):
+        """
+        Add the resources and documents of another index, e.g. one built for
+        a single upload, without re-tokenizing or re-embedding. Documents that
+        are already indexed are only linked to the other index's resources.
+
+        Args:
+            other (BM25Index): Index built with the same retrieval method
+
+        Returns:
+            list: Chunk IDs of other that were added, in their new order
+        """
+        added = []
+        if getattr(other, "embedder_name", None) != getattr(self, "embedder_name", None):
+            # Built with another retrieval method (the setting changed); index its documents again
+            for doc_id, source in other.documents.items():
+                self.add_stored_document(doc_id, source)
+        else:
+            new_ids = {}
+            for chunk_id, ref in enumerate(other.refs):
+                if ref[0] in self.documents:
+                    continue
+                new_ids[chunk_id] = len(self.refs)
+                added.append(chunk_id)
+                self.refs.append(ref)
+                self.token_counts.append(other.token_counts[chunk_id])
+                self.chunk_lengths.append(other.chunk_lengths[chunk_id])
+                self.total_length += other.chunk_lengths[chunk_id]
+            for term, chunk_frequencies in other.postings.items():
+                for chunk_id, frequency in chunk_frequencies.items():
+                    if chunk_id in new_ids:
+                        self.postings.setdefault(term, {})[new_ids[chunk_id]] = frequency
+            for doc_id, source in other.documents.items():
+                self.documents.setdefault(doc_id, source)
+
+        for resource_id, resource in other.resources.items():
+            self.add_resource(resource_id, resource["kind"], resource["source"])
+            for doc_id in resource["documents"]:
+                self.add_stored_document(doc_id, other.documents[doc_id], resource_id)
+            for table_id in resource["tables"]:
+                self.add_table(resource_id, table_id)
+        return added
+
+    def remove_resource(self, resource_id):
+        """
+        Remove a resource with the documents and tables no other resource uses.
+
+        Args:
+            resource_id (str): ID passed to add_resource()
+
+        Returns:
+            dict: The removed resource, or None if it is not registered
+        """
+        resource = self.resources.pop(resource_id, None)
+        if resource is None:
+            return None
+
+        documents_in_use = {doc_id for other in self.resources.values() for doc_id in other["documents"]}
+        tables_in_use = {table_id for other in self.resources.values() for table_id in other["tables"]}
+        self.remove_documents([doc_id for doc_id in resource["documents"] if doc_id not in documents_in_use])
+        self.tables = [table_id for table_id in self.tables
+                       if table_id in tables_in_use or table_id not in resource["tables"]]
+        return resource
+
+    def remove_documents(self, doc_ids):
+        """
+        Remove documents from the index.
+
+        Chunk IDs are renumbered and the postings are remapped in place, so
+        nothing is re-tokenized or read from the document store.
+
+        Args:
+            doc_ids (iterable): IDs of the documents to remove
+
+        Returns:
+            list: The old chunk IDs that were kept, in their new order
+        """
+        removed = set(doc_ids) & set(self.documents)
+        kept = [chunk_id for chunk_id, (doc_id, _) in enumerate(self.refs) if doc_id not in removed]
+        if not removed:
+            return kept
+
+        new_ids = {old: new for new, old in enumerate(kept)}
+        self.refs = [self.refs[chunk_id] for chunk_id in kept]
+        self.token_counts = [self.token_counts[chunk_id] for chunk_id in kept]
+        self.chunk_lengths = [self.chunk_lengths[chunk_id] for chunk_id in kept]
+        self.total_length = sum(self.chunk_lengths)
+
+        postings = {}
+        for term, chunk_frequencies in self.postings.items():
+            remapped = {new_ids[chunk_id]: frequency for chunk_id, frequency in chunk_frequencies.items()
+                        if chunk_id in new_ids}
+            if remapped:
+                postings[term] = remapped
+        self.postings = postings
+
+        for doc_id in removed:
+            del self.documents[doc_id]
+        debug_log(f"Removed {len(removed)} documents, {len(kept)} chunks remain")
+        return kept
+
+    def resource_names(self, exclude=None):
+        """
+        Return the names of the registered resources, in the order they were added.
+
+        Args:
+            exclude (str): ID of a resource to leave out (e.g. one being removed)
+
+        Returns:
+            tuple: (file names, website URLs)
+        """
+        resources = [r for resource_id, r in self.resources.items() if resource_id != exclude]
+        files = [r["source"] for r in resources if r["kind"] == "file"]
+        websites = [r["source"] for r in resources if r["kind"] == "website"]
+        return files, websites
+
+    def get_chunks(self, chunk_ids):
+        """
+        Read chunks from the document store.
+
+        Args:
+            chunk_ids (list): Chunk IDs
+
+        Returns:
+            list: Chunk objects in the order of chunk_ids
+        """
+        store = get_document_store()
+        ordinals_by_document = {}
+        for chunk_id in chunk_ids:
+            doc_id, ordinal = self.refs[chunk_id]
+            ordinals_by_document.setdefault(doc_id, []).append(ordinal)
+
+        loaded = {}
+        for doc_id, ordinals in ordinals_by_document.items():
+            source = self.documents[doc_id]
+            for ordinal, (heading, text) in zip(ordinals, store.read_chunks(doc_id, ordinals)):
+                loaded[(doc_id, ordinal)] = Chunk(source, heading, text)
+
+        chunks = [loaded[self.refs[chunk_id]] for chunk_id in chunk_ids]
+        for chunk_id, chunk in zip(chunk_ids, chunks):
+            chunk.tokens = self.token_counts[chunk_id]
+        return chunks
+
+    def search(self, query, top_k=None):
+        """
+        Rank chunks against a query.
+
+        Args:
+            query (str): User's question
+            top_k (int): Number of chunks to return
+
+        Returns:
+            list: (score, Chunk) tuples, best first
+        """
+        top_k = top_k or TOP_K
+        ranked = self._rank(query, top_k)
+        chunks = self.get_chunks([chunk_id for chunk_id, _ in ranked])
+        return [(score, chunk) for (_, score), chunk in zip(ranked, chunks)]
+
+    def _rank(self, query, top_k):
+        """Return (chunk_id, score) tuples for the best BM25 matches."""
+        if not self.refs:
+            return []
+
+        chunk_count = len(self.refs)
+        average_length = self.total_length / chunk_count or 1
+        scores = {}
+
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (chunk_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, frequency in postings.items():
+                length_norm = 1 - self.b + self.b * self.chunk_lengths[chunk_id] / average_length
+                score = idf * frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + score
+
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+    def retrieve(self, query, top_k=None):
+        """
+        Select the chunks to use as context for a query, best first.
+
+        When no chunk shares a term with the query (e.g. "summarize this"),
+        the opening chunks are used so that general questions still get context.
+
+        Args:
+            query (str): User's question
+            top_k (int): Number of chunks to select
+
+        Returns:
+            list: Chunk objects with their token counts
+        """
+        top_k = top_k or TOP_K
+        results = self.search(query, top_k)
+        if results:
+            debug_log(f"Selected {len(results)} chunks, best score {results[0][0]:.2f}")
+            return [chunk for _, chunk in results]
+
+        selected = self.get_chunks(range(min(top_k, len(self.refs))))
+        debug_log(f"No matching terms, falling back to the first {len(selected)} chunks")
+        return selected
+
+    def build_context(self, query, top_k=None):
+        """
+        Build the prompt context for a query from the best matching chunks.
+
+        Args:
+            query (str): User's question
+            top_k (int): Number of chunks to include
+
+        Returns:
+            str: Context text, or an empty string if the index is empty
+        """
+        return "\n\n".join(chunk.format() for chunk in self.retrieve(query, top_k))
+
+
+class HybridIndex(BM25Index):
+    """
+    BM25 index combined with a dense embedding vector store.
+
+    Lexical and semantic rankings are merged with reciprocal rank fusion, so a
+    chunk that matches the query's meaning but not its exact words can still
+    be retrieved.
+    """
+
+    def __init__(self, embedder_name, k1=1.5, b=0.75):
+        """
+        Initialize an empty index.
+
+        Args:
+            embedder_name (str): Embedding provider used for chunks and queries
+            k1 (float): Term frequency saturation parameter
+            b (float): Document length normalization parameter
+        """
+        super().__init__(k1, b)
+        self.embedder_name = embedder_name
+        self.vectors = VectorStore()
+
+    def add_chunks(self, doc_id, source, chunks):
+        """
+        Add the chunks of a stored document to the index, embedding them in batches.
+
+        The chunks are embedded before either side of the index changes, so
+        a failed embedding request leaves the BM25 postings and the vector
+        rows aligned.
+
+        Args:
+            doc_id (str): ID the document was stored under
+            source (str): Name of the file or website the content came from
+            chunks (list): List of Chunk objects, in stored order
+        """
+        chunks = list(chunks)
+        embedder = get_embedder(self.embedder_name)
+        vectors = embedder.embed([f"{chunk.heading}\n{chunk.text}" for chunk in chunks])
+        super().add_chunks(doc_id, source, chunks)
+        self.vectors.add(vectors)
+
+    def merge(self, other):
+        """Add another index (see BM25Index.merge()) and the vectors of its added chunks."""
+        added = super().merge(other)
+        if added:
+            self.vectors.add(other.vectors.matrix[added])
+        return added
+
+    def remove_documents(self, doc_ids):
+        """Remove documents from the index and their rows from the vector store."""
+        kept = super().remove_documents(doc_ids)
+        if len(kept) < len(self.vectors):
+            self.vectors.keep_rows(kept)
+        return kept
+
+    def _rank(self, query, top_k):
+        """Return (chunk_id, score) tuples fused from BM25 and vector rankings."""
+        depth = top_k * 4
+        lexical = super()._rank(query, depth)
+
+        try:
+            query_vector = get_embedder(self.embedder_name).embed_query(query)
+            semantic = [(row, score) for score, row in self.vectors.search(query_vector, depth)]
+        except Exception as e:
+            debug_log(f"ERROR embedding query, using BM25 only: {str(e)}")
+            return lexical[:top_k]
+
+        fused = {}
+        for ranking in (lexical, semantic):
+            for rank, (chunk_id, _) in enumerate(ranking):
+                fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+
+        return heapq.nlargest(top_k, fused.items(), key=lambda item: item[1])
+
+
+def build_index(embedder_name=None):
+    """
+    Create an empty retrieval index for the configured embedding provider.
+
+    Args:
+        embedder_name (str): Embedding provider (defaults to EMBEDDING_PROVIDER)
+
+    Returns:
+        BM25Index: A HybridIndex when an embedder is configured, otherwise a BM25Index
+    """
+    embedder = get_embedder(embedder_name)
+    if embedder is None:
+        return BM25Index()
+    return HybridIndex(embedder.name)
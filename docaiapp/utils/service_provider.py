@@ -2,14 +2,15 @@
 Service provider module that determines which document processing library to use.
 Based on the DOC_INTELLIGENT flag, this module selects the appropriate processing function
 for each document type.
+
+Processor modules (and PyMuPDF, python-docx, python-pptx or the Azure SDK
+with them) are imported on first use and then reused. warm_up() imports
+them all ahead of time, e.g. in the gunicorn master before it forks.
 """
 
 import importlib
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
-DEBUG = os.getenv("DEBUG", "False").lower() in ["true", "1", "t", "yes", "y"]
+from docaiapp.utils.config import DEBUG
+from docaiapp.utils.extraction_cache import CACHE_ENABLED, CachedProcessor
 
 def debug_log(message):
     if DEBUG:
@@ -22,15 +23,58 @@ class DocumentServiceProvider:
     based on the configured settings.
     """
     
-    def __init__(self, use_intelligent_processing=False):
+    def __init__(self, use_intelligent_processing=False, use_cache=None):
         """
         Initialize the service provider with the configured processing mode.
         
         Args:
             use_intelligent_processing (bool): Whether to use intelligent document processing
+            use_cache (bool): Whether file processors look up results in the extraction
+                cache (defaults to EXTRACTION_CACHE_ENABLED)
         """
         debug_log(f"Use Document Intelligent : {use_intelligent_processing}")
         self.use_intelligent_processing = use_intelligent_processing
+        self.use_cache = CACHE_ENABLED if use_cache is None else use_cache
+        self._processors = {}
+    
+    def _load(self, module, function, cached=True):
+        """
+        Import a processing function once and return it on later calls.
+        
+        Args:
+            module (str): Module of the processor
+            function (str): Name of the processing function
+            cached (bool): Wrap the processor with the extraction cache
+            
+        Returns:
+            callable: The (cached) processor
+        """
+        key = (module, function)
+        processor = self._processors.get(key)
+        if processor is None:
+            processor = getattr(importlib.import_module(module), function)
+            if cached:
+                processor = self._cached(processor)
+            self._processors[key] = processor
+        return processor
+    
+    def warm_up(self):
+        """Import the processors of the configured mode, so the first upload does not pay for it."""
+        for get_processor in (self.get_pdf_processor, self.get_csv_processor, self.get_word_processor,
+                              self.get_powerpoint_processor, self.get_website_batch_processor):
+            get_processor()
+    
+    def _cached(self, processor):
+        """
+        Wrap a file processor so it consults the extraction cache first.
+        
+        Args:
+            processor (function): File processing function
+            
+        Returns:
+            callable: Cached processor, or the processor itself if caching is disabled
+        """
+        return CachedProcessor(processor) if self.use_cache else processor
     
     def get_pdf_processor(self):
         """
@@ -39,13 +83,10 @@ class DocumentServiceProvider:
         Returns:
             function: PDF processing function
         """
-        if self.use_intelligent_processing:            # Import the intelligent PDF processing module
-            from docaiapp.utils.doc_processing import process_document
-            return process_document
-        else:
-            # Import the standard PDF processing module
-            from docaiapp.utils.pdf_processor import process_pdf
-            return process_pdf
+        if self.use_intelligent_processing:
+            return self._load('docaiapp.utils.doc_processing', 'process_document')
+        # Yields the text page range by page range; ingest stores it as it arrives
+        return self._load('docaiapp.utils.pdf_processor', 'stream_pdf')
     
     def get_csv_processor(self):
         """
@@ -55,8 +96,7 @@ class DocumentServiceProvider:
         Returns:
             function: CSV processing function
         """
-        from docaiapp.utils.csv_processor import process_csv
-        return process_csv
+        return self._load('docaiapp.utils.csv_processor', 'process_csv')
     
     def get_word_processor(self):
         """
@@ -65,13 +105,9 @@ class DocumentServiceProvider:
         Returns:
             function: Word document processing function
         """
-        if self.use_intelligent_processing:            # Import the intelligent Word processing module
-            from docaiapp.utils.doc_processing import process_document
-            return process_document
-        else:
-            # Import the standard Word processing module
-            from docaiapp.utils.word_processor import process_word
-            return process_word
+        if self.use_intelligent_processing:
+            return self._load('docaiapp.utils.doc_processing', 'process_document')
+        return self._load('docaiapp.utils.word_processor', 'process_word')
     
     def get_powerpoint_processor(self):
         """
@@ -80,15 +116,37 @@ class DocumentServiceProvider:
         Returns:
             function: PowerPoint processing function
         """
-        if self.use_intelligent_processing:            # Import the intelligent PowerPoint processing module
-            from docaiapp.utils.doc_processing import process_document
-            return process_document
-        else:
-            # Import the standard PowerPoint processing module
-            from docaiapp.utils.powerpoint_processor import process_powerpoint
-            return process_powerpoint
+        if self.use_intelligent_processing:
+            return self._load('docaiapp.utils.doc_processing', 'process_document')
+        return self._load('docaiapp.utils.powerpoint_processor', 'process_powerpoint')
+    
+    def get_file_processor(self, filename):
+        """
+        Returns the processor for an uploaded file based on its extension,
+        and whether it spends its time waiting on a remote service
+        (Document Intelligence) rather than parsing locally.
+        
+        Args:
+            filename (str): Name of the uploaded file
+            
+        Returns:
+            tuple: (processing function, is I/O bound), or (None, False) if the
+            file type is not supported
+        """
+        name = filename.lower()
+        if name.endswith('.pdf'):
+            # Local PDF extraction runs on a thread that fans page ranges out
+            # to the process pool, so it is I/O bound either way
+            return self.get_pdf_processor(), True
+        if name.endswith('.csv'):
+            return self.get_csv_processor(), False
+        if name.endswith(('.docx', '.doc')):
+            return self.get_word_processor(), self.use_intelligent_processing
+        if name.endswith(('.pptx', '.ppt')):
+            return self.get_powerpoint_processor(), self.use_intelligent_processing
+        return None, False
     
-    def get_website_processor(self):       
+    def get_website_processor(self):
         """
         Returns the appropriate website processor.
         Currently, there's only one implementation.
@@ -96,6 +154,14 @@ class DocumentServiceProvider:
         Returns:
             function: Website processing function
         """
-        from docaiapp.utils.website_processor import process_website
-        return process_website
-
+        return self._load('docaiapp.utils.website_processor', 'process_website', cached=False)
+    
+    def get_website_batch_processor(self):
+        """
+        Returns the processor that fetches several websites concurrently
+        and can optionally crawl same-site pages.
+        
+        Returns:
+            function: Batch website processing function
+        """
+        return self._load('docaiapp.utils.website_processor', 'process_websites', cached=False)
@@ -0,0 +1,350 @@
+"""
+Server-side sessions shared by all workers and, with Redis, by all hosts.
+
+The session cookie only holds a random session ID. The session itself is
+kept by the backend selected with the SESSION_BACKEND setting:
+    sqlite  - SQLite database in WAL mode, shared by the workers of one
+              host (default)
+    redis   - Redis or any Redis-compatible server, shared by all hosts
+              (requires the redis package)
+
+With the redis backend, upload jobs (upload_jobs) and pending history
+summaries (history_summary) are kept in the same Redis server, so any
+instance can answer any request and no sticky sessions are needed. The
+document and table stores (DOCUMENT_STORE_DIR, TABLE_STORE_DIR) are
+directories; put them on storage shared by the hosts.
+
+Sessions are serialized with Flask's tagged JSON and, once larger than
+SESSION_COMPRESS_MIN_BYTES, compressed with zstd when the optional
+zstandard package is installed, otherwise with zlib. A session is written
+only when its content changed during the request, so read-only requests
+(progress polls, resource lists) cost no write. The write applies only the
+keys the request changed or removed to the stored session, reading and
+writing it in one transaction, so a long request (a streamed answer) does
+not overwrite what a concurrent request (an upload switching the corpus)
+stored meanwhile. Idle sessions expire after SESSION_LIFETIME seconds; the
+expiry of an unchanged session is pushed back at most once per tenth of
+that time.
+"""
+
+import hashlib
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+import zlib
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+from docaiapp.utils.config import DEBUG, env_int, env_str, get_settings
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+SESSION_BACKEND = get_settings().session_backend
+SESSION_DB_PATH = env_str("SESSION_DB_PATH", os.path.join("cache", "sessions.db"))
+SESSION_REDIS_URL = env_str("SESSION_REDIS_URL", "redis://localhost:6379/0")
+SESSION_LIFETIME = env_int("SESSION_LIFETIME", 7 * 24 * 60 * 60, minimum=60)
+SESSION_COMPRESS_MIN_BYTES = env_int("SESSION_COMPRESS_MIN_BYTES", 512, minimum=0)
+
+KEY_PREFIX = "docbot:session:"
+SID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{43}$")
+# Expired rows are deleted by the next write after this many seconds
+PURGE_INTERVAL = 300
+
+# First byte of a stored session
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+def debug_log(message):
+    if DEBUG:
+        print(f"DEBUG [Session Store]: {message}")
+
+def compress(data):
+    """
+    Compress a serialized session.
+
+    Args:
+        data (bytes): Serialized session
+
+    Returns:
+        bytes: Codec byte followed by the (possibly compressed) data
+    """
+    if len(data) < SESSION_COMPRESS_MIN_BYTES:
+        return bytes([CODEC_NONE]) + data
+    if zstandard is not None:
+        return bytes([CODEC_ZSTD]) + zstandard.ZstdCompressor(level=3).compress(data)
+    return bytes([CODEC_ZLIB]) + zlib.compress(data, 6)
+
+def decompress(payload):
+    """Reverse compress()."""
+    codec, data = payload[0], payload[1:]
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Session was compressed with zstd but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(data)
+    return data
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """
+    Session loaded from the store, with the digest of every stored value.
+    """
+
+    def __init__(self, initial=None, sid=None, digests=None, expires_at=0.0):
+        def on_update(session):
+            session.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        # Key -> digest of its serialized value as last loaded or saved; None until stored
+        self.digests = digests
+        self.expires_at = expires_at
+        self.modified = False
+
+    @property
+    def new(self):
+        return self.digests is None
+
+
+class SQLiteSessionBackend:
+    """
+    SQLite table shared by the worker processes of one host.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or SESSION_DB_PATH
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                sid TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at);
+        """)
+
+    def load(self, sid):
+        with self._lock:
+            row = self._conn.execute("SELECT data, expires_at FROM sessions WHERE sid = ? AND expires_at > ?",
+                                     (sid, time.time())).fetchone()
+        return (bytes(row[0]), row[1]) if row is not None else None
+
+    def update(self, sid, merge, expires_at):
+        """
+        Replace a session with merge(stored data or None), in one transaction.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT data FROM sessions WHERE sid = ? AND expires_at > ?",
+                                         (sid, now)).fetchone()
+                data = merge(bytes(row[0]) if row is not None else None)
+                self._conn.execute("INSERT OR REPLACE INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)",
+                                   (sid, data, expires_at))
+                if now - self._last_purge > PURGE_INTERVAL:
+                    self._last_purge = now
+                    self._conn.execute("DELETE FROM sessions WHERE expires_at < ?", (now,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def touch(self, sid, expires_at):
+        with self._lock:
+            self._conn.execute("UPDATE sessions SET expires_at = ? WHERE sid = ?", (expires_at, sid))
+
+    def delete(self, sid):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+
+class RedisSessionBackend:
+    """
+    Redis (or Redis-compatible) server shared by all hosts. Sessions expire
+    with the server-side TTL.
+    """
+
+    def __init__(self, url=None):
+        import redis
+        self._client = redis.Redis.from_url(url or SESSION_REDIS_URL, socket_timeout=2.0,
+                                            socket_connect_timeout=2.0)
+
+    def load(self, sid):
+        key = KEY_PREFIX + sid
+        data, ttl = self._client.pipeline(transaction=False).get(key).pttl(key).execute()
+        if data is None:
+            return None
+        return data, time.time() + max(ttl, 0) / 1000
+
+    def update(self, sid, merge, expires_at):
+        """
+        Replace a session with merge(stored data or None), retried until no
+        other write to the key came in between (WATCH/MULTI/EXEC).
+        """
+        key = KEY_PREFIX + sid
+
+        def write(pipe):
+            data = merge(pipe.get(key))
+            pipe.multi()
+            pipe.set(key, data, px=_milliseconds_until(expires_at))
+
+        self._client.transaction(write, key)
+
+    def touch(self, sid, expires_at):
+        self._client.pexpire(KEY_PREFIX + sid, _milliseconds_until(expires_at))
+
+    def delete(self, sid):
+        self._client.delete(KEY_PREFIX + sid)
+
+def _milliseconds_until(timestamp):
+    return max(1, int((timestamp - time.time()) * 1000))
+
+def get_session_backend(backend=None):
+    """
+    Return the session backend for this process.
+
+    Connections are not shared across a fork, so each worker process creates
+    its own on first use.
+
+    Args:
+        backend (str): "sqlite" or "redis" (defaults to SESSION_BACKEND)
+
+    Returns:
+        SQLiteSessionBackend or RedisSessionBackend: The backend
+    """
+    backend = backend or SESSION_BACKEND
+    key = (backend, os.getpid())
+    if key not in _backends:
+        with _backends_lock:
+            if key not in _backends:
+                _backends[key] = RedisSessionBackend() if backend == "redis" else SQLiteSessionBackend()
+                debug_log(f"Using {backend} session store")
+    return _backends[key]
+
+
+class ServerSessionInterface(SessionInterface):
+    """
+    Flask session interface storing sessions in a SQLite or Redis backend.
+    Backend errors are raised, since a request cannot go on without its session.
+    """
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, backend=None, lifetime=None):
+        self.backend_name = backend or SESSION_BACKEND
+        self.lifetime = lifetime or SESSION_LIFETIME
+
+    @property
+    def backend(self):
+        return get_session_backend(self.backend_name)
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app), "")
+        if SID_PATTERN.match(sid):
+            stored = self.backend.load(sid)
+            if stored is not None:
+                payload, expires_at = stored
+                try:
+                    data = self._loads(payload)
+                    return ServerSession(data, sid=sid, digests=self._digests(data), expires_at=expires_at)
+                except Exception as e:
+                    debug_log(f"ERROR reading session {sid[:8]}, starting a new one: {str(e)}")
+        return ServerSession(sid=secrets.token_urlsafe(32))
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if not session.new:
+                self.backend.delete(session.sid)
+                session.digests = None
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        digests = self._digests(session)
+        stored = session.digests or {}
+        changed = {key: session[key] for key, digest in digests.items() if stored.get(key) != digest}
+        removed = [key for key in stored if key not in digests]
+        now = time.time()
+        new = session.new
+        if changed or removed:
+            session.expires_at = now + self.lifetime
+            self.backend.update(session.sid, lambda payload: self._merge(payload, changed, removed),
+                                session.expires_at)
+            session.digests = digests
+        elif session.expires_at - now < self.lifetime * 0.9:
+            session.expires_at = now + self.lifetime
+            self.backend.touch(session.sid, session.expires_at)
+        else:
+            return
+
+        if new or session.permanent:
+            response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                                httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                                secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+
+    def _loads(self, payload):
+        return self.serializer.loads(decompress(payload).decode("utf-8"))
+
+    def _digests(self, data):
+        return {key: _digest(self.serializer.dumps(value).encode("utf-8")) for key, value in data.items()}
+
+    def _merge(self, payload, changed, removed):
+        """
+        Apply the keys a request changed or removed to the stored session.
+
+        Args:
+            payload (bytes): Stored session, or None if there is none (new, expired or cleared)
+            changed (dict): Key -> new value
+            removed (list): Keys to remove
+
+        Returns:
+            bytes: The merged session, compressed
+        """
+        data = {}
+        if payload is not None:
+            try:
+                data = self._loads(payload)
+            except Exception as e:
+                debug_log(f"ERROR reading stored session, replacing it: {str(e)}")
+        data.update(changed)
+        for key in removed:
+            data.pop(key, None)
+        return compress(self.serializer.dumps(data).encode("utf-8"))
+
+def _digest(serialized):
+    return hashlib.blake2b(serialized, digest_size=16).digest()
+
+def get_session_interface(backend=None):
+    """
+    Create the session interface for the app.
+
+    Args:
+        backend (str): "sqlite" or "redis" (defaults to SESSION_BACKEND)
+
+    Returns:
+        ServerSessionInterface: Interface to assign to app.session_interface
+    """
+    return ServerSessionInterface(backend)
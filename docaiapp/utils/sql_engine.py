@@ -0,0 +1,282 @@
+"""
+Read-only SQL over the CSV files of a chat session.
+
+The full rows of every uploaded CSV are kept in the table store (see
+table_store.py). For a chat request, the session's tables are attached
+read-only to a private in-memory SQLite connection, and the model can
+call the run_sql tool to aggregate or filter them. Queries are limited
+to reading (SQLite authorizer, read-only attachments and query_only),
+stopped after SQL_TIMEOUT seconds and cut off at SQL_ROW_LIMIT rows, so
+only a small result set is sent back to the model.
+"""
+
+import json
+import os
+import sqlite3
+import time
+from docaiapp.utils.config import DEBUG, env_bool, env_float, env_int
+from docaiapp.utils.table_store import get_table_store, table_id
+
+SQL_ENABLED = env_bool("SQL_ENABLED", True)
+SQL_ROW_LIMIT = env_int("SQL_ROW_LIMIT", 50)
+SQL_TIMEOUT = env_float("SQL_TIMEOUT", 2)
+# Maximum number of query rounds before the model has to answer
+SQL_MAX_TOOL_ROUNDS = env_int("SQL_MAX_TOOL_ROUNDS", 3, minimum=0)
+
+# Longest cell value returned to the model
+RESULT_VALUE_CHARS = 200
+# SQLite virtual machine instructions between timeout checks
+PROGRESS_INSTRUCTIONS = 10000
+
+TOOL_NAME = "run_sql"
+
+# Operations a read-only query may perform
+ALLOWED_ACTIONS = {
+    sqlite3.SQLITE_SELECT,
+    sqlite3.SQLITE_READ,
+    sqlite3.SQLITE_FUNCTION,
+    getattr(sqlite3, "SQLITE_RECURSIVE", 33),
+}
+
+def debug_log(message):
+    if DEBUG:
+        print(f"DEBUG [SQL Engine]: {message}")
+
+def collect_tables(file_data):
+    """
+    Return the table store IDs of the CSV files in an upload.
+
+    Tables are written while the CSV is processed. A table that is missing
+    (e.g. the extraction came from the cache after the table store was
+    cleaned) is written again.
+
+    Args:
+        file_data (list): (filename, bytes) tuples of the uploaded files
+
+    Returns:
+        list: Table IDs of the CSV files whose rows are available
+    """
+    store = get_table_store()
+    tables = []
+    for filename, data in file_data:
+        if not filename.lower().endswith('.csv'):
+            continue
+        stored_id = table_id(data)
+        if not store.exists(stored_id):
+            from docaiapp.utils.csv_processor import process_csv
+            from docaiapp.utils.ingest import NamedBytesIO
+            debug_log(f"Writing missing table for {filename}")
+            process_csv(NamedBytesIO(data, filename))
+        if store.exists(stored_id) and stored_id not in tables:
+            tables.append(stored_id)
+    return tables
+
+
+class SQLSession:
+    """
+    In-memory SQLite connection with a chat session's tables attached read-only.
+
+    Each table is exposed as a view named after its CSV file, with columns
+    named by their SQL identifiers.
+    """
+
+    def __init__(self, table_ids):
+        """
+        Args:
+            table_ids (list): Table store IDs from collect_tables()
+        """
+        store = get_table_store()
+        self.tables = []
+        self._conn = sqlite3.connect(":memory:", uri=True, check_same_thread=False)
+
+        names = set()
+        for position, stored_id in enumerate(table_ids):
+            if not store.exists(stored_id):
+                debug_log(f"Table {stored_id} is no longer in the table store")
+                continue
+            description = store.describe(stored_id)
+            name, suffix = description["name"], 2
+            while name in names:
+                name = f"{description['name']}_{suffix}"
+                suffix += 1
+            names.add(name)
+
+            schema = f"t{position}"
+            uri = f"file:{os.path.abspath(store.path(stored_id))}?mode=ro"
+            self._conn.execute("ATTACH DATABASE ? AS " + schema, (uri,))
+            self._conn.execute(f'CREATE TEMP VIEW "{name}" AS SELECT * FROM {schema}."{description["name"]}"')
+            description["name"] = name
+            self.tables.append(description)
+
+        self._conn.execute("PRAGMA query_only = ON")
+        self._conn.set_authorizer(self._authorize)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    @staticmethod
+    def _authorize(action, arg1, arg2, database, trigger):
+        return sqlite3.SQLITE_OK if action in ALLOWED_ACTIONS else sqlite3.SQLITE_DENY
+
+    def describe(self):
+        """
+        Describe the tables for the model.
+
+        Returns:
+            str: One line per table with its row count and typed columns
+        """
+        lines = []
+        for table in self.tables:
+            columns = ", ".join(
+                f'{column["identifier"]} {column["type"]}'
+                + (f' ("{column["name"]}")' if column["name"] != column["identifier"] else "")
+                for column in table["columns"]
+            )
+            lines.append(f'{table["name"]} (from {table["source"]}, {table["row_count"]} rows): {columns}')
+        return "\n".join(lines)
+
+    def query(self, sql, row_limit=None, timeout=None):
+        """
+        Run a read-only query.
+
+        Args:
+            sql (str): A single SELECT statement
+            row_limit (int): Maximum number of rows returned (defaults to SQL_ROW_LIMIT)
+            timeout (float): Seconds before the query is interrupted (defaults to SQL_TIMEOUT)
+
+        Returns:
+            dict: columns, rows and truncated, or error with a message
+        """
+        row_limit = row_limit or SQL_ROW_LIMIT
+        deadline = time.monotonic() + (timeout or SQL_TIMEOUT)
+        self._conn.set_progress_handler(lambda: time.monotonic() > deadline, PROGRESS_INSTRUCTIONS)
+        started = time.perf_counter()
+        try:
+            cursor = self._conn.execute(sql.strip().rstrip(";"))
+            if cursor.description is None:
+                return {"error": "Only SELECT queries are supported"}
+            rows = cursor.fetchmany(row_limit + 1)
+            columns = [d[0] for d in cursor.description]
+        except sqlite3.OperationalError as e:
+            message = "Query timed out" if str(e) == "interrupted" else str(e)
+            debug_log(f"Query failed: {message}")
+            return {"error": message}
+        except (sqlite3.Error, sqlite3.Warning) as e:
+            debug_log(f"Query failed: {str(e)}")
+            return {"error": str(e)}
+        finally:
+            self._conn.set_progress_handler(None, 0)
+
+        debug_log(f"Query returned {len(rows)} rows in {time.perf_counter() - started:.3f}s")
+        return {
+            "columns": columns,
+            "rows": [[_result_value(value) for value in row] for row in rows[:row_limit]],
+            "truncated": len(rows) > row_limit,
+        }
+
+    def tool(self):
+        """
+        Return the run_sql tool definition for the chat completions API.
+
+        Returns:
+            dict: Function tool with the table schema in its description
+        """
+        return {
+            "type": "function",
+            "function": {
+                "name": TOOL_NAME,
+                "description": (
+                    "Run a read-only SQLite SELECT query over the uploaded CSV tables and get the result rows "
+                    f"(at most {SQL_ROW_LIMIT}). Use it for counts, sums, averages, grouping, filtering and "
+                    "lookups instead of reading the sample rows. Boolean columns are stored as 1/0 and dates "
+                    "as ISO text. Tables:\n" + self.describe()
+                ),
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "query": {"type": "string", "description": "A single SQLite SELECT statement"},
+                    },
+                    "required": ["query"],
+                },
+            },
+        }
+
+    def run_tool_call(self, arguments):
+        """
+        Execute a run_sql tool call.
+
+        Args:
+            arguments (str): JSON arguments from the model
+
+        Returns:
+            str: Result as a markdown table, or an error message, for the tool message
+        """
+        try:
+            sql = json.loads(arguments or "{}").get("query", "")
+        except (ValueError, AttributeError):
+            return "Error: the arguments are not valid JSON"
+        if not sql:
+            return "Error: no query given"
+
+        debug_log(f"Running model query: {sql}")
+        result = self.query(sql)
+        if "error" in result:
+            return f"Error: {result['error']}"
+        return format_result(result)
+
+
+def _result_value(value):
+    if isinstance(value, str) and len(value) > RESULT_VALUE_CHARS:
+        return value[:RESULT_VALUE_CHARS] + "..."
+    return value
+
+def format_result(result):
+    """
+    Format a query result as a markdown table.
+
+    Args:
+        result (dict): Result from SQLSession.query()
+
+    Returns:
+        str: Markdown table, with a note when rows were cut off
+    """
+    if not result["rows"]:
+        return "The query returned no rows."
+
+    def cell(value):
+        return "NULL" if value is None else str(value).replace("|", "\\|").replace("\n", " ")
+
+    lines = ["| " + " | ".join(result["columns"]) + " |",
+             "| " + " | ".join("---" for _ in result["columns"]) + " |"]
+    lines.extend("| " + " | ".join(cell(value) for value in row) + " |" for row in result["rows"])
+    if result["truncated"]:
+        lines.append(f"\nOnly the first {len(result['rows'])} rows are shown; aggregate or filter for a smaller result.")
+    return "\n".join(lines)
+
+def open_sql_session(table_ids):
+    """
+    Open a SQL session for a chat request.
+
+    Args:
+        table_ids (list): Table store IDs of the session's CSV files
+
+    Returns:
+        SQLSession: The session, or None if SQL is disabled or no table is available
+    """
+    if not SQL_ENABLED or not table_ids:
+        return None
+    try:
+        session = SQLSession(table_ids)
+    except Exception as e:
+        debug_log(f"ERROR opening SQL session: {str(e)}")
+        return None
+    if not session.tables:
+        session.close()
+        return None
+    return session
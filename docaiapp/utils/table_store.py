@@ -0,0 +1,269 @@
+"""
+Side store for the rows of uploaded tables (CSV files).
+
+Only a schema and a sample of a large CSV go into the prompt; the full rows
+are written to a SQLite database file per CSV, named after the SHA-256 of
+its content, so they can be looked up later. Rows are staged as text while
+the CSV is streamed and copied into a table with the inferred column types
+once the whole file has been profiled.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+from docaiapp.utils.config import DEBUG, env_str
+from docaiapp.utils.document_store import STORE_DIR
+
+TABLE_STORE_DIR = env_str("TABLE_STORE_DIR", os.path.join(STORE_DIR, "tables"))
+
+# SQLite column type for each inferred column type
+SQL_TYPES = {
+    "integer": "INTEGER",
+    "float": "REAL",
+    "boolean": "INTEGER",
+    "date": "TEXT",
+    "text": "TEXT",
+    "empty": "TEXT",
+}
+
+IDENTIFIER_PATTERN = re.compile(r'\W+')
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def debug_log(message):
+    if DEBUG:
+        print(f"DEBUG [Table Store]: {message}")
+
+def table_id(data):
+    """
+    Return the content address of an uploaded table.
+
+    Args:
+        data (bytes): CSV file content
+
+    Returns:
+        str: Hex table ID
+    """
+    return hashlib.sha256(data).hexdigest()[:32]
+
+def sql_identifier(name, fallback="column"):
+    """
+    Turn a file or column name into a lowercase SQL identifier.
+
+    Args:
+        name (str): Original name
+        fallback (str): Name used when nothing usable remains
+
+    Returns:
+        str: Identifier containing only letters, digits and underscores
+    """
+    identifier = IDENTIFIER_PATTERN.sub("_", name.strip().lower()).strip("_") or fallback
+    if identifier[0].isdigit():
+        identifier = f"{fallback}_{identifier}"
+    return identifier
+
+def unique_identifiers(names):
+    """Map column names to distinct SQL identifiers, keeping their order."""
+    identifiers = []
+    seen = set()
+    for position, name in enumerate(names):
+        identifier = sql_identifier(name, f"column_{position + 1}")
+        candidate, suffix = identifier, 2
+        while candidate in seen:
+            candidate = f"{identifier}_{suffix}"
+            suffix += 1
+        seen.add(candidate)
+        identifiers.append(candidate)
+    return identifiers
+
+
+class TableWriter:
+    """
+    Writes the rows of one table to a new database file.
+
+    The file only appears under its final name once finish() succeeds, so
+    readers never see a partially written table.
+    """
+
+    def __init__(self, path, table_name, columns, source):
+        """
+        Args:
+            path (str): Final path of the database file
+            table_name (str): SQL name of the table
+            columns (list): Original column names
+            source (str): Name of the uploaded file
+        """
+        self.path = path
+        self.table_name = table_name
+        self.columns = list(columns)
+        self.identifiers = unique_identifiers(self.columns)
+        self.source = source
+        self.row_count = 0
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, self.temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        os.close(fd)
+
+        self._conn = sqlite3.connect(self.temp_path)
+        self._conn.execute("PRAGMA journal_mode=OFF")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute("PRAGMA temp_store=FILE")
+        staged_columns = ", ".join(f'"{identifier}" TEXT' for identifier in self.identifiers)
+        self._conn.execute(f"CREATE TEMP TABLE staged ({staged_columns})")
+        self._insert = f"INSERT INTO staged VALUES ({', '.join('?' for _ in self.identifiers)})"
+
+    def add_rows(self, rows):
+        """
+        Stage a batch of rows.
+
+        Args:
+            rows (list): Rows as lists of strings, one value per column
+        """
+        self._conn.executemany(self._insert, rows)
+        self.row_count += len(rows)
+
+    def finish(self, column_types, null_values):
+        """
+        Copy the staged rows into a typed table and publish the database file.
+
+        Args:
+            column_types (list): Inferred type of each column (see SQL_TYPES)
+            null_values (iterable): Lowercase values that are stored as NULL
+        """
+        definitions = ", ".join(f'"{identifier}" {SQL_TYPES[column_type]}'
+                                for identifier, column_type in zip(self.identifiers, column_types))
+        self._conn.execute(f'CREATE TABLE "{self.table_name}" ({definitions})')
+
+        null_list = ", ".join("'" + value.replace("'", "''") + "'" for value in null_values)
+        selects = []
+        for identifier, column_type in zip(self.identifiers, column_types):
+            value = f'CASE WHEN LOWER(TRIM("{identifier}")) IN ({null_list}) THEN NULL ELSE TRIM("{identifier}") END'
+            if column_type == "boolean":
+                value = f"CASE LOWER({value}) WHEN 'true' THEN 1 WHEN 'yes' THEN 1 WHEN 'false' THEN 0 WHEN 'no' THEN 0 END"
+            elif column_type in ("integer", "float"):
+                value = f"CAST({value} AS {SQL_TYPES[column_type]})"
+            selects.append(value)
+        self._conn.execute(f'INSERT INTO "{self.table_name}" SELECT {", ".join(selects)} FROM staged')
+
+        self._conn.execute("CREATE TABLE _columns (position INTEGER, name TEXT, identifier TEXT, type TEXT)")
+        self._conn.executemany("INSERT INTO _columns VALUES (?, ?, ?, ?)", [
+            (position, name, identifier, column_type)
+            for position, (name, identifier, column_type) in enumerate(zip(self.columns, self.identifiers, column_types))
+        ])
+        self._conn.execute("CREATE TABLE _table (name TEXT, source TEXT, row_count INTEGER)")
+        self._conn.execute("INSERT INTO _table VALUES (?, ?, ?)", (self.table_name, self.source, self.row_count))
+        self._conn.execute("DROP TABLE staged")
+        self._conn.commit()
+        self._conn.close()
+        os.replace(self.temp_path, self.path)
+        debug_log(f"Stored {self.row_count} rows of {self.source} as table {self.table_name}")
+
+    def abort(self):
+        """Discard the partially written table."""
+        try:
+            self._conn.close()
+        finally:
+            if os.path.exists(self.temp_path):
+                os.unlink(self.temp_path)
+
+
+class TableStore:
+    """
+    Directory of per-table SQLite database files, named by content hash.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or TABLE_STORE_DIR
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, table_id):
+        """Return the database file path of a table."""
+        return os.path.join(self.root, f"{table_id}.sqlite")
+
+    def exists(self, table_id):
+        return os.path.exists(self.path(table_id))
+
+    def create(self, table_id, table_name, columns, source):
+        """
+        Start writing a table.
+
+        Args:
+            table_id (str): Content address from table_id()
+            table_name (str): SQL name of the table
+            columns (list): Original column names
+            source (str): Name of the uploaded file
+
+        Returns:
+            TableWriter: Writer for the table's rows
+        """
+        return TableWriter(self.path(table_id), table_name, columns, source)
+
+    def describe(self, table_id):
+        """
+        Read a stored table's name, source file and columns.
+
+        Args:
+            table_id (str): Content address from table_id()
+
+        Returns:
+            dict: name, source, row_count and columns (name, identifier, type)
+        """
+        conn = sqlite3.connect(f"file:{self.path(table_id)}?mode=ro", uri=True)
+        try:
+            name, source, row_count = conn.execute("SELECT name, source, row_count FROM _table").fetchone()
+            columns = [{"name": column, "identifier": identifier, "type": column_type}
+                       for column, identifier, column_type in
+                       conn.execute("SELECT name, identifier, type FROM _columns ORDER BY position")]
+        finally:
+            conn.close()
+        return {"name": name, "source": source, "row_count": row_count, "columns": columns}
+
+    def find_rows(self, table_id, column, value, limit=20):
+        """
+        Look up the full rows in which a column has a given value.
+
+        Args:
+            table_id (str): Content address from table_id()
+            column (str): Original column name or its SQL identifier
+            value: Value to match
+            limit (int): Maximum number of rows
+
+        Returns:
+            list: Matching rows as dicts keyed by original column name
+        """
+        description = self.describe(table_id)
+        names = {c["identifier"]: c["name"] for c in description["columns"]}
+        identifier = next((c["identifier"] for c in description["columns"]
+                           if column in (c["name"], c["identifier"])), None)
+        if identifier is None:
+            raise KeyError(f"Unknown column: {column}")
+
+        conn = sqlite3.connect(f"file:{self.path(table_id)}?mode=ro", uri=True)
+        try:
+            cursor = conn.execute(f'SELECT * FROM "{description["name"]}" WHERE "{identifier}" = ? LIMIT ?',
+                                  (value, limit))
+            identifiers = [d[0] for d in cursor.description]
+            return [{names[key]: item for key, item in zip(identifiers, row)} for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+
+def get_table_store():
+    """
+    Return the table store for this process.
+
+    Returns:
+        TableStore: The store rooted at TABLE_STORE_DIR
+    """
+    pid = os.getpid()
+    if pid not in _stores:
+        with _stores_lock:
+            if pid not in _stores:
+                _stores.clear()
+                _stores[pid] = TableStore()
+    return _stores[pid]
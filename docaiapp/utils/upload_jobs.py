@@ -0,0 +1,519 @@
+"""
+Background upload jobs.
+
+/api/upload only reads the request and enqueues a job; extraction runs on
+a thread pool in the worker process that received the upload, so no HTTP
+request is held open for minutes. Job state is kept in a SQLite database
+shared by all workers or, with the redis session backend, in that Redis
+server, shared by all hosts, so any worker can answer a progress request
+and cancel a job running elsewhere. Each finished file or website is added
+to the corpus index as a resource and the index is saved, which makes
+partial results available for chat while the rest of the upload is
+processed. Resources can later be added to or
+removed from a corpus without reprocessing the others.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from docaiapp.utils.config import DEBUG, env_int, env_str
+from docaiapp.utils import metrics, profiler
+from docaiapp.utils.document_store import get_document_store
+from docaiapp.utils.ingest import ITEM_TIMEOUT, ingest
+from docaiapp.utils.session_store import SESSION_BACKEND, SESSION_REDIS_URL
+from docaiapp.utils.sql_engine import collect_tables
+
+JOB_WORKERS = env_int("UPLOAD_JOB_WORKERS", 4, minimum=1)
+JOB_DB_PATH = env_str("UPLOAD_JOB_DB_PATH", os.path.join("cache", "upload_jobs.db"))
+JOB_RETENTION = env_int("UPLOAD_JOB_RETENTION", 24 * 60 * 60)
+# A job that has not made progress for this long lost its worker process
+JOB_STALE_SECONDS = ITEM_TIMEOUT * 2
+
+ERROR_PREFIXES = ("Error processing",)
+
+JOB_KEY_PREFIX = "docbot:job:"
+CORPUS_JOBS_KEY_PREFIX = "docbot:corpus-jobs:"
+ACTIVE_STATUSES = ("queued", "running")
+
+_stores = {}
+_executors = {}
+_lock = threading.Lock()
+
+def debug_log(message):
+    if DEBUG:
+        print(f"DEBUG [Upload Jobs]: {message}")
+
+
+class JobStore:
+    """
+    SQLite table of upload jobs and the progress of each of their items.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or JOB_DB_PATH
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                corpus_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                items TEXT NOT NULL,
+                resources TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+        """)
+
+    def create(self, owner, corpus_id, items):
+        """
+        Register a queued job.
+
+        Args:
+            owner (str): Session user ID allowed to read the job
+            corpus_id (str): Corpus the job's documents are indexed into
+            items (list): Dicts with source and kind ("file" or "website")
+
+        Returns:
+            str: Job ID
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        items = [dict(item, status="queued") for item in items]
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE updated < ?", (now - JOB_RETENTION,))
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, owner, corpus_id, status, items, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, owner, corpus_id, "queued", json.dumps(items), now, now)
+            )
+        return job_id
+
+    def get(self, job_id):
+        """
+        Read a job.
+
+        Args:
+            job_id (str): Job ID
+
+        Returns:
+            dict: job_id, owner, corpus_id, status, items, resources, created and
+            updated, or None if the job does not exist
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT job_id, owner, corpus_id, status, items, resources, created, updated FROM jobs WHERE job_id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        job = dict(zip(("job_id", "owner", "corpus_id", "status", "items", "resources", "created", "updated"), row))
+        job["items"] = json.loads(job["items"])
+        return _check_stale(job)
+
+    def update(self, job_id, status=None, items=None, resources=None):
+        """
+        Update a job's status, items or final resources message. A cancelled job is not updated.
+
+        Returns:
+            bool: False if the job was cancelled
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute("SELECT status FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None or row[0] == "cancelled":
+                self._conn.execute("COMMIT")
+                return False
+            self._conn.execute(
+                "UPDATE jobs SET status = COALESCE(?, status), items = COALESCE(?, items), "
+                "resources = COALESCE(?, resources), updated = ? WHERE job_id = ?",
+                (status, json.dumps(items) if items is not None else None, resources, time.time(), job_id)
+            )
+            self._conn.execute("COMMIT")
+        return True
+
+    def active_items(self, corpus_id):
+        """
+        Return the items of the queued and running jobs that add to a corpus.
+
+        Args:
+            corpus_id (str): Corpus ID
+
+        Returns:
+            list: Items with resource_id, kind, source and status
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT items, updated FROM jobs WHERE corpus_id = ? AND status IN ('queued', 'running')",
+                (corpus_id,)
+            ).fetchall()
+        now = time.time()
+        return [item for items, updated in rows if now - updated <= JOB_STALE_SECONDS
+                for item in json.loads(items)]
+
+    def cancel_corpus(self, corpus_id):
+        """
+        Cancel every unfinished job that adds to a corpus (e.g. because the corpus is replaced).
+
+        Args:
+            corpus_id (str): Corpus ID
+        """
+        if not corpus_id:
+            return
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', updated = ? WHERE corpus_id = ? AND status IN ('queued', 'running')",
+                (time.time(), corpus_id)
+            )
+
+    def cancel(self, job_id):
+        """
+        Stop a job from publishing further results (e.g. because the chat was cleared).
+
+        Args:
+            job_id (str): Job ID
+        """
+        if not job_id:
+            return
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', updated = ? WHERE job_id = ? AND status IN ('queued', 'running')",
+                (time.time(), job_id)
+            )
+
+
+class RedisJobStore:
+    """
+    Upload jobs in the Redis server of the redis session backend, shared by
+    all hosts. Each job is a JSON value that expires after
+    UPLOAD_JOB_RETENTION, and a list per corpus holds the IDs of the jobs
+    adding to it. Values are changed with WATCH/MULTI/EXEC, so a
+    cancellation is never overwritten by a progress update.
+    """
+
+    def __init__(self, url=None):
+        import redis
+        self._client = redis.Redis.from_url(url or SESSION_REDIS_URL, socket_timeout=2.0,
+                                            socket_connect_timeout=2.0)
+        self._retention_ms = max(JOB_RETENTION, 1) * 1000
+
+    def _modify(self, key, change):
+        """
+        Replace a JSON value in one transaction, retried if another write came in between.
+
+        Args:
+            key (str): Redis key
+            change (callable): Takes the stored value (None if missing) and
+                returns (new value or None to keep it, result)
+
+        Returns:
+            The result returned by change
+        """
+        def write(pipe):
+            data = pipe.get(key)
+            value, result = change(json.loads(data) if data is not None else None)
+            pipe.multi()
+            if value is not None:
+                pipe.set(key, json.dumps(value), px=self._retention_ms)
+            return result
+
+        return self._client.transaction(write, key, value_from_callable=True)
+
+    def _jobs(self, job_ids):
+        pipe = self._client.pipeline(transaction=False)
+        for job_id in job_ids:
+            pipe.get(JOB_KEY_PREFIX + job_id)
+        return [json.loads(data) for data in pipe.execute() if data is not None]
+
+    def _corpus_job_ids(self, corpus_id):
+        data = self._client.get(CORPUS_JOBS_KEY_PREFIX + corpus_id)
+        return json.loads(data) if data is not None else []
+
+    def create(self, owner, corpus_id, items):
+        """Register a queued job (see JobStore.create())."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        job = {"job_id": job_id, "owner": owner, "corpus_id": corpus_id, "status": "queued",
+               "items": [dict(item, status="queued") for item in items], "resources": None,
+               "created": now, "updated": now}
+        self._client.set(JOB_KEY_PREFIX + job_id, json.dumps(job), px=self._retention_ms)
+
+        def add(job_ids):
+            # Drop the IDs of expired jobs while adding the new one
+            job_ids = [job["job_id"] for job in self._jobs(job_ids or [])]
+            return job_ids + [job_id], None
+
+        self._modify(CORPUS_JOBS_KEY_PREFIX + corpus_id, add)
+        return job_id
+
+    def get(self, job_id):
+        """Read a job (see JobStore.get())."""
+        data = self._client.get(JOB_KEY_PREFIX + job_id)
+        return _check_stale(json.loads(data)) if data is not None else None
+
+    def update(self, job_id, status=None, items=None, resources=None):
+        """Update a job (see JobStore.update()); returns False if it was cancelled."""
+        def change(job):
+            if job is None or job["status"] == "cancelled":
+                return None, False
+            for name, value in (("status", status), ("items", items), ("resources", resources)):
+                if value is not None:
+                    job[name] = value
+            job["updated"] = time.time()
+            return job, True
+
+        return self._modify(JOB_KEY_PREFIX + job_id, change)
+
+    def active_items(self, corpus_id):
+        """Return the items of the queued and running jobs that add to a corpus."""
+        now = time.time()
+        return [item for job in self._jobs(self._corpus_job_ids(corpus_id))
+                if job["status"] in ACTIVE_STATUSES and now - job["updated"] <= JOB_STALE_SECONDS
+                for item in job["items"]]
+
+    def cancel_corpus(self, corpus_id):
+        """Cancel every unfinished job that adds to a corpus."""
+        if not corpus_id:
+            return
+        for job_id in self._corpus_job_ids(corpus_id):
+            self.cancel(job_id)
+
+    def cancel(self, job_id):
+        """Stop a job from publishing further results."""
+        if not job_id:
+            return
+
+        def change(job):
+            if job is None or job["status"] not in ACTIVE_STATUSES:
+                return None, None
+            return dict(job, status="cancelled", updated=time.time()), None
+
+        self._modify(JOB_KEY_PREFIX + job_id, change)
+
+def _check_stale(job):
+    """Report a job that stopped making progress (its worker process died) as failed."""
+    if job["status"] in ACTIVE_STATUSES and time.time() - job["updated"] > JOB_STALE_SECONDS:
+        job["status"] = "failed"
+    return job
+
+def get_job_store():
+    """
+    Return the job store for this process.
+
+    Returns:
+        JobStore or RedisJobStore: The store at UPLOAD_JOB_DB_PATH, or in the
+        Redis server of the session store when SESSION_BACKEND is redis
+    """
+    pid = os.getpid()
+    if pid not in _stores:
+        with _lock:
+            if pid not in _stores:
+                _stores.clear()
+                _stores[pid] = RedisJobStore() if SESSION_BACKEND == "redis" else JobStore()
+    return _stores[pid]
+
+def _get_executor():
+    pid = os.getpid()
+    if pid not in _executors:
+        with _lock:
+            if pid not in _executors:
+                _executors.clear()
+                _executors[pid] = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="upload-job")
+    return _executors[pid]
+
+def new_resource_id():
+    """Return a new stable ID for an uploaded file or website."""
+    return uuid.uuid4().hex[:16]
+
+def submit_upload(owner, corpus_id, file_data, websites, service_provider, crawl=False, format_resources=None):
+    """
+    Enqueue an upload job that adds files and websites to a corpus.
+
+    Args:
+        owner (str): Session user ID
+        corpus_id (str): Corpus ID the session reads; new resources are added to
+            its index, which is created if it does not exist yet
+        file_data (list): (filename, bytes) tuples of the uploaded files
+        websites (list): Website URLs
+        service_provider (DocumentServiceProvider): Selects the processor for each item
+        crawl (bool): Also ingest same-site pages linked from each website
+        format_resources (callable): Builds the final resources message from
+            the file names and website URLs of the whole corpus
+
+    Returns:
+        tuple: (job ID, items with resource_id, kind and source)
+    """
+    items = [{"resource_id": new_resource_id(), "source": filename, "kind": "file"} for filename, _ in file_data]
+    items += [{"resource_id": new_resource_id(), "source": url, "kind": "website"} for url in websites]
+    job_id = get_job_store().create(owner, corpus_id, items)
+    _get_executor().submit(run_upload, job_id, corpus_id, file_data, websites, service_provider, crawl,
+                           format_resources)
+    debug_log(f"Queued job {job_id} with {len(items)} items")
+    return job_id, items
+
+def _website_item(items, url):
+    """Return the website item a fetched page belongs to (crawled pages share the site's host)."""
+    websites = [item for item in items if item["kind"] == "website"]
+    host = urlparse(url).netloc
+    return (next((item for item in websites if item["source"] == url), None)
+            or next((item for item in websites if urlparse(item["source"]).netloc == host), None)
+            or (websites[0] if websites else None))
+
+def run_upload(job_id, corpus_id, file_data, websites, service_provider, crawl=False, format_resources=None):
+    """
+    Process an upload job: extract every item and add it to the corpus index
+    in upload order, as soon as it and the items before it are done, so the
+    finished part is available for chat.
+
+    Each result is indexed on its own and appended to the corpus index
+    under the corpus lock (see DocumentStore.add_to_index()), so adding a
+    document costs the same however large the corpus is, and jobs and
+    resource removals running at the same time do not overwrite each
+    other's changes.
+
+    Args:
+        job_id (str): Job ID from submit_upload()
+        corpus_id (str): Corpus ID of the index to update
+        file_data (list): (filename, bytes) tuples of the uploaded files
+        websites (list): Website URLs
+        service_provider (DocumentServiceProvider): Selects the processor for each item
+        crawl (bool): Also ingest same-site pages linked from each website
+        format_resources (callable): Builds the final resources message
+    """
+    # Retrieval pulls in NumPy, which workers only need once they index something
+    from docaiapp.utils.retrieval import build_index
+
+    jobs = get_job_store()
+    job = jobs.get(job_id)
+    if job is None or job["status"] == "cancelled":
+        return
+
+    items = job["items"]
+    for item in items:
+        item["status"] = "processing"
+    if not jobs.update(job_id, status="running", items=items):
+        return
+
+    store = get_document_store()
+    file_items = [item for item in items if item["kind"] == "file"]
+    website_pages = 0
+
+    def on_result(result):
+        nonlocal website_pages
+        failed = result.content.startswith(ERROR_PREFIXES)
+
+        if result.kind == "file":
+            item = next((i for i in file_items if i["source"] == result.source and i["status"] == "processing"), None)
+            if item is None:
+                return
+            previous = item["status"]
+            item.update(status="error" if failed else "done", elapsed=round(result.elapsed, 2))
+            if failed:
+                item["error"] = result.content
+        else:
+            website_pages += 1
+            item = _website_item(items, result.source)
+            if item is None:
+                return
+            previous = item["status"]
+            # A crawled site is done once any of its pages was indexed
+            if not failed:
+                item.update(status="done", elapsed=round(result.elapsed, 2))
+                item.pop("error", None)
+            elif item["status"] != "done":
+                item.update(status="error", elapsed=round(result.elapsed, 2), error=result.content)
+
+        try:
+            tables = []
+            if not failed and result.kind == "file" and result.source.lower().endswith(".csv"):
+                tables = collect_tables([file_data[file_items.index(item)]])
+
+            if not failed:
+                # Only the new document is indexed; the corpus index is not read or rewritten
+                index = build_index()
+                index.add_resource(item["resource_id"], item["kind"], item["source"])
+                if result.doc_id is not None:
+                    # Stored while it was extracted; read back from the document store chunk by chunk
+                    index.add_stored_document(result.doc_id, result.source, resource_id=item["resource_id"])
+                else:
+                    index.add_document(result.source, result.content, resource_id=item["resource_id"])
+                for table_id in tables:
+                    index.add_table(item["resource_id"], table_id)
+
+            with store.index_lock(corpus_id):
+                # Publish nothing once the job was cancelled (e.g. the chat was cleared)
+                if not jobs.update(job_id, items=items) or failed:
+                    return
+                store.add_to_index(corpus_id, index)
+        except Exception as e:
+            # Only this result is lost (e.g. embedding it or saving the index failed); the job goes on
+            debug_log(f"ERROR indexing {result.source}: {str(e)}")
+            metrics.record_error("upload", e)
+            # A crawled site stays done if an earlier page was indexed
+            if result.kind == "file" or previous != "done":
+                item.update(status="error", error=f"Error processing {result.source}: {str(e)}")
+            jobs.update(job_id, items=items)
+
+    metrics.UPLOAD_JOBS_RUNNING.inc()
+    recording = profiler.start("upload_job", job_id=job_id, file_types=profiler.file_types(
+        [filename for filename, _ in file_data]), websites=len(websites), crawl=crawl)
+    try:
+        ingest(file_data, websites, service_provider, crawl=crawl, on_result=on_result)
+        for item in items:
+            if item["status"] == "processing":
+                # Unsupported file types are not processed
+                item["status"] = "skipped"
+
+        with store.index_lock(corpus_id):
+            index = store.load_index(corpus_id)
+            if index is None:
+                # Also covers uploads without any usable document
+                index = build_index()
+                if jobs.update(job_id):
+                    store.save_index(index, corpus_id)
+            resources = format_resources(*index.resource_names()) if format_resources else None
+            jobs.update(job_id, status="done", items=items, resources=resources)
+        debug_log(f"Job {job_id} done: {len(index)} chunks, {website_pages} website pages")
+    except Exception as e:
+        debug_log(f"ERROR in job {job_id}: {str(e)}")
+        for item in items:
+            if item["status"] in ("queued", "processing"):
+                item.update(status="error", error=str(e))
+        jobs.update(job_id, status="failed", items=items)
+        metrics.record_error("upload", e)
+    finally:
+        metrics.UPLOAD_JOBS_RUNNING.dec()
+        profiler.finish(recording, items=len(items), status=(jobs.get(job_id) or {}).get("status"))
+
+def job_progress(job):
+    """
+    Summarize a job for the progress endpoint.
+
+    Args:
+        job (dict): Job from JobStore.get()
+
+    Returns:
+        dict: job_id, status, counts of finished items and the items themselves
+    """
+    finished = sum(1 for item in job["items"] if item["status"] in ("done", "error", "skipped"))
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "completed": finished,
+        "total": len(job["items"]),
+        "items": job["items"],
+        "resources": job["resources"],
+    }
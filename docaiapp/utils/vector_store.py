@@ -0,0 +1,214 @@
+"""
+In-memory vector store for chunk embeddings.
+
+Vectors are kept in one contiguous float32 matrix and searched with a single
+matrix-vector product. Once the store grows past VECTOR_IVF_THRESHOLD rows,
+an inverted-file (IVF) partition is trained so that a query only scores the
+vectors in its nearest clusters.
+"""
+
+import numpy as np
+from docaiapp.utils.config import DEBUG, env_int
+
+IVF_THRESHOLD = env_int("VECTOR_IVF_THRESHOLD", 20000)
+IVF_PROBES = env_int("VECTOR_IVF_PROBES", 8)
+
+def debug_log(message):
+    if DEBUG:
+        print(f"DEBUG [Vector Store]: {message}")
+
+def top_k_indices(scores, k):
+    """
+    Return the indices of the k highest scores, best first.
+
+    Args:
+        scores (numpy.ndarray): 1-D array of scores
+        k (int): Number of indices to return
+
+    Returns:
+        numpy.ndarray: Indices into scores
+    """
+    if k >= len(scores):
+        return np.argsort(-scores)
+    candidates = np.argpartition(-scores, k)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+class IVFIndex:
+    """
+    Inverted-file partition of a normalized vector matrix, trained with spherical k-means.
+    """
+
+    def __init__(self, matrix, cluster_count=None, iterations=10, sample_size=50000, seed=0):
+        """
+        Train centroids and assign every vector to its nearest cluster.
+
+        Args:
+            matrix (numpy.ndarray): Normalized float32 vectors, one per row
+            cluster_count (int): Number of clusters (defaults to sqrt of row count)
+            iterations (int): k-means iterations
+            sample_size (int): Maximum number of rows used for training
+            seed (int): Random seed, so the partition is reproducible
+        """
+        rng = np.random.default_rng(seed)
+        row_count = len(matrix)
+        cluster_count = cluster_count or max(1, int(np.sqrt(row_count)))
+
+        sample = matrix
+        if row_count > sample_size:
+            sample = matrix[rng.choice(row_count, sample_size, replace=False)]
+
+        centroids = sample[rng.choice(len(sample), cluster_count, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            filled = norms[:, 0] > 0
+            # Empty clusters keep their previous centroid
+            centroids[filled] = sums[filled] / norms[filled]
+
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.lists = [[] for _ in range(cluster_count)]
+        self.add(matrix, 0)
+        debug_log(f"Trained IVF partition with {cluster_count} clusters over {row_count} vectors")
+
+    def add(self, vectors, offset):
+        """
+        Assign new vectors to their nearest clusters without retraining.
+
+        Args:
+            vectors (numpy.ndarray): Normalized vectors
+            offset (int): Row number of the first vector in the store
+        """
+        assignment = np.argmax(vectors @ self.centroids.T, axis=1)
+        for row, cluster in enumerate(assignment):
+            self.lists[cluster].append(offset + row)
+
+    def candidates(self, query, probes):
+        """
+        Return the row numbers stored in the clusters closest to the query.
+
+        Args:
+            query (numpy.ndarray): Normalized query vector
+            probes (int): Number of clusters to search
+
+        Returns:
+            numpy.ndarray: Candidate row numbers
+        """
+        probes = min(probes, len(self.centroids))
+        nearest = top_k_indices(self.centroids @ query, probes)
+        rows = [self.lists[cluster] for cluster in nearest if self.lists[cluster]]
+        if not rows:
+            return np.zeros(0, dtype=np.intp)
+        return np.concatenate([np.asarray(r, dtype=np.intp) for r in rows])
+
+
+class VectorStore:
+    """
+    Contiguous float32 matrix of normalized vectors with top-k cosine search.
+    """
+
+    def __init__(self, dimensions=None, ivf_threshold=None, probes=None):
+        """
+        Initialize an empty store.
+
+        Args:
+            dimensions (int): Vector size (taken from the first batch if omitted)
+            ivf_threshold (int): Row count at which the IVF partition is trained
+            probes (int): Number of IVF clusters searched per query
+        """
+        self.dimensions = dimensions
+        self.ivf_threshold = ivf_threshold or IVF_THRESHOLD
+        self.probes = probes or IVF_PROBES
+        self.size = 0
+        self._data = None
+        self._ivf = None
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def matrix(self):
+        """The stored vectors as a contiguous (size, dimensions) view."""
+        if self._data is None:
+            return np.zeros((0, self.dimensions or 0), dtype=np.float32)
+        return self._data[:self.size]
+
+    def add(self, vectors):
+        """
+        Append normalized vectors to the store.
+
+        The backing buffer grows geometrically so repeated additions stay
+        amortized O(n) instead of copying the whole matrix every time.
+
+        Args:
+            vectors (numpy.ndarray): Normalized float32 vectors, one per row
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if len(vectors) == 0:
+            return
+
+        if self._data is None:
+            self.dimensions = vectors.shape[1]
+            self._data = np.empty((max(len(vectors), 64), self.dimensions), dtype=np.float32)
+        elif self.size + len(vectors) > len(self._data):
+            capacity = max(self.size + len(vectors), 2 * len(self._data))
+            data = np.empty((capacity, self.dimensions), dtype=np.float32)
+            data[:self.size] = self._data[:self.size]
+            self._data = data
+
+        offset = self.size
+        self._data[offset:offset + len(vectors)] = vectors
+        self.size += len(vectors)
+
+        if self._ivf is not None:
+            self._ivf.add(vectors, offset)
+        elif self.size >= self.ivf_threshold:
+            self._ivf = IVFIndex(self.matrix)
+
+    def keep_rows(self, rows):
+        """
+        Keep only the given rows, renumbered in the order given.
+
+        The IVF partition is retrained (or dropped below the threshold), since
+        row numbers change.
+
+        Args:
+            rows (list): Row numbers to keep
+        """
+        if self._data is None:
+            return
+        self._data = np.ascontiguousarray(self.matrix[np.asarray(rows, dtype=np.intp)])
+        self.size = len(self._data)
+        self._ivf = IVFIndex(self.matrix) if self.size >= self.ivf_threshold else None
+
+    def search(self, query, top_k):
+        """
+        Find the vectors most similar to a query.
+
+        Args:
+            query (numpy.ndarray): Normalized query vector
+            top_k (int): Number of results
+
+        Returns:
+            list: (score, row) tuples, best first
+        """
+        if self.size == 0:
+            return []
+
+        query = np.asarray(query, dtype=np.float32)
+        if self._ivf is not None:
+            rows = self._ivf.candidates(query, self.probes)
+            scores = self._data[rows] @ query
+            best = top_k_indices(scores, top_k)
+            return [(float(scores[i]), int(rows[i])) for i in best]
+
+        scores = self.matrix @ query
+        return [(float(scores[i]), int(i)) for i in top_k_indices(scores, top_k)]
+
+    def __getstate__(self):
+        # Drop unused buffer capacity when the store is persisted
+        state = self.__dict__.copy()
+        state["_data"] = None if self._data is None else self.matrix.copy()
+        return state
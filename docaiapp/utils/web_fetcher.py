@@ -0,0 +1,360 @@
+"""
+Asynchronous website fetcher used by the website processor.
+
+All fetches in a worker process share one httpx connection pool running on
+the background event loop. Requests are limited globally and per host, and
+ETag / Last-Modified validators are remembered so that fetching an unchanged
+page again only costs a 304 response. Optionally a site can be crawled by
+following same-site links and its sitemap.xml, up to a page and depth limit.
+"""
+
+import asyncio
+import os
+import re
+import time
+import xml.etree.ElementTree as ElementTree
+from collections import OrderedDict, deque
+from urllib.parse import urljoin, urldefrag, urlparse
+import httpx
+from docaiapp.utils.config import DEBUG, env_float, env_int
+from docaiapp.utils import async_runtime, metrics
+
+FETCH_CONCURRENCY = env_int("WEBSITE_FETCH_CONCURRENCY", 20, minimum=1)
+PER_HOST_CONCURRENCY = env_int("WEBSITE_PER_HOST_CONCURRENCY", 4, minimum=1)
+FETCH_TIMEOUT = env_float("WEBSITE_FETCH_TIMEOUT", 10)
+CRAWL_MAX_PAGES = env_int("CRAWL_MAX_PAGES", 50)
+CRAWL_MAX_DEPTH = env_int("CRAWL_MAX_DEPTH", 2)
+CRAWL_TIMEOUT = env_float("CRAWL_TIMEOUT", 120)
+CACHE_MAX_BYTES = env_int("WEBSITE_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+# Pages are read up to this size; the rest of a larger page is not downloaded
+MAX_PAGE_BYTES = env_int("WEBSITE_MAX_PAGE_BYTES", 5 * 1024 * 1024, minimum=1024)
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+HREF_PATTERN = re.compile(r'<a\s[^>]*?href\s*=\s*["\']([^"\'#]+)', re.IGNORECASE)
+SKIPPED_EXTENSIONS = (
+    '.pdf', '.zip', '.gz', '.tar', '.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp', '.ico',
+    '.css', '.js', '.json', '.xml', '.mp3', '.mp4', '.avi', '.mov', '.doc', '.docx', '.ppt',
+    '.pptx', '.xls', '.xlsx', '.csv', '.exe', '.dmg',
+)
+
+_fetchers = {}
+
+def debug_log(message):
+    if DEBUG:
+        print(f"DEBUG [Web Fetcher]: {message}")
+
+
+class FetchResult:
+    """
+    Outcome of fetching one URL.
+    """
+
+    def __init__(self, url, status_code=None, content=b"", content_type="", from_cache=False, error=None):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.content_type = content_type
+        self.from_cache = from_cache
+        self.error = error
+
+    @property
+    def is_html(self):
+        return not self.content_type or "html" in self.content_type
+
+
+class ValidatorCache:
+    """
+    LRU cache of page bodies with their ETag / Last-Modified validators,
+    bounded by the total size of the cached bodies.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes or CACHE_MAX_BYTES
+        self.size = 0
+        self._entries = OrderedDict()
+
+    def get(self, url):
+        entry = self._entries.get(url)
+        if entry is not None:
+            self._entries.move_to_end(url)
+        return entry
+
+    def put(self, url, etag, last_modified, content, content_type):
+        if not etag and not last_modified:
+            return
+        if len(content) > self.max_bytes:
+            return
+        self.discard(url)
+        self._entries[url] = (etag, last_modified, content, content_type)
+        self.size += len(content)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted[2])
+
+    def discard(self, url):
+        entry = self._entries.pop(url, None)
+        if entry is not None:
+            self.size -= len(entry[2])
+
+
+def _same_site(url, root):
+    host = (urlparse(url).hostname or "").removeprefix("www.")
+    return host == (urlparse(root).hostname or "").removeprefix("www.")
+
+def _normalize_link(href, base):
+    url, _ = urldefrag(urljoin(base, href.strip()))
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https"):
+        return None
+    if parsed.path.lower().endswith(SKIPPED_EXTENSIONS):
+        return None
+    return url
+
+def extract_links(html, base):
+    """
+    Extract followable same-page-format links from an HTML document.
+
+    Args:
+        html (str): HTML content
+        base (str): URL the HTML was fetched from
+
+    Returns:
+        list: Absolute URLs without fragments, in document order
+    """
+    links = []
+    seen = set()
+    for href in HREF_PATTERN.findall(html):
+        url = _normalize_link(href, base)
+        if url and url not in seen:
+            seen.add(url)
+            links.append(url)
+    return links
+
+
+async def _read_body(response):
+    """Read a streamed response body, stopping at MAX_PAGE_BYTES."""
+    chunks = []
+    size = 0
+    async for chunk in response.aiter_bytes():
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= MAX_PAGE_BYTES:
+            debug_log(f"Page {response.url} is larger than {MAX_PAGE_BYTES} bytes, truncated")
+            break
+    return b"".join(chunks)[:MAX_PAGE_BYTES]
+
+
+class WebFetcher:
+    """
+    Concurrent HTTP fetcher bound to the background event loop of one process.
+    """
+
+    def __init__(self):
+        self.cache = ValidatorCache()
+        self._client = None
+        self._global_limit = None
+        self._host_limits = {}
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                headers={'User-Agent': USER_AGENT},
+                timeout=FETCH_TIMEOUT,
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=FETCH_CONCURRENCY,
+                                    max_keepalive_connections=FETCH_CONCURRENCY)
+            )
+            self._global_limit = asyncio.Semaphore(FETCH_CONCURRENCY)
+        return self._client
+
+    def _host_limit(self, url):
+        host = urlparse(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(PER_HOST_CONCURRENCY)
+        return self._host_limits[host]
+
+    async def fetch(self, url):
+        """
+        Fetch a URL, revalidating a cached copy with a conditional GET.
+
+        Args:
+            url (str): URL to fetch
+
+        Returns:
+            FetchResult: The page, or the error that prevented fetching it
+        """
+        client = self._get_client()
+        cached = self.cache.get(url)
+        headers = {}
+        if cached:
+            etag, last_modified, _, _ = cached
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+
+        started = None
+        try:
+            async with self._global_limit, self._host_limit(url):
+                started = time.perf_counter()
+                async with client.stream("GET", url, headers=headers) as response:
+                    content = await _read_body(response) if response.is_success else b""
+            elapsed = time.perf_counter() - started
+
+            if response.status_code == 304 and cached:
+                debug_log(f"Not modified: {url}")
+                metrics.WEBSITE_FETCH_SECONDS.labels("not_modified").observe(elapsed)
+                return FetchResult(url, 304, cached[2], cached[3], from_cache=True)
+
+            response.raise_for_status()
+            metrics.WEBSITE_FETCH_SECONDS.labels("ok").observe(elapsed)
+            content_type = response.headers.get('content-type', '')
+            self.cache.put(url, response.headers.get('etag'), response.headers.get('last-modified'),
+                           content, content_type)
+            debug_log(f"Fetched {url}: status {response.status_code}, {len(content)} bytes")
+            return FetchResult(str(response.url), response.status_code, content, content_type)
+        except Exception as e:
+            debug_log(f"ERROR fetching {url}: {str(e)}")
+            if started is not None:
+                metrics.WEBSITE_FETCH_SECONDS.labels("error").observe(time.perf_counter() - started)
+            metrics.record_error("website_fetch", e)
+            return FetchResult(url, error=e)
+
+    async def fetch_many(self, urls):
+        """
+        Fetch several URLs concurrently.
+
+        Args:
+            urls (list): URLs to fetch
+
+        Returns:
+            list: FetchResult objects in the same order as urls
+        """
+        return await asyncio.gather(*(self.fetch(url) for url in urls))
+
+    async def _sitemap_urls(self, root, limit):
+        """Read page URLs for a site from its sitemap.xml (following one level of sitemap index)."""
+        parsed = urlparse(root)
+        sitemaps = [f"{parsed.scheme}://{parsed.netloc}/sitemap.xml"]
+        urls = []
+
+        for _ in range(2):
+            results = await self.fetch_many(sitemaps)
+            sitemaps = []
+            for result in results:
+                if result.error:
+                    continue
+                try:
+                    tree = ElementTree.fromstring(result.content)
+                except ElementTree.ParseError:
+                    continue
+                locations = [element.text.strip() for element in tree.iter() if element.tag.endswith('loc') and element.text]
+                if tree.tag.endswith('sitemapindex'):
+                    sitemaps.extend(locations[:10])
+                else:
+                    urls.extend(url for url in locations if _same_site(url, root))
+            if not sitemaps or len(urls) >= limit:
+                break
+
+        debug_log(f"Sitemap for {root} listed {len(urls)} pages")
+        return urls[:limit]
+
+    async def crawl(self, root, max_pages=None, max_depth=None, time_limit=None):
+        """
+        Fetch a page and the same-site pages reachable from it.
+
+        Pages are visited breadth first, one depth level at a time so that
+        each level is fetched concurrently. URLs from the site's sitemap.xml
+        are treated as depth 1. When the time limit is reached the pages
+        fetched so far are returned.
+
+        Args:
+            root (str): Start URL
+            max_pages (int): Maximum number of pages to return
+            max_depth (int): Maximum number of links followed from the root
+            time_limit (float): Seconds after which no new level is started
+
+        Returns:
+            list: FetchResult objects, root first
+        """
+        max_pages = max_pages or CRAWL_MAX_PAGES
+        max_depth = CRAWL_MAX_DEPTH if max_depth is None else max_depth
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (time_limit or CRAWL_TIMEOUT)
+
+        root_result = await self.fetch(root)
+        pages = [root_result]
+        if root_result.error or not root_result.is_html:
+            return pages
+
+        seen = {root, root_result.url}
+        frontier = deque()
+        for url in await self._sitemap_urls(root, max_pages):
+            if url not in seen:
+                seen.add(url)
+                frontier.append((url, 1))
+
+        html = root_result.content.decode('utf-8', errors='replace')
+        for url in await asyncio.to_thread(extract_links, html, root_result.url):
+            if url not in seen and _same_site(url, root):
+                seen.add(url)
+                frontier.append((url, 1))
+
+        while frontier and len(pages) < max_pages:
+            if loop.time() >= deadline:
+                debug_log(f"Crawl time limit reached for {root}")
+                break
+            depth = frontier[0][1]
+            level = []
+            while frontier and frontier[0][1] == depth and len(pages) + len(level) < max_pages:
+                level.append(frontier.popleft()[0])
+
+            for result in await self.fetch_many(level):
+                if result.error or not result.is_html:
+                    continue
+                pages.append(result)
+                if depth >= max_depth:
+                    continue
+                html = result.content.decode('utf-8', errors='replace')
+                for url in await asyncio.to_thread(extract_links, html, result.url):
+                    if url not in seen and _same_site(url, root):
+                        seen.add(url)
+                        frontier.append((url, depth + 1))
+
+        debug_log(f"Crawled {len(pages)} pages from {root}")
+        return pages
+
+
+def _get_fetcher():
+    pid = os.getpid()
+    if pid not in _fetchers:
+        _fetchers.clear()
+        _fetchers[pid] = WebFetcher()
+    return _fetchers[pid]
+
+async def _fetch_all(urls, crawl):
+    fetcher = _get_fetcher()
+    if crawl:
+        return await asyncio.gather(*(fetcher.crawl(url) for url in urls))
+    return [[result] for result in await fetcher.fetch_many(urls)]
+
+def fetch_pages(urls, crawl=False):
+    """
+    Fetch websites concurrently on the shared connection pool.
+
+    Args:
+        urls (list): Website URLs
+        crawl (bool): Also fetch same-site pages linked from each URL
+
+    Returns:
+        list: One list of FetchResult objects per URL, in the same order as urls
+    """
+    if not urls:
+        return []
+    if crawl:
+        timeout = CRAWL_TIMEOUT + FETCH_TIMEOUT * 2
+    else:
+        # URLs beyond the concurrency limit wait for a free connection
+        timeout = FETCH_TIMEOUT * (2 + len(urls) // FETCH_CONCURRENCY)
+    return async_runtime.run(_fetch_all(urls, crawl), timeout)
@@ -1,17 +1,315 @@
-import requests
-from bs4 import BeautifulSoup
+"""
+Website processor: converts fetched pages to markdown.
+
+Pages are parsed with lxml and converted in a single pass in document
+order, so every heading, paragraph, list, table and code block is emitted
+exactly once, however deeply it is nested. Scripts, styles, forms and page
+chrome are dropped: navigation, headers, footers, sidebars, hidden
+elements, and blocks whose class or id marks them as menus, cookie
+banners, share buttons and the like. When the page marks its main content
+(<main>, role="main" or a single <article>) only that part is converted;
+otherwise lists that consist of links only (menus) are dropped as well.
+The fetcher caps every page at WEBSITE_MAX_PAGE_BYTES.
+"""
+
 import re
-import os
-from dotenv import load_dotenv
+import lxml.html
+from lxml import etree
+from docaiapp.utils.config import DEBUG
+from docaiapp.utils.web_fetcher import fetch_pages
 
-# Load environment variables and set up debug functionality
-load_dotenv()
-DEBUG = os.getenv("DEBUG", "False").lower() in ["true", "1", "t", "yes", "y"]
+HEADING_TAGS = frozenset(["h1", "h2", "h3", "h4", "h5", "h6"])
+# Removed with their content before the conversion
+STRIPPED_TAGS = ("script", "style", "noscript", "template", "svg", "canvas", "iframe", "object", "embed",
+                 "form", "button", "select", "textarea", "dialog")
+# Page chrome, skipped unless it is part of the main content (e.g. an article's header)
+CHROME_TAGS = frozenset(["nav", "aside", "header", "footer"])
+CHROME_ROLES = frozenset(["navigation", "banner", "contentinfo", "complementary", "search", "dialog"])
+# Elements whose text is part of the surrounding paragraph; anything else is a block
+INLINE_TAGS = frozenset([
+    "a", "abbr", "b", "bdi", "bdo", "br", "cite", "code", "data", "del", "dfn", "em", "font", "i", "img", "ins",
+    "kbd", "label", "mark", "q", "s", "samp", "small", "span", "strong", "sub", "sup", "time", "u", "var",
+    "wbr",
+])
+# Class or id words of boilerplate blocks: always skipped, or skipped when they are short or mostly links
+BOILERPLATE_PATTERN = re.compile(
+    r"(?:^|[\s_-])(?:cookies?|consent|breadcrumbs?|share|sharing|social|advert|ads|promo|newsletter|"
+    r"subscribe|popup|modal|skip-link)(?:$|[\s_-])", re.IGNORECASE)
+CHROME_PATTERN = re.compile(
+    r"(?:^|[\s_-])(?:nav|navbar|navigation|menu|sidebar|related|comments?|banner|masthead|toolbar)(?:$|[\s_-])",
+    re.IGNORECASE)
+CHROME_MAX_CHARS = 200
+MAX_LINK_DENSITY = 0.5
+WHITESPACE_PATTERN = re.compile(r'\s+')
+CHARSET_PATTERN = re.compile(r'charset=["\']?([\w.:-]+)', re.IGNORECASE)
+MAX_DEPTH = 200
 
 def debug_log(message):
     if DEBUG:
         print(f"DEBUG [Website Processor]: {message}")
 
+def normalize_url(url):
+    """Add a scheme to URLs entered without one."""
+    url = url.strip()
+    if not url.startswith(('http://', 'https://')):
+        url = 'https://' + url
+    return url
+
+def _clean(text):
+    return WHITESPACE_PATTERN.sub(" ", text).strip()
+
+def _text_length(text):
+    """Length of a text without its whitespace."""
+    return len("".join(text.split()))
+
+def _find_main_content(root):
+    """
+    Return the element holding the page's main content, or None if the page does not mark it.
+    """
+    candidates = root.xpath("//main | //*[@role='main']")
+    if not candidates:
+        articles = root.xpath("//article")
+        # Several articles are a listing (e.g. a blog index), not one main article
+        candidates = articles if len(articles) == 1 else []
+    if not candidates:
+        return None
+    return max(candidates, key=lambda element: len(element.text_content()))
+
+
+class MarkdownWriter:
+    """
+    Converts an element tree to markdown blocks in one walk over the tree.
+    """
+
+    def __init__(self, main_content=False, lengths=None):
+        # Inside a marked main content element headers and footers belong to the content
+        self.main_content = main_content
+        self.blocks = []
+        self._inline = []
+        # Element -> (text length, link text length), see _measure()
+        self._lengths = {} if lengths is None else lengths
+
+    def _flush(self):
+        text = _clean("".join(self._inline))
+        self._inline.clear()
+        if text:
+            self.blocks.append(text)
+
+    def _measure(self, element):
+        """
+        Return the text length and the link text length of an element, without whitespace.
+
+        The lengths of the element's whole subtree are computed bottom-up on
+        first use and kept, so nested menus and lists are measured once
+        instead of once per enclosing element.
+        """
+        lengths = self._lengths
+        if element not in lengths:
+            for node in reversed(list(element.iter())):
+                if node in lengths:
+                    continue
+                text = _text_length(node.text or "") if isinstance(node.tag, str) else 0
+                links = 0
+                for child in node:
+                    child_text, child_links = lengths[child]
+                    text += child_text + _text_length(child.tail or "")
+                    links += child_links
+                lengths[node] = (text, text if node.tag == "a" else links)
+        return lengths[element]
+
+    def _skipped(self, element):
+        """Whether an element is page chrome or boilerplate."""
+        tag = element.tag
+        if tag in CHROME_TAGS and not (self.main_content and tag in ("header", "footer")):
+            return True
+        if element.get("hidden") is not None or element.get("aria-hidden") == "true":
+            return True
+        if element.get("role") in CHROME_ROLES:
+            return True
+        names = f"{element.get('class', '')} {element.get('id', '')}"
+        if not names.strip() or tag in ("html", "body", "main", "article"):
+            return False
+        if BOILERPLATE_PATTERN.search(names):
+            return True
+        if CHROME_PATTERN.search(names):
+            text, links = self._measure(element)
+            return text < CHROME_MAX_CHARS or links >= text * MAX_LINK_DENSITY
+        return False
+
+    def write(self, element, depth=0):
+        """Convert an element and its descendants (not its tail)."""
+        tag = element.tag
+        if not isinstance(tag, str) or self._skipped(element):
+            return
+        if tag in INLINE_TAGS or depth > MAX_DEPTH:
+            self._inline.append(element.text_content())
+            return
+        self._flush()
+        if tag in HEADING_TAGS:
+            text = _clean(element.text_content())
+            if text:
+                self.blocks.append(f"{'#' * int(tag[1])} {text}")
+        elif tag == "p":
+            self._inline.append(element.text_content())
+        elif tag in ("ul", "ol"):
+            lines = self._list(element, 0)
+            if lines:
+                self.blocks.append("\n".join(lines))
+        elif tag == "table":
+            self._table(element)
+        elif tag == "pre":
+            code = element.text_content().strip("\n")
+            if code.strip():
+                self.blocks.append(f"```\n{code}\n```")
+        elif tag == "blockquote":
+            quote = MarkdownWriter(self.main_content, self._lengths)
+            quote._children(element, depth)
+            quote._flush()
+            for block in quote.blocks:
+                self.blocks.append("\n".join(f"> {line}" if line else ">" for line in block.split("\n")))
+        else:
+            self._children(element, depth)
+        self._flush()
+
+    def _children(self, element, depth):
+        if element.text:
+            self._inline.append(element.text)
+        for child in element:
+            self.write(child, depth + 1)
+            if child.tail:
+                self._inline.append(child.tail)
+
+    def _list(self, element, depth):
+        """Render a list as markdown lines; nested lists are indented."""
+        if not self.main_content and len(element) >= 3:
+            text, links = self._measure(element)
+            if text and links >= text * 0.9:
+                return []
+        lines = []
+        number = 0
+        for item in element:
+            if item.tag in ("ul", "ol"):
+                lines.extend(self._list(item, depth + 1))
+                continue
+            if item.tag != "li" or self._skipped(item):
+                continue
+            number += 1
+            parts = [item.text or ""]
+            nested = []
+            for child in item:
+                if child.tag in ("ul", "ol"):
+                    nested.extend(self._list(child, depth + 1))
+                elif isinstance(child.tag, str) and not self._skipped(child):
+                    parts.append(f" {child.text_content()} " if child.tag not in INLINE_TAGS else child.text_content())
+                if child.tail:
+                    parts.append(child.tail)
+            text = _clean("".join(parts))
+            if text:
+                marker = f"{number}." if element.tag == "ol" else "-"
+                lines.append(f"{'  ' * depth}{marker} {text}")
+            lines.extend(nested)
+        return lines
+
+    def _table(self, element):
+        """Render a table as a markdown table (a single column as paragraphs)."""
+        caption = element.find("caption")
+        if caption is not None and _clean(caption.text_content()):
+            self.blocks.append(_clean(caption.text_content()))
+        rows = []
+        for row in element.xpath("./tr | ./thead/tr | ./tbody/tr | ./tfoot/tr"):
+            cells = [_clean(cell.text_content()).replace("|", "\\|") for cell in row if cell.tag in ("td", "th")]
+            if any(cells):
+                rows.append(cells)
+        if not rows:
+            return
+        width = max(len(cells) for cells in rows)
+        if width == 1:
+            # Layout table
+            self.blocks.extend(cells[0] for cells in rows if cells[0])
+            return
+        rows = [cells + [""] * (width - len(cells)) for cells in rows]
+        lines = ["| " + " | ".join(rows[0]) + " |", "| " + " | ".join(["---"] * width) + " |"]
+        lines.extend("| " + " | ".join(cells) + " |" for cells in rows[1:])
+        self.blocks.append("\n".join(lines))
+
+def html_to_markdown(html, url, encoding=None):
+    """
+    Convert a fetched HTML page to markdown.
+    
+    Args:
+        html (bytes): HTML content of the page
+        url (str): URL the page was fetched from
+        encoding (str): Character set from the Content-Type header (detected from the page if None)
+        
+    Returns:
+        str: Extracted content in markdown format
+    """
+    if not html.strip():
+        return f"# Website: Untitled Page\n\nURL: {url}"
+    try:
+        parser = lxml.html.HTMLParser(encoding=encoding, remove_comments=True, remove_pis=True, no_network=True)
+    except LookupError:
+        debug_log(f"Unknown charset {encoding}, detecting it from the page")
+        parser = lxml.html.HTMLParser(remove_comments=True, remove_pis=True, no_network=True)
+    root = lxml.html.document_fromstring(html, parser=parser)
+    debug_log("HTML content parsed successfully")
+
+    title = _clean(root.findtext(".//title") or "") or "Untitled Page"
+    debug_log(f"Page title: {title}")
+
+    etree.strip_elements(root, *STRIPPED_TAGS, with_tail=False)
+    # Line breaks separate words in the text of paragraphs, list items and cells
+    for line_break in root.iter("br"):
+        line_break.tail = "\n" + (line_break.tail or "")
+
+    main = _find_main_content(root)
+    writer = MarkdownWriter(main_content=main is not None)
+    body = root.find("body")
+    writer.write(main if main is not None else (body if body is not None else root))
+    debug_log(f"Converted {'main content' if main is not None else 'page body'}: {len(writer.blocks)} blocks")
+
+    content = "\n\n".join([f"# Website: {title}", f"URL: {url}"] + writer.blocks)
+    debug_log(f"Website processing complete: {len(content)} characters extracted")
+    return content
+
+def _page_to_markdown(result):
+    """Convert a FetchResult to markdown, or to an error message if the fetch failed."""
+    if result.error is not None:
+        return f"Error processing website {result.url}: {str(result.error)}"
+    try:
+        match = CHARSET_PATTERN.search(result.content_type or "")
+        return html_to_markdown(result.content, result.url, encoding=match.group(1) if match else None)
+    except Exception as e:
+        debug_log(f"ERROR processing website: {str(e)}")
+        return f"Error processing website {result.url}: {str(e)}"
+
+def process_websites(urls, crawl=False):
+    """
+    Process several website URLs concurrently.
+    
+    Args:
+        urls (list): URLs of the websites to process
+        crawl (bool): Also process same-site pages linked from each URL
+            (and listed in its sitemap.xml), up to CRAWL_MAX_PAGES per site
+        
+    Returns:
+        list: (page URL, markdown content) tuples, grouped by input URL in input order
+    """
+    urls = [normalize_url(url) for url in urls if url.strip()]
+    debug_log(f"Processing {len(urls)} website URLs (crawl: {crawl})")
+    
+    try:
+        fetched = fetch_pages(urls, crawl=crawl)
+    except Exception as e:
+        debug_log(f"ERROR fetching websites: {str(e)}")
+        return [(url, f"Error processing website {url}: {str(e) or type(e).__name__}") for url in urls]
+    
+    pages = []
+    for results in fetched:
+        for result in results:
+            pages.append((result.url, _page_to_markdown(result)))
+    return pages
+
 def process_website(url):
     """
     Process a website URL and extract content in markdown format.
@@ -23,77 +321,7 @@ def process_website(url):
         str: Extracted content in markdown format
     """
     debug_log(f"Processing website URL: {url}")
-    
-    try:
-        # Validate URL
-        if not url.startswith(('http://', 'https://')):
-            url = 'https://' + url
-        debug_log(f"Validated URL: {url}")
-        
-        # Make request to the website
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        debug_log(f"Website request successful: Status code {response.status_code}")
-        
-        # Parse HTML content
-        soup = BeautifulSoup(response.content, 'html.parser')
-        debug_log("HTML content parsed successfully")
-        
-        # Extract title
-        title = soup.title.string if soup.title else "Untitled Page"
-        debug_log(f"Page title: {title}")
-        
-        # Remove script and style elements
-        for script_or_style in soup(['script', 'style', 'header', 'footer', 'nav']):
-            script_or_style.decompose()
-        debug_log("Removed script, style, header, footer, and nav elements")
-        
-        # Initialize content with title
-        content = f"# Website: {title}\n\nURL: {url}\n\n"
-        
-        # Extract headings and their content
-        for heading in soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
-            heading_level = int(heading.name[1])
-            heading_text = heading.get_text().strip()
-            
-            if heading_text:
-                content += f"{'#' * heading_level} {heading_text}\n\n"
-                debug_log(f"Extracted heading: {heading_text}")
-                
-                # Get all paragraph siblings until next heading
-                sibling = heading.next_sibling
-                paragraph_content = ""
-                
-                while sibling and not sibling.name in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
-                    if sibling.name == 'p':
-                        paragraph_text = sibling.get_text().strip()
-                        if paragraph_text:
-                            paragraph_content += paragraph_text + "\n\n"
-                    sibling = sibling.next_sibling
-                
-                content += paragraph_content
-        
-        # Extract any remaining paragraphs that aren't under headings
-        additional_content = ""
-        for paragraph in soup.find_all('p'):
-            if not any(parent.name in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6'] for parent in paragraph.parents):
-                paragraph_text = paragraph.get_text().strip()
-                if paragraph_text and len(paragraph_text) > 20:  # Skip very short paragraphs
-                    additional_content += paragraph_text + "\n\n"
-        
-        # Add additional content if there is any
-        if additional_content:
-            content += "## Additional Content\n\n" + additional_content
-            debug_log("Added additional content")
-        
-        # Clean up content
-        content = re.sub(r'\n{3,}', '\n\n', content)  # Replace multiple newlines
-        
-        debug_log(f"Website processing complete: {len(content)} characters extracted")
-        return content.strip()
-    except Exception as e:
-        debug_log(f"ERROR processing website: {str(e)}")
-        return f"Error processing website {url}: {str(e)}"
+    pages = process_websites([url])
+    if not pages:
+        return f"Error processing website {url}: empty URL"
+    return pages[0][1]
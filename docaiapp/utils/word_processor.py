@@ -1,11 +1,10 @@
 import io
-import os
-from dotenv import load_dotenv
+import docx
 from werkzeug.datastructures import FileStorage
+from docaiapp.utils.config import DEBUG
 
-# Load environment variables and set up debug functionality
-load_dotenv()
-DEBUG = os.getenv("DEBUG", "False").lower() in ["true", "1", "t", "yes", "y"]
+# Bump when the extracted output changes so cached extractions are not reused
+PROCESSOR_VERSION = "1"
 
 def debug_log(message):
     if DEBUG:
@@ -24,16 +23,6 @@ def process_word(file_obj):
     debug_log(f"Processing Word file: {getattr(file_obj, 'filename', 'Unnamed Document')}")
     
     try:
-        # Import docx package here to avoid dependency issues if not installed
-        try:
-            import docx
-        except ImportError:
-            debug_log("python-docx package not installed. Installing...")
-            import subprocess
-            subprocess.check_call(["pip", "install", "python-docx"])
-            import docx
-            debug_log("python-docx package installed successfully")
-        
         # Get the file content
         if isinstance(file_obj, FileStorage):
             docx_bytes = file_obj.read()
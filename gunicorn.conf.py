@@ -0,0 +1,52 @@
+"""
+Gunicorn settings, read automatically when gunicorn is started from this
+directory (see startup.sh). Bind address and timeout are passed on the
+command line.
+
+Every worker is a separate process, so the Prometheus metrics are written
+to PROMETHEUS_MULTIPROC_DIR and aggregated by /metrics (see
+docaiapp/utils/metrics.py).
+
+With GUNICORN_PRELOAD the master imports the app and its heavy
+dependencies (app.warm_up()) once before forking, so new workers start warm
+and share those pages instead of each importing them. Per-process state
+(Azure clients, thread pools, stores) is created after the fork.
+"""
+
+import glob
+import os
+import tempfile
+
+from docaiapp.utils.config import env_bool
+
+# Must be set before the workers import prometheus_client
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "docbot-metrics"))
+# With preload_app the master imports the app (and creates its metric files) before on_starting
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+# Imported up front: child_exit runs in a signal handler, where an import
+# can interrupt another one half-way
+try:
+    from prometheus_client import multiprocess
+except ImportError:
+    multiprocess = None
+
+preload_app = env_bool("GUNICORN_PRELOAD", False)
+
+
+def on_starting(server):
+    # Values left over from the previous run would make counters jump instead of reset
+    directory = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    for path in glob.glob(os.path.join(directory, "*.db")):
+        if not path.endswith(f"_{os.getpid()}.db"):
+            os.unlink(path)
+
+def when_ready(server):
+    if preload_app:
+        import app
+        app.warm_up()
+        server.log.info("Preloaded the app and its dependencies")
+
+def child_exit(server, worker):
+    if multiprocess is not None:
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,10 @@
+"""
+Offline load testing.
+
+    python -m loadtest.fake_azure --port 8081
+    python -m loadtest.loadgen --target http://127.0.0.1:5000 --concurrency 20 --duration 120
+
+fake_azure stands in for Azure OpenAI and Document Intelligence with
+configurable latency, token rates and throttling; loadgen drives upload and
+chat sessions against the app and reports latency percentiles.
+"""
@@ -0,0 +1,404 @@
+"""
+Local stand-in for Azure OpenAI and Azure AI Document Intelligence.
+
+Implements the endpoints the app calls, so load tests do not spend Azure
+quota:
+
+    POST /openai/deployments/<deployment>/chat/completions   (plain and stream=true)
+    POST /openai/deployments/<deployment>/embeddings
+    POST /documentintelligence/documentModels/<model>:analyze
+    GET  /documentintelligence/documentModels/<model>/analyzeResults/<id>
+    GET  /stats                                                (request counters)
+
+Latencies are drawn from configurable distributions, streamed answers are
+paced at a token rate, and requests can be throttled with 429 responses,
+either at random or above a requests-per-minute limit. Point the app at it
+with:
+
+    AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8081
+    AZURE_DOCUMENT_INTELLIGENCE_ENDPOINT=http://127.0.0.1:8081
+
+Distributions are written as fixed:SECONDS, uniform:LOW,HIGH or
+lognormal:MEDIAN,SIGMA.
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+WORDS = (
+    "the policy covers annual leave dental vision benefits for employees after the probation period "
+    "revenue grew in the third quarter across every region while costs stayed within the approved budget "
+    "the contract renewal is due next month and the vendor agreed to the revised payment schedule"
+).split()
+
+CHAT_PATTERN = re.compile(r"^/openai/deployments/([^/]+)/chat/completions$")
+EMBEDDINGS_PATTERN = re.compile(r"^/openai/deployments/([^/]+)/embeddings$")
+ANALYZE_PATTERN = re.compile(r"^/(?:documentintelligence|formrecognizer)/documentModels/([^/:]+):analyze$")
+RESULT_PATTERN = re.compile(r"^/(?:documentintelligence|formrecognizer)/documentModels/([^/]+)/analyzeResults/([^/]+)$")
+PDF_PAGE_PATTERN = re.compile(rb"/Type\s*/Page(?!s)")
+
+# Finished analyze results are dropped after this many seconds
+RESULT_RETENTION = 600
+
+
+def parse_distribution(spec):
+    """
+    Parse a latency distribution.
+
+    Args:
+        spec (str): fixed:SECONDS, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA
+
+    Returns:
+        callable: Function of a random.Random returning a non-negative sample
+    """
+    kind, _, values = spec.partition(":")
+    try:
+        numbers = [float(value) for value in values.split(",") if value]
+        if kind == "fixed" and len(numbers) == 1:
+            return lambda rng: numbers[0]
+        if kind == "uniform" and len(numbers) == 2:
+            return lambda rng: rng.uniform(numbers[0], numbers[1])
+        if kind == "lognormal" and len(numbers) == 2:
+            return lambda rng: rng.lognormvariate(math.log(numbers[0]), numbers[1]) if numbers[0] > 0 else 0.0
+    except ValueError:
+        pass
+    raise argparse.ArgumentTypeError(f"invalid distribution {spec!r}; use fixed:S, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA")
+
+
+class Throttle:
+    """
+    Decides which requests get a 429: a random share, plus every request
+    above the requests-per-minute limit of a service (sliding window).
+    """
+
+    def __init__(self, rate, max_rpm, seed=None):
+        self.rate = rate
+        self.max_rpm = max_rpm
+        self._rng = random.Random(seed)
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def check(self, service):
+        """Return True if a request to a service should be throttled."""
+        now = time.monotonic()
+        with self._lock:
+            if self.rate and self._rng.random() < self.rate:
+                return True
+            if not self.max_rpm:
+                return False
+            window = self._windows.setdefault(service, deque())
+            while window and now - window[0] > 60:
+                window.popleft()
+            if len(window) >= self.max_rpm:
+                return True
+            window.append(now)
+            return False
+
+
+class FakeAzure:
+    """
+    Behaviour and counters shared by all request handler threads.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.chat_latency = parse_distribution(args.chat_latency)
+        self.completion_tokens = parse_distribution(args.completion_tokens)
+        self.embedding_latency = parse_distribution(args.embedding_latency)
+        self.analyze_latency = parse_distribution(args.analyze_latency)
+        self.analyze_page_latency = parse_distribution(args.analyze_page_latency)
+        self.throttle = Throttle(args.throttle_rate, args.max_rpm, args.seed)
+        self.counters = Counter()
+        self.jobs = {}
+        self._rng = random.Random(args.seed)
+        self._lock = threading.Lock()
+
+    def sample(self, distribution):
+        with self._lock:
+            return max(0.0, distribution(self._rng))
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def add_job(self, model, pages):
+        """Register an analyze job and return its ID."""
+        ready = time.monotonic() + self.sample(self.analyze_latency) + sum(
+            self.sample(self.analyze_page_latency) for _ in range(pages))
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            now = time.monotonic()
+            for stale in [key for key, job in self.jobs.items() if now - job["ready"] > RESULT_RETENTION]:
+                del self.jobs[stale]
+            self.jobs[job_id] = {"model": model, "pages": pages, "ready": ready}
+        return job_id
+
+    def get_job(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+
+def _answer_text(tokens, seed):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(tokens))
+
+def _page_markdown(number, seed):
+    rng = random.Random(f"{seed}:{number}")
+    sentences = [" ".join(rng.choice(WORDS) for _ in range(16)).capitalize() + "." for _ in range(8)]
+    return f"## Section {number}\n\n" + " ".join(sentences)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    fake = None
+
+    def log_message(self, format, *args):
+        if self.fake.args.verbose:
+            super().log_message(format, *args)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _throttled(self, service):
+        if not self.fake.throttle.check(service):
+            return False
+        self.fake.count(f"{service}_429")
+        retry_after = self.fake.args.retry_after
+        self._send_json(429, {"error": {
+            "code": "429",
+            "message": f"Requests to the {service} operation have exceeded the rate limit. "
+                       f"Please retry after {retry_after} seconds.",
+        }}, {"Retry-After": str(retry_after), "retry-after-ms": str(retry_after * 1000)})
+        return True
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self._read_body()
+        match = CHAT_PATTERN.match(path)
+        if match:
+            return self._chat(match.group(1), body)
+        match = EMBEDDINGS_PATTERN.match(path)
+        if match:
+            return self._embeddings(match.group(1), body)
+        match = ANALYZE_PATTERN.match(path)
+        if match:
+            return self._analyze(match.group(1), body)
+        self._send_json(404, {"error": {"code": "NotFound", "message": f"Unknown path {path}"}})
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        match = RESULT_PATTERN.match(path)
+        if match:
+            return self._analyze_result(match.group(1), match.group(2))
+        if path == "/stats":
+            with self.fake._lock:
+                counters = dict(self.fake.counters)
+            return self._send_json(200, counters)
+        self._send_json(404, {"error": {"code": "NotFound", "message": f"Unknown path {path}"}})
+
+    def _chat(self, deployment, body):
+        self.fake.count("chat_requests")
+        if self._throttled("chat"):
+            return
+        request = json.loads(body or b"{}")
+        prompt_tokens = sum(len(str(message.get("content") or "")) for message in request.get("messages", [])) // 4
+        tokens = max(1, int(self.fake.sample(self.fake.completion_tokens)))
+        tokens = min(tokens, request.get("max_tokens") or tokens)
+        words = _answer_text(tokens, body).split(" ")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        time.sleep(self.fake.sample(self.fake.chat_latency))
+        if not request.get("stream"):
+            time.sleep(tokens / self.fake.args.token_rate)
+            self.fake.count("chat_completions")
+            return self._send_json(200, {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": deployment,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": " ".join(words)}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": tokens,
+                          "total_tokens": prompt_tokens + tokens},
+            })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def event(payload):
+            data = f"data: {payload if isinstance(payload, str) else json.dumps(payload)}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def chunk(delta, finish_reason=None):
+            return {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": deployment,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+        try:
+            # Azure sends the prompt filter results first, in a chunk without choices
+            event({"id": "", "object": "", "created": 0, "model": "", "choices": [],
+                   "prompt_filter_results": [{"prompt_index": 0, "content_filter_results": {}}]})
+            event(chunk({"role": "assistant", "content": ""}))
+            interval = 1.0 / self.fake.args.token_rate
+            started = time.monotonic()
+            for position, word in enumerate(words):
+                # Pace against the start time so slow writes do not lower the token rate
+                delay = started + position * interval - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                event(chunk({"content": word if position == 0 else f" {word}"}))
+            event(chunk({}, "stop"))
+            event("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+            self.fake.count("chat_streams")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client closed the stream, e.g. because the browser disconnected
+            self.fake.count("chat_streams_cancelled")
+            self.close_connection = True
+
+    def _embeddings(self, deployment, body):
+        self.fake.count("embedding_requests")
+        if self._throttled("embeddings"):
+            return
+        request = json.loads(body or b"{}")
+        inputs = request.get("input") or []
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        time.sleep(self.fake.sample(self.fake.embedding_latency))
+
+        dimensions = self.fake.args.embedding_dimensions
+        data = []
+        for position, text in enumerate(inputs):
+            rng = random.Random(hashlib.sha256(str(text).encode("utf-8")).digest())
+            vector = [rng.gauss(0, 1) for _ in range(dimensions)]
+            norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+            data.append({"object": "embedding", "index": position, "embedding": [value / norm for value in vector]})
+        tokens = sum(len(str(text)) for text in inputs) // 4
+        self._send_json(200, {"object": "list", "model": deployment, "data": data,
+                              "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+
+    def _analyze(self, model, body):
+        self.fake.count("analyze_requests")
+        if self._throttled("analyze"):
+            return
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            body = base64.b64decode(json.loads(body or b"{}").get("base64Source") or b"")
+        pages = len(PDF_PAGE_PATTERN.findall(body)) if body.startswith(b"%PDF") else 1
+        job_id = self.fake.add_job(model, max(1, pages))
+
+        host = self.headers.get("Host") or f"127.0.0.1:{self.server.server_port}"
+        prefix = urlparse(self.path).path.split("/documentModels/")[0]
+        location = (f"http://{host}{prefix}/documentModels/{model}/analyzeResults/{job_id}"
+                    f"?api-version={self.fake.args.di_api_version}")
+        self.send_response(202)
+        self.send_header("Operation-Location", location)
+        self.send_header("apim-request-id", job_id)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _analyze_result(self, model, job_id):
+        self.fake.count("analyze_polls")
+        job = self.fake.get_job(job_id)
+        if job is None:
+            return self._send_json(404, {"error": {"code": "NotFound", "message": "Analyze result not found"}})
+
+        created = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        if time.monotonic() < job["ready"]:
+            return self._send_json(200, {"status": "running", "createdDateTime": created, "lastUpdatedDateTime": created})
+
+        content = "\n\n".join(_page_markdown(number, job_id) for number in range(1, job["pages"] + 1))
+        self.fake.count("analyze_results")
+        self._send_json(200, {
+            "status": "succeeded",
+            "createdDateTime": created,
+            "lastUpdatedDateTime": created,
+            "analyzeResult": {
+                "apiVersion": self.fake.args.di_api_version,
+                "modelId": model,
+                "stringIndexType": "textElements",
+                "contentFormat": "markdown",
+                "content": content,
+                "pages": [{"pageNumber": number, "width": 8.5, "height": 11, "unit": "inch", "spans": []}
+                          for number in range(1, job["pages"] + 1)],
+            },
+        })
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Local stand-in for Azure OpenAI and Document Intelligence.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--chat-latency", default="lognormal:0.4,0.5",
+                        help="Time to the first token (default: lognormal:0.4,0.5)")
+    parser.add_argument("--token-rate", type=float, default=60.0, help="Streamed tokens per second (default: 60)")
+    parser.add_argument("--completion-tokens", default="uniform:80,400",
+                        help="Answer length in tokens, capped at max_tokens (default: uniform:80,400)")
+    parser.add_argument("--embedding-latency", default="lognormal:0.05,0.3",
+                        help="Latency of an embeddings request (default: lognormal:0.05,0.3)")
+    parser.add_argument("--embedding-dimensions", type=int, default=256)
+    parser.add_argument("--analyze-latency", default="lognormal:1.5,0.4",
+                        help="Fixed part of an analyze job's duration (default: lognormal:1.5,0.4)")
+    parser.add_argument("--analyze-page-latency", default="lognormal:0.15,0.3",
+                        help="Added duration per analyzed page (default: lognormal:0.15,0.3)")
+    parser.add_argument("--throttle-rate", type=float, default=0.0,
+                        help="Share of requests answered with 429 at random (default: 0)")
+    parser.add_argument("--max-rpm", type=int, default=0,
+                        help="Requests per minute per service before 429s are returned; 0 for no limit (default: 0)")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds of a 429 (default: 1)")
+    parser.add_argument("--di-api-version", default="2024-11-30")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible runs")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    return parser
+
+def start_server(args, port=None):
+    """
+    Start the fake server on a background thread (e.g. from a test or the load generator).
+
+    Args:
+        args (argparse.Namespace): Options from build_parser()
+        port (int): Port to listen on (defaults to args.port; 0 picks a free port)
+
+    Returns:
+        ThreadingHTTPServer: The running server; call shutdown() to stop it
+    """
+    handler = type("FakeAzureHandler", (Handler,), {"fake": FakeAzure(args)})
+    server = ThreadingHTTPServer((args.host, args.port if port is None else port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.token_rate <= 0:
+        raise SystemExit("--token-rate must be positive")
+    server = start_server(args)
+    print(f"Fake Azure listening on http://{args.host}:{server.server_port}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
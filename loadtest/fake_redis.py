@@ -0,0 +1,288 @@
+"""
+Local stand-in for a Redis server, for the redis session and response cache
+backends.
+
+Speaks enough of the Redis protocol (RESP) for the commands the app sends
+through redis-py:
+
+    PING, ECHO, SELECT, CLIENT, AUTH, GET, SET (EX/PX/NX/XX), DEL, EXISTS,
+    EXPIRE, PEXPIRE, TTL, PTTL, DBSIZE, FLUSHDB, FLUSHALL, and WATCH, MULTI,
+    EXEC, DISCARD and UNWATCH for optimistic transactions
+
+Keys live in memory and expire lazily. Run several app instances (or
+gunicorn masters on different ports) against one fake server to check that
+sessions survive requests going to any instance:
+
+    python -m loadtest.fake_redis --port 6390
+    SESSION_BACKEND=redis SESSION_REDIS_URL=redis://127.0.0.1:6390/0 gunicorn -w 4 app:app
+"""
+
+import argparse
+import socketserver
+import threading
+import time
+from collections import defaultdict
+
+
+class FakeRedis:
+    """
+    In-memory databases with per-key expiry. Every write bumps the key's
+    version, which is what WATCH compares.
+    """
+
+    def __init__(self):
+        self._databases = defaultdict(dict)
+        self._versions = defaultdict(int)
+        self._lock = threading.RLock()
+        self.commands = 0
+
+    def version(self, db, key):
+        """Return the version of a key (changed by every write to it)."""
+        with self._lock:
+            self._get(db, key)
+            return self._versions[(db, key)]
+
+    def execute_transaction(self, db, watched, queued):
+        """
+        Run queued commands atomically unless a watched key changed.
+
+        Args:
+            db (int): Database index
+            watched (dict): (db, key) -> version when it was watched
+            queued (list): (command, args) pairs
+
+        Returns:
+            list: The replies, or None if the transaction was aborted
+        """
+        with self._lock:
+            if any(self.version(*key) != version for key, version in watched.items()):
+                return None
+            return [self.execute(db, command, args) for command, args in queued]
+
+    def _get(self, db, key):
+        entry = self._databases[db].get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            del self._databases[db][key]
+            self._versions[(db, key)] += 1
+            return None
+        return entry
+
+    def _changed(self, db, keys):
+        for key in keys:
+            self._versions[(db, key)] += 1
+
+    def execute(self, db, command, args):
+        """
+        Run one command.
+
+        Returns:
+            Reply: bytes, int, None (nil), a list, or an Error
+        """
+        with self._lock:
+            self.commands += 1
+            store = self._databases[db]
+            if command == "GET":
+                entry = self._get(db, args[0])
+                return entry[0] if entry else None
+            if command == "SET":
+                return self._set(db, args)
+            if command == "DEL":
+                self._changed(db, args)
+                return sum(1 for key in args if self._get(db, key) is not None and store.pop(key))
+            if command == "EXISTS":
+                return sum(1 for key in args if self._get(db, key) is not None)
+            if command in ("EXPIRE", "PEXPIRE"):
+                entry = self._get(db, args[0])
+                if entry is None:
+                    return 0
+                scale = 1 if command == "EXPIRE" else 1000
+                store[args[0]] = (entry[0], time.time() + int(args[1]) / scale)
+                self._changed(db, args[:1])
+                return 1
+            if command in ("TTL", "PTTL"):
+                entry = self._get(db, args[0])
+                if entry is None:
+                    return -2
+                if entry[1] is None:
+                    return -1
+                scale = 1 if command == "TTL" else 1000
+                return int((entry[1] - time.time()) * scale)
+            if command == "DBSIZE":
+                return sum(1 for key in list(store) if self._get(db, key) is not None)
+            if command == "FLUSHDB":
+                self._changed(db, list(store))
+                store.clear()
+                return "OK"
+            if command == "FLUSHALL":
+                for number, keys in self._databases.items():
+                    self._changed(number, list(keys))
+                self._databases.clear()
+                return "OK"
+        return Error(f"ERR unknown command '{command}'")
+
+    def _set(self, db, args):
+        key, value = args[0], args[1]
+        expires_at = None
+        condition = None
+        options = [arg.decode().upper() for arg in args[2:]]
+        index = 0
+        while index < len(options):
+            option = options[index]
+            if option in ("EX", "PX"):
+                index += 1
+                expires_at = time.time() + int(options[index]) / (1 if option == "EX" else 1000)
+            elif option in ("NX", "XX"):
+                condition = option
+            else:
+                return Error("ERR syntax error")
+            index += 1
+        exists = self._get(db, key) is not None
+        if (condition == "NX" and exists) or (condition == "XX" and not exists):
+            return None
+        self._databases[db][key] = (value, expires_at)
+        self._changed(db, [key])
+        return "OK"
+
+
+class Error(str):
+    """Error reply."""
+
+
+class NilArray:
+    """Reply of an aborted transaction."""
+
+
+def encode(reply):
+    """Encode a reply in RESP."""
+    if isinstance(reply, Error):
+        return f"-{reply}\r\n".encode()
+    if isinstance(reply, str):
+        return f"+{reply}\r\n".encode()
+    if isinstance(reply, bool) or isinstance(reply, int):
+        return f":{int(reply)}\r\n".encode()
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, NilArray):
+        return b"*-1\r\n"
+    if isinstance(reply, list):
+        return f"*{len(reply)}\r\n".encode() + b"".join(encode(item) for item in reply)
+    return f"${len(reply)}\r\n".encode() + reply + b"\r\n"
+
+
+class Handler(socketserver.StreamRequestHandler):
+    fake = None
+
+    def read_command(self):
+        """Read one command (an array of bulk strings, or an inline command)."""
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        db = 0
+        # Keys watched by this connection and the commands queued after MULTI
+        watched = {}
+        queued = None
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            if not args:
+                continue
+            command, args = args[0].decode().upper(), args[1:]
+            if command == "PING":
+                reply = args[0] if args else "PONG"
+            elif command == "ECHO":
+                reply = args[0]
+            elif command == "SELECT":
+                db = int(args[0])
+                reply = "OK"
+            elif command in ("CLIENT", "AUTH"):
+                reply = "OK"
+            elif command == "QUIT":
+                self.wfile.write(encode("OK"))
+                return
+            elif command == "WATCH":
+                if queued is not None:
+                    reply = Error("ERR WATCH inside MULTI is not allowed")
+                else:
+                    watched.update(((db, key), self.fake.version(db, key)) for key in args)
+                    reply = "OK"
+            elif command == "UNWATCH":
+                watched.clear()
+                reply = "OK"
+            elif command == "MULTI":
+                reply = Error("ERR MULTI calls can not be nested") if queued is not None else "OK"
+                queued = [] if queued is None else queued
+            elif command == "DISCARD":
+                reply = "OK" if queued is not None else Error("ERR DISCARD without MULTI")
+                watched.clear()
+                queued = None
+            elif command == "EXEC":
+                if queued is None:
+                    reply = Error("ERR EXEC without MULTI")
+                else:
+                    try:
+                        reply = self.fake.execute_transaction(db, watched, queued)
+                    except (IndexError, ValueError):
+                        reply = Error("ERR wrong arguments in transaction")
+                    reply = NilArray() if reply is None else reply
+                watched.clear()
+                queued = None
+            elif queued is not None:
+                queued.append((command, args))
+                reply = "QUEUED"
+            else:
+                try:
+                    reply = self.fake.execute(db, command, args)
+                except (IndexError, ValueError):
+                    reply = Error(f"ERR wrong arguments for '{command}' command")
+            self.wfile.write(encode(reply))
+
+
+class Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start_server(host="127.0.0.1", port=6390):
+    """
+    Start the fake server on a background thread (e.g. from a test or a load test script).
+
+    Args:
+        host (str): Address to listen on
+        port (int): Port to listen on (0 picks a free port)
+
+    Returns:
+        Server: The running server; call shutdown() to stop it
+    """
+    handler = type("FakeRedisHandler", (Handler,), {"fake": FakeRedis()})
+    server = Server((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for a Redis server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args(argv)
+    server = start_server(args.host, args.port)
+    print(f"Fake Redis listening on redis://{args.host}:{server.server_address[1]}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
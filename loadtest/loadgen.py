@@ -0,0 +1,333 @@
+"""
+Drive realistic upload and chat sessions against a running app.
+
+Every virtual user repeatedly plays one session with a fresh cookie jar:
+upload a set of documents, wait for the upload job to finish, ask a few
+questions with think time in between, and clear the session. Latencies are
+reported per operation as p50/p95/p99 along with the throughput.
+
+    python -m loadtest.loadgen --target http://127.0.0.1:5000 --concurrency 20 --duration 120
+    python -m loadtest.loadgen --sessions 50 --no-stream --files report.pdf data.csv --output load.json
+
+Without --files a small synthetic PDF, CSV and Word document are generated
+for every upload. --target takes several comma-separated URLs to spread
+the requests of every session over app instances at random, like a load
+balancer without sticky sessions. Run the app against loadtest.fake_azure so the numbers
+measure the app, not the Azure quota.
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+from benchmarks import corpus
+from loadtest.fake_azure import parse_distribution
+
+QUESTIONS = [
+    "What is this document about?",
+    "Summarize the main points in three bullets.",
+    "What does the policy say about annual leave?",
+    "Which region had the highest revenue?",
+    "List the dates mentioned in the documents.",
+    "What are the payment terms of the contract?",
+    "How many rows does the table have?",
+    "Who is responsible for the renewal?",
+]
+UPLOAD_POLL_INTERVAL = 0.25
+UPLOAD_TIMEOUT = 600
+REQUEST_TIMEOUT = 300
+
+
+def percentile(values, share):
+    """Nearest-rank percentile of a list of numbers (share between 0 and 1)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(share * len(ordered)) - 1)]
+
+
+class Recorder:
+    """
+    Thread-safe collection of operation latencies and errors.
+    """
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.error_samples = []
+        self.sessions = 0
+        self._lock = threading.Lock()
+
+    def record(self, operation, seconds):
+        with self._lock:
+            self.latencies[operation].append(seconds)
+
+    def error(self, operation, message):
+        with self._lock:
+            self.errors[operation] += 1
+            if len(self.error_samples) < 20:
+                self.error_samples.append(f"{operation}: {message}")
+
+    def session_done(self):
+        with self._lock:
+            self.sessions += 1
+
+    def report(self, elapsed):
+        """
+        Summarize the recorded operations.
+
+        Args:
+            elapsed (float): Wall-clock duration of the run in seconds
+
+        Returns:
+            dict: Per-operation statistics and overall throughput
+        """
+        with self._lock:
+            operations = {}
+            for operation in sorted(set(self.latencies) | set(self.errors)):
+                values = self.latencies[operation]
+                operations[operation] = {
+                    "count": len(values),
+                    "errors": self.errors[operation],
+                    "p50": _round(percentile(values, 0.50)),
+                    "p95": _round(percentile(values, 0.95)),
+                    "p99": _round(percentile(values, 0.99)),
+                    "mean": _round(statistics.mean(values) if values else None),
+                    "max": _round(max(values) if values else None),
+                    "per_s": round(len(values) / elapsed, 3) if elapsed else None,
+                }
+            return {
+                "elapsed": round(elapsed, 2),
+                "sessions": self.sessions,
+                "sessions_per_s": round(self.sessions / elapsed, 3) if elapsed else None,
+                "operations": operations,
+                "error_samples": list(self.error_samples),
+            }
+
+def _round(value):
+    return None if value is None else round(value, 4)
+
+
+def synthetic_files(seed):
+    """A small mixed upload, different per session so content-addressed caches do not hide the work."""
+    return [
+        ("report.pdf", corpus.make_pdf(8, seed=seed)),
+        ("data.csv", corpus.make_csv(500, 8, seed=seed)),
+        ("handbook.docx", corpus.make_docx(6, seed=seed)),
+    ]
+
+def load_files(paths):
+    files = []
+    for path in paths:
+        with open(path, "rb") as f:
+            files.append((os.path.basename(path), f.read()))
+    return files
+
+
+class VirtualUser(threading.Thread):
+    """
+    Plays sessions until the run is over.
+    """
+
+    def __init__(self, number, args, recorder, files, stop, claim_session):
+        super().__init__(name=f"user-{number}", daemon=True)
+        self.args = args
+        self.recorder = recorder
+        self.files = files
+        self.stop = stop
+        self.claim_session = claim_session
+        self.rng = random.Random(None if args.seed is None else args.seed + number)
+        self.think_time = parse_distribution(args.think_time)
+        self.targets = [target.strip().rstrip("/") for target in args.target.split(",") if target.strip()]
+
+    def target(self):
+        """Base URL for the next request."""
+        return self.rng.choice(self.targets)
+
+    def run(self):
+        while not self.stop.is_set():
+            session_number = self.claim_session()
+            if session_number is None:
+                return
+            with requests.Session() as http:
+                try:
+                    if self.play(http, session_number):
+                        self.recorder.session_done()
+                except requests.RequestException as e:
+                    self.recorder.error("session", str(e))
+
+    def timed(self, operation, send):
+        """Run a request, record its latency and return the response (None on failure)."""
+        started = time.perf_counter()
+        try:
+            response = send()
+        except requests.RequestException as e:
+            self.recorder.error(operation, str(e))
+            return None
+        if response.status_code >= 400:
+            self.recorder.error(operation, f"HTTP {response.status_code}: {response.text[:200]}")
+            return None
+        self.recorder.record(operation, time.perf_counter() - started)
+        return response
+
+    def play(self, http, session_number):
+        files = self.files or synthetic_files(session_number + 1)
+
+        # Upload, then poll until every item is processed; the latency is the time to "done"
+        started = time.perf_counter()
+        response = self.timed("upload_submit", lambda: http.post(
+            f"{self.target()}/api/upload",
+            files=[("files", (name, data)) for name, data in files],
+            timeout=REQUEST_TIMEOUT
+        ))
+        if response is None:
+            return False
+        job_id = response.json()["job_id"]
+        deadline = time.monotonic() + UPLOAD_TIMEOUT
+        while True:
+            job = http.get(f"{self.target()}/api/upload/{job_id}", timeout=REQUEST_TIMEOUT).json()
+            if job.get("status") not in ("queued", "running"):
+                break
+            if time.monotonic() > deadline:
+                self.recorder.error("upload", f"job {job_id} did not finish")
+                return False
+            time.sleep(UPLOAD_POLL_INTERVAL)
+        if job.get("status") != "done" or any(item.get("status") == "error" for item in job.get("items", [])):
+            self.recorder.error("upload", f"job {job_id} ended as {job.get('status')}: {job.get('items')}")
+            return False
+        self.recorder.record("upload", time.perf_counter() - started)
+
+        for _ in range(self.args.questions):
+            if self.stop.is_set():
+                return False
+            time.sleep(max(0.0, self.think_time(self.rng)))
+            query = self.rng.choice(QUESTIONS)
+            if self.args.stream:
+                if not self.chat_stream(http, query):
+                    return False
+            elif self.timed("chat", lambda: http.post(
+                    f"{self.target()}/api/chat", json={"query": query}, timeout=REQUEST_TIMEOUT)) is None:
+                return False
+
+        # Free the session's index and jobs on the server
+        self.timed("clear", lambda: http.post(f"{self.target()}/api/chat", json={"query": "clear"},
+                                              timeout=REQUEST_TIMEOUT))
+        return True
+
+    def chat_stream(self, http, query):
+        """Ask a question over SSE, recording the time to the first token and to the end."""
+        started = time.perf_counter()
+        first_token = None
+        try:
+            with http.post(f"{self.target()}/api/chat/stream", json={"query": query},
+                           stream=True, timeout=REQUEST_TIMEOUT) as response:
+                if response.status_code >= 400:
+                    self.recorder.error("chat_stream", f"HTTP {response.status_code}: {response.text[:200]}")
+                    return False
+                done = False
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data: "):
+                        continue
+                    event = json.loads(line[len("data: "):])
+                    if event.get("type") == "delta" and first_token is None:
+                        first_token = time.perf_counter() - started
+                    elif event.get("type") == "done":
+                        done = True
+        except requests.RequestException as e:
+            self.recorder.error("chat_stream", str(e))
+            return False
+        if not done:
+            self.recorder.error("chat_stream", "stream ended without a done event")
+            return False
+        self.recorder.record("chat_stream", time.perf_counter() - started)
+        if first_token is not None:
+            self.recorder.record("chat_first_token", first_token)
+        return True
+
+
+def format_report(report):
+    lines = [
+        f"{report['sessions']} sessions in {report['elapsed']}s ({report['sessions_per_s']} sessions/s)",
+        f"{'operation':<18} {'count':>7} {'errors':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'mean':>9} {'per_s':>8}",
+    ]
+    for operation, stats in report["operations"].items():
+        cells = [stats[key] for key in ("p50", "p95", "p99", "mean")]
+        cells = " ".join(f"{'-' if value is None else f'{value:.3f}':>9}" for value in cells)
+        lines.append(f"{operation:<18} {stats['count']:>7} {stats['errors']:>7} {cells} {stats['per_s']:>8}")
+    if report["error_samples"]:
+        lines.append("\nFirst errors:")
+        lines.extend(f"  {sample}" for sample in report["error_samples"])
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive upload and chat sessions against the app.")
+    parser.add_argument("--target", default="http://127.0.0.1:5000",
+                        help="Base URL of the app, or several comma-separated ones")
+    parser.add_argument("--concurrency", type=int, default=10, help="Virtual users running at once (default: 10)")
+    parser.add_argument("--duration", type=float, default=60.0,
+                        help="Seconds to start new sessions for (default: 60; ignored with --sessions)")
+    parser.add_argument("--sessions", type=int, default=0, help="Stop after this many sessions instead of a duration")
+    parser.add_argument("--questions", type=int, default=4, help="Questions per session (default: 4)")
+    parser.add_argument("--stream", action=argparse.BooleanOptionalAction, default=True,
+                        help="Use the streaming chat endpoint (default: on)")
+    parser.add_argument("--think-time", default="uniform:1,3",
+                        help="Pause before each question, as a distribution (default: uniform:1,3)")
+    parser.add_argument("--files", nargs="*", default=[], help="Files to upload in every session (default: synthetic)")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible question order")
+    parser.add_argument("--output", default="", help="Also write the report as JSON to this file")
+    args = parser.parse_args(argv)
+    parse_distribution(args.think_time)
+
+    files = load_files(args.files) if args.files else None
+    recorder = Recorder()
+    stop = threading.Event()
+    claimed = [0]
+    claim_lock = threading.Lock()
+    deadline = None if args.sessions else time.monotonic() + args.duration
+
+    def claim_session():
+        # Returns the next session number, or None once the run is over
+        with claim_lock:
+            if args.sessions and claimed[0] >= args.sessions:
+                return None
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            claimed[0] += 1
+            return claimed[0]
+
+    started = time.perf_counter()
+    users = [VirtualUser(number, args, recorder, files, stop, claim_session) for number in range(args.concurrency)]
+    for user in users:
+        user.start()
+    try:
+        for user in users:
+            # Sessions already running when the duration is over are allowed to finish
+            while user.is_alive():
+                user.join(0.5)
+    except KeyboardInterrupt:
+        stop.set()
+        print("Interrupted, waiting for running requests...", file=sys.stderr)
+        for user in users:
+            user.join()
+    report = recorder.report(time.perf_counter() - started)
+    report["settings"] = {key: value for key, value in vars(args).items() if key != "files"}
+    report["settings"]["files"] = [os.path.basename(path) for path in args.files]
+
+    print(format_report(report))
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(json.dumps(report, indent=2) + "\n")
+        print(f"Report written to {args.output}", file=sys.stderr)
+    return 1 if not report["sessions"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,9 +11,6 @@ if [ ! -f /home/site/.packages_installed ]; then
     pip install -r /home/site/wwwroot/requirements.txt
     pip install gunicorn
 
-    # Ensure session directory exists
-    mkdir -p /home/site/wwwroot/flask_session
-    
     # Create marker file to indicate packages have been installed
     touch /home/site/.packages_installed
     echo "Python dependencies installed."
@@ -29,7 +26,14 @@ ls -la /home/site/wwwroot/app/
 echo "Python version:"
 python --version
 
-# Start the application
-echo "Starting gunicorn server..."
+# Start the application; SERVER_MODE=async serves the chat endpoints from an
+# event loop (asgi.py) so waiting for the model does not block a worker
+SERVER_MODE=${SERVER_MODE:-sync}
 cd /home/site/wwwroot/
-gunicorn --bind=0.0.0.0:8000 --timeout 600 app:app
\ No newline at end of file
+if [ "$SERVER_MODE" = "async" ]; then
+    echo "Starting gunicorn server with uvicorn workers..."
+    gunicorn --bind=0.0.0.0:8000 --timeout 120 -k uvicorn.workers.UvicornWorker asgi:application
+else
+    echo "Starting gunicorn server..."
+    gunicorn --bind=0.0.0.0:8000 --timeout 120 app:app
+fi
\ No newline at end of file